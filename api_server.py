@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Headless HTTP API for the email verification service
+JSON endpoints for sending and verifying codes, for running behind a load balancer
+"""
+
+import argparse
+import hmac
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parseaddr
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs
+
+from metrics import prometheus_text
+from service_log import configure_logging, get_logger
+from settings import get_settings
+
+log = get_logger('api')
+
+MAX_EMAIL_LENGTH = 254
+
+# A bare address with a dot-atom local part, no whitespace, control characters, quoting or display name
+EMAIL_PATTERN = re.compile(
+    r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*"
+    r"@[A-Za-z0-9]([A-Za-z0-9-]*[A-Za-z0-9])?(\.[A-Za-z0-9]([A-Za-z0-9-]*[A-Za-z0-9])?)*"
+)
+MAX_MESSAGE_LENGTH = 2000
+
+
+class ApiError(Exception):
+    """A request the API answers with an error status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    """Routes JSON requests to the service, one keep-alive connection per handler"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'EmailVerificationAPI/1.0'
+    # Headers and body go out in separate writes, Nagle would hold the body back for the client's ACK
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        # Idle keep-alive connections are closed after this many seconds
+        self.timeout = self.server.api.keepalive_timeout
+        super().setup()
+
+    def log_message(self, format, *args):
+        if self.server.api.access_log:
+            log.info(f"{self.address_string()} {format % args}", extra={'event': 'access'})
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        api = self.server.api
+        start = time.perf_counter()
+        path, _, query = self.path.partition('?')
+        self.query = parse_qs(query)
+        route = api.routes.get(path)
+        try:
+            if route is None:
+                raise ApiError(404, "Not found")
+            if route[0] != method:
+                raise ApiError(405, f"Use {route[0]} for {path}")
+            if path != '/health':
+                api.authorize(self.headers.get('Authorization'))
+            body = self._read_json() if method == 'POST' else None
+            status, payload = route[1](self, body)
+        except ApiError as e:
+            status, payload = e.status, {'error': str(e)}
+        except Exception as e:
+            log.exception(f"❌ API error on {path}: {e}", extra={'event': 'api_error', 'error': str(e)})
+            status, payload = 500, {'error': "Internal server error"}
+        self._send(status, payload)
+        api.record(path if route is not None else 'other', status, time.perf_counter() - start)
+
+    def _read_json(self):
+        length = self.headers.get('Content-Length')
+        if length is None:
+            self.close_connection = True
+            raise ApiError(411, "Content-Length is required")
+        try:
+            length = int(length)
+        except ValueError:
+            self.close_connection = True
+            raise ApiError(400, "Invalid Content-Length")
+        if length > self.server.api.max_body:
+            # The body is left unread, so the connection cannot be reused
+            self.close_connection = True
+            raise ApiError(413, "Request body too large")
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            raise ApiError(400, "Request body must be JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "Request body must be a JSON object")
+        return body
+
+    def _send(self, status, payload):
+        # Text payloads are Prometheus exposition, everything else is JSON
+        if isinstance(payload, str):
+            data, content_type = payload.encode(), 'text/plain; version=0.0.4'
+        else:
+            data, content_type = json.dumps(payload).encode(), 'application/json'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def client_source(self):
+        """The requester used for the per-source resend limit"""
+        if self.server.api.trust_proxy:
+            forwarded = self.headers.get('X-Forwarded-For')
+            if forwarded:
+                return forwarded.split(',', 1)[0].strip()
+        return self.client_address[0]
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer handling connections on a fixed pool of worker threads"""
+
+    request_queue_size = 128
+
+    def __init__(self, address, handler, api, workers):
+        self.api = api
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-worker')
+        super().__init__(address, handler)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+
+class ApiServer:
+    """Serves EmailVerificationService over HTTP
+
+    Endpoints:
+        POST /send        {"email", "message"?, "locale"?}
+        POST /send/batch  {"recipients": [email or {"email", "message"?}], "message"?, "locale"?}
+        POST /verify      {"email", "code"}
+        GET  /metrics     request counters and service metrics, ?format=prometheus for stage timings
+        GET  /health
+
+    Connections are kept alive and served by a fixed pool of workers, an
+    idle connection holds its worker until keepalive_timeout. Codes are
+    only returned in responses when expose_codes is set, for testing.
+    """
+
+    def __init__(self, service, host='127.0.0.1', port=8080, workers=16, token=None,
+                 expose_codes=False, trust_proxy=False, max_body=1 << 20, max_batch=1000,
+                 keepalive_timeout=15, access_log=False):
+        self.service = service
+        self.token = token
+        self.expose_codes = expose_codes
+        self.trust_proxy = trust_proxy
+        self.max_body = max_body
+        self.max_batch = max_batch
+        self.keepalive_timeout = keepalive_timeout
+        self.access_log = access_log
+        self.workers = workers
+        self.routes = {
+            '/send': ('POST', self.handle_send),
+            '/send/batch': ('POST', self.handle_batch),
+            '/verify': ('POST', self.handle_verify),
+            '/metrics': ('GET', self.handle_metrics),
+            '/health': ('GET', self.handle_health),
+        }
+        self.httpd = PooledHTTPServer((host, port), ApiRequestHandler, self, workers)
+        self.host, self.port = self.httpd.server_address[:2]
+        self._thread = None
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+        # Counters
+        self.requests = {}
+        self.statuses = {}
+        self.latency_total = 0.0
+
+    def authorize(self, header):
+        if not self.token:
+            return
+        scheme, _, credentials = (header or '').partition(' ')
+        if scheme.lower() != 'bearer' or not hmac.compare_digest(credentials.encode(), self.token.encode()):
+            raise ApiError(401, "A valid bearer token is required")
+
+    def record(self, route, status, elapsed):
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.latency_total += elapsed
+
+    @staticmethod
+    def _email(value, field='email'):
+        """The address, or a 400 for anything that could reach SMTP commands, headers or the journal"""
+        if isinstance(value, str):
+            value = value.strip()
+            if (len(value) <= MAX_EMAIL_LENGTH and EMAIL_PATTERN.fullmatch(value)
+                    and parseaddr(value) == ('', value)):
+                return value
+        raise ApiError(400, f"'{field}' must be an email address")
+
+    @staticmethod
+    def _text(body, field, default=""):
+        value = body.get(field, default)
+        if value is None:
+            return default
+        if not isinstance(value, str) or len(value) > MAX_MESSAGE_LENGTH:
+            raise ApiError(400, f"'{field}' must be a string of at most {MAX_MESSAGE_LENGTH} characters")
+        return value
+
+    def handle_send(self, handler, body):
+        email = self._email(body.get('email'))
+        message = self._text(body, 'message')
+        locale = self._text(body, 'locale', None)
+        service = self.service
+        if not service.allow_send(email, handler.client_source()):
+            raise ApiError(429, "Too many verification emails requested, try again later")
+        success, code = service.deliver_verification_email(email, message, locale)
+        if not success:
+            raise ApiError(502, "The verification email could not be sent")
+        payload = {'success': True, 'email': email}
+        if self.expose_codes:
+            payload['code'] = code
+        return 200, payload
+
+    def handle_batch(self, handler, body):
+        recipients = body.get('recipients')
+        if not isinstance(recipients, list) or not recipients:
+            raise ApiError(400, "'recipients' must be a non-empty list")
+        if len(recipients) > self.max_batch:
+            raise ApiError(413, f"At most {self.max_batch} recipients per batch")
+        message = self._text(body, 'message')
+        entries = []
+        for entry in recipients:
+            if isinstance(entry, dict):
+                # A recipient without its own message gets the batch's
+                entries.append((self._email(entry.get('email')), self._text(entry, 'message', message)))
+            else:
+                entries.append(self._email(entry, 'recipients'))
+        results = self.service.send_verification_batch(
+            entries, message, self._text(body, 'locale', None), handler.client_source()
+        )
+        if not self.expose_codes:
+            results = [{key: value for key, value in result.items() if key != 'code'} for result in results]
+        return 200, {'results': results}
+
+    def handle_verify(self, handler, body):
+        email = self._email(body.get('email'))
+        code = body.get('code')
+        if not isinstance(code, str) or not code or len(code) > 64:
+            raise ApiError(400, "'code' must be a string")
+        valid, message = self.service.verify_code(email, code.strip())
+        return 200, {'valid': valid, 'message': message}
+
+    def handle_metrics(self, handler, body):
+        if handler.query.get('format') == ['prometheus']:
+            return 200, self.prometheus()
+        return 200, self.metrics()
+
+    def handle_health(self, handler, body):
+        return 200, {'status': 'ok'}
+
+    def metrics(self):
+        with self._lock:
+            count = sum(self.requests.values())
+            server = {
+                'uptime': time.time() - self.started_at,
+                'workers': self.workers,
+                'requests': dict(self.requests),
+                'statuses': {str(status): total for status, total in self.statuses.items()},
+                'mean_latency_ms': self.latency_total / count * 1000 if count else 0.0,
+            }
+        return {'server': server, 'service': self.service.metrics()}
+
+    def prometheus(self):
+        """Stage timings and counters in the Prometheus text format, labelled per shard when sharded"""
+        metrics = self.service.metrics()
+        if 'shards' in metrics:
+            sources = [({'shard': name}, shard) for name, shard in metrics['shards'].items()]
+            sources.append(({'shard': 'supervisor'}, metrics))
+        else:
+            sources = [({}, metrics)]
+        snapshots = [(labels, source['instrumentation']) for labels, source in sources]
+        pools = [(labels, source['smtp_pool']) for labels, source in sources if 'smtp_pool' in source]
+        return prometheus_text(snapshots, pools=pools)
+
+    def serve_forever(self):
+        log.info(f"🌐 API listening on http://{self.host}:{self.port} with {self.workers} workers")
+        self.httpd.serve_forever()
+
+    def start_in_thread(self):
+        """Serve on a background thread, for tests and benchmarks"""
+        self._thread = threading.Thread(target=self.serve_forever, name="api-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def main():
+    settings = get_settings()
+    configure_logging(settings=settings)
+    parser = argparse.ArgumentParser(description="Run the email verification HTTP API")
+    parser.add_argument('--host', default=settings.api_host)
+    parser.add_argument('--port', type=int, default=settings.api_port)
+    parser.add_argument('--workers', type=int, default=settings.api_workers)
+    parser.add_argument('--shards', type=int, default=settings.api_shards,
+                        help="worker processes routed by recipient, 0 serves from this process")
+    args = parser.parse_args()
+
+    if args.shards > 0:
+        from shard_supervisor import ShardSupervisor
+        service = ShardSupervisor(args.shards, settings=settings)
+    else:
+        from email_service import EmailVerificationService
+        service = EmailVerificationService(settings)
+    server = ApiServer(
+        service, args.host, args.port, args.workers,
+        token=settings.api_token,
+        expose_codes=settings.api_expose_codes,
+        trust_proxy=settings.api_trust_proxy,
+        max_body=settings.api_max_body,
+        max_batch=settings.api_max_batch,
+        keepalive_timeout=settings.api_keepalive_timeout,
+        access_log=settings.api_access_log
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log.info("👋 Shutting down")
+    finally:
+        server.httpd.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+import asyncio
+import base64
+import smtplib
+import ssl
+
+from email_service import EmailVerificationService
+from metrics import METRICS
+from rate_limit import recipient_domain
+from service_log import get_logger, log_sampled
+
+log = get_logger('async_service')
+
+
+class AsyncSMTPClient:
+    """Minimal asyncio SMTP client speaking EHLO, STARTTLS, AUTH and DATA"""
+
+    def __init__(self, host, port, timeout=30):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self._plain_writer = None
+        self.extensions = {}
+
+    async def _read_reply(self):
+        """Read a possibly multi-line reply, returning (code, message)"""
+        lines = []
+        while True:
+            line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            if not line:
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+            lines.append(line[4:].strip())
+            if line[3:4] != b'-':
+                return int(line[:3]), b'\n'.join(lines)
+
+    async def command(self, line):
+        """Send one command line and return the reply"""
+        if '\r' in line or '\n' in line:
+            # As smtplib does, a line break would smuggle in a second command
+            raise ValueError("SMTP command and arguments must not contain line breaks")
+        self.writer.write(line.encode('ascii') + b'\r\n')
+        await self.writer.drain()
+        return await self._read_reply()
+
+    async def _expect(self, line, *accepted):
+        code, message = await self.command(line)
+        if code not in accepted:
+            raise smtplib.SMTPResponseException(code, message)
+        return code, message
+
+    async def ehlo(self):
+        code, message = await self._expect(f"EHLO {self.local_hostname}", 250)
+        self.extensions = {}
+        for entry in message.decode('latin-1').split('\n')[1:]:
+            name, _, params = entry.partition(' ')
+            self.extensions[name.upper()] = params
+
+    @property
+    def local_hostname(self):
+        return 'localhost'
+
+    async def connect(self, use_tls=True, username=None, password=None):
+        """Open the session, upgrade with STARTTLS and authenticate"""
+        with METRICS.timer('smtp_connect'):
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout)
+            code, message = await self._read_reply()
+            if code != 220:
+                raise smtplib.SMTPConnectError(code, message)
+            await self.ehlo()
+
+        if use_tls:
+            with METRICS.timer('smtp_tls'):
+                await self._expect("STARTTLS", 220)
+                await self._start_tls(ssl.create_default_context())
+                await self.ehlo()
+
+        if username and password:
+            with METRICS.timer('smtp_auth'):
+                await self.login(username, password)
+
+    async def _start_tls(self, context):
+        """Upgrade the open connection to TLS"""
+        if hasattr(self.writer, 'start_tls'):
+            await self.writer.start_tls(context, server_hostname=self.host)
+            return
+        # StreamWriter.start_tls() is new in Python 3.11, older versions upgrade through the loop
+        loop = asyncio.get_running_loop()
+        await self.writer.drain()
+        protocol = self.writer.transport.get_protocol()
+        transport = await loop.start_tls(self.writer.transport, protocol, context, server_hostname=self.host)
+        # The plain writer still owns the socket and would close it when collected
+        self._plain_writer = self.writer
+        self.writer = asyncio.StreamWriter(transport, protocol, self.reader, loop)
+
+    async def login(self, username, password):
+        """Authenticate with AUTH PLAIN, falling back to AUTH LOGIN"""
+        mechanisms = self.extensions.get('AUTH', '').upper().split()
+        try:
+            if 'PLAIN' in mechanisms or 'LOGIN' not in mechanisms:
+                token = base64.b64encode(f"\0{username}\0{password}".encode()).decode('ascii')
+                await self._expect(f"AUTH PLAIN {token}", 235)
+            else:
+                await self._expect("AUTH LOGIN", 334)
+                await self._expect(base64.b64encode(username.encode()).decode('ascii'), 334)
+                await self._expect(base64.b64encode(password.encode()).decode('ascii'), 235)
+        except smtplib.SMTPResponseException as e:
+            raise smtplib.SMTPAuthenticationError(e.smtp_code, e.smtp_error)
+
+    async def sendmail(self, from_addr, to_addrs, message_bytes):
+        """Run one MAIL/RCPT/DATA transaction"""
+        if isinstance(to_addrs, str):
+            to_addrs = [to_addrs]
+        code, message = await self.command(f"MAIL FROM:<{from_addr}>")
+        if code != 250:
+            await self.rset()
+            raise smtplib.SMTPSenderRefused(code, message, from_addr)
+
+        refused = {}
+        for address in to_addrs:
+            code, message = await self.command(f"RCPT TO:<{address}>")
+            if code not in (250, 251):
+                refused[address] = (code, message)
+        if len(refused) == len(to_addrs):
+            await self.rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+        code, message = await self.command("DATA")
+        if code != 354:
+            await self.rset()
+            raise smtplib.SMTPDataError(code, message)
+
+        # Normalise line endings and dot-stuff the payload
+        payload = message_bytes.replace(b'\r\n', b'\n').replace(b'\n', b'\r\n')
+        if payload.startswith(b'.'):
+            payload = b'.' + payload
+        payload = payload.replace(b'\r\n.', b'\r\n..')
+        if not payload.endswith(b'\r\n'):
+            payload += b'\r\n'
+        self.writer.write(payload + b'.\r\n')
+        await self.writer.drain()
+
+        code, message = await self._read_reply()
+        if code != 250:
+            await self.rset()
+            raise smtplib.SMTPDataError(code, message)
+        return refused
+
+    async def noop(self):
+        return await self.command("NOOP")
+
+    async def rset(self):
+        return await self.command("RSET")
+
+    async def quit(self):
+        """Close the session politely, ignoring errors on a dead connection"""
+        try:
+            await self.command("QUIT")
+        except Exception:
+            pass
+        self.close()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self._plain_writer = None
+
+
+class AsyncEmailVerificationService(EmailVerificationService):
+    """Asyncio variant of EmailVerificationService for event-loop based servers
+
+    The coroutines carry an _async suffix, so the inherited synchronous
+    methods keep working for code that treats this as an EmailVerificationService.
+    """
+
+    def __init__(self, max_concurrency=None, settings=None):
+        super().__init__(settings)
+
+        # Maximum number of concurrent SMTP conversations
+        if max_concurrency is None:
+            max_concurrency = self.settings.smtp_max_concurrency
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._semaphore = None
+        self._idle_clients = []
+
+    def _get_semaphore(self):
+        # Created lazily so the service can be built outside the event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    @staticmethod
+    async def _run_blocking(function, *args):
+        # The sqlite and redis stores, the journal and dead letters block on I/O, so they run off the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, function, *args)
+
+    async def _acquire_client(self):
+        """Reuse an idle session when it still answers NOOP"""
+        while self._idle_clients:
+            client = self._idle_clients.pop()
+            try:
+                code, _ = await client.noop()
+                if code == 250:
+                    return client
+            except Exception:
+                pass
+            client.close()
+
+        client = AsyncSMTPClient(self.smtp_server, self.smtp_port)
+        try:
+            await client.connect(self.smtp_use_tls, self.sender_email, self.sender_password)
+        except Exception:
+            client.close()
+            raise
+        return client
+
+    async def send_message_async(self, message):
+        """Send a MIME message over a reused asyncio SMTP session"""
+        await self.send_message_bytes_async(message["To"], message.as_bytes())
+
+    async def send_message_bytes_async(self, recipient_email, message_bytes):
+        """Send pre-encoded message bytes over a reused asyncio SMTP session"""
+        domain = recipient_domain(recipient_email)
+        # Wait for the rate limiter before taking a concurrency slot, so
+        # throttled domains do not hold up the others
+        while True:
+            wait = self.rate_limiter.try_begin(domain, self.sender_email)
+            if not wait:
+                break
+            await asyncio.sleep(wait)
+        try:
+            async with self._get_semaphore():
+                await self._send_bytes(recipient_email, message_bytes)
+        finally:
+            self.rate_limiter.end(domain)
+
+    async def _send_bytes(self, recipient_email, message_bytes):
+        for attempt in range(2):
+            client = await self._acquire_client()
+            try:
+                with METRICS.timer('smtp_data'):
+                    await client.sendmail(self.sender_email, [recipient_email], message_bytes)
+            except smtplib.SMTPServerDisconnected:
+                client.close()
+                if attempt:
+                    raise
+                continue
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                # The transaction was reset, the session is still usable
+                self._idle_clients.append(client)
+                raise
+            except Exception:
+                client.close()
+                raise
+            self._idle_clients.append(client)
+            METRICS.inc('sent')
+            return
+
+    async def send_verification_email_async(self, recipient_email, custom_message="", locale=None, source=None):
+        """Send verification email to the recipient"""
+        if not self.allow_send(recipient_email, source):
+            return False, None
+
+        try:
+            verification_code, expiration_time = await self._run_blocking(self.issue_code, recipient_email)
+        except Exception as e:
+            METRICS.inc('failed')
+            log.error(f"❌ Failed to send email: {e}", extra={'event': 'failed', 'email': recipient_email, 'error': str(e)})
+            return False, None
+
+        try:
+            message_bytes = self.build_message_bytes(recipient_email, verification_code, custom_message, locale)
+            await self.send_message_bytes_async(recipient_email, message_bytes)
+
+            log_sampled(
+                log, "✅ Verification email sent successfully to %s", recipient_email,
+                event='sent', email=recipient_email, code=verification_code, expires_at=expiration_time
+            )
+
+            return True, verification_code
+
+        except Exception as e:
+            log.error(f"❌ Failed to send email: {e}", extra={'event': 'failed', 'email': recipient_email, 'error': str(e)})
+            if await self._run_blocking(self.handle_send_failure, recipient_email, verification_code,
+                                        custom_message, locale, e):
+                return True, verification_code
+            return False, None
+
+    async def send_verification_batch_async(self, recipients, custom_message="", locale=None, source=None):
+        """Send verification emails concurrently, bounded by max_concurrency"""
+        recipients = list(recipients)
+        # Codes for the whole batch, drawn from one entropy read
+        codes = iter(self.generate_verification_codes(len(recipients)))
+
+        async def send_one(entry):
+            if isinstance(entry, str):
+                email, message_text = entry, custom_message
+            else:
+                email, message_text = entry
+            if not self.allow_send(email, source):
+                return {'email': email, 'success': False, 'code': None,
+                        'error': "Too many verification emails requested", 'retrying': False}
+            try:
+                code, _ = await self._run_blocking(self.issue_code, email, next(codes, None))
+            except Exception as e:
+                METRICS.inc('failed')
+                return {'email': email, 'success': False, 'code': None, 'error': str(e), 'retrying': False}
+            try:
+                message_bytes = self.build_message_bytes(email, code, message_text, locale)
+                await self.send_message_bytes_async(email, message_bytes)
+            except Exception as e:
+                return await self._run_blocking(self._batch_failure, email, code, message_text, locale, e)
+            return {'email': email, 'success': True, 'code': code, 'error': None, 'retrying': False}
+
+        results = await asyncio.gather(*(send_one(entry) for entry in recipients))
+        sent = sum(1 for result in results if result['success'] and not result['retrying'])
+        retrying = sum(1 for result in results if result['retrying'])
+        log.info(f"📦 Batch finished: {sent} sent, {retrying} retrying, {len(results) - sent - retrying} failed",
+                 extra={'event': 'batch', 'count': len(results)})
+        return list(results)
+
+    async def verify_code_async(self, email, entered_code):
+        """Verify if the entered code is correct and not expired"""
+        return await self._run_blocking(super().verify_code, email, entered_code)
+
+    async def aclose(self):
+        """Close idle SMTP sessions"""
+        clients, self._idle_clients = self._idle_clients, []
+        await asyncio.gather(*(client.quit() for client in clients))
+        self.close()
@@ -0,0 +1,23 @@
+"""
+Measurement helpers shared by the benchmarks and the load generator
+"""
+
+import os
+import sys
+
+
+def rss_bytes():
+    """Current resident set size"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of samples, 0.0 when there are none"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark: HTTP API throughput and latency against the fake SMTP sink
+Concurrent clients send a code and verify it, with and without keep-alive
+"""
+
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_common import percentile
+from fake_smtp_server import FakeSMTPServer
+
+
+def run_client(host, port, client, requests, keep_alive, latencies, errors):
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+
+    def call(path, payload):
+        nonlocal connection
+        body = json.dumps(payload)
+        start = time.perf_counter()
+        connection.request('POST', path, body, {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        data = json.loads(response.read())
+        latencies[path].append(time.perf_counter() - start)
+        if response.status != 200:
+            errors.append(response.status)
+        if not keep_alive:
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=30)
+        return data
+
+    for index in range(requests):
+        email = f"client{client}-{index}@example{index % 10}.com"
+        sent = call('/send', {'email': email})
+        call('/verify', {'email': email, 'code': sent.get('code', '000000')})
+    connection.close()
+
+
+def measure(host, port, clients, requests, keep_alive):
+    latencies = {'/send': [], '/verify': []}
+    errors = []
+    threads = [
+        threading.Thread(target=run_client, args=(host, port, client, requests, keep_alive, latencies, errors))
+        for client in range(clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200, help="send and verify pairs per client")
+    parser.add_argument('--workers', type=int, default=32)
+    args = parser.parse_args()
+
+    smtp = FakeSMTPServer(keep_messages=False).start_in_thread()
+    os.environ.update(
+        SENDER_EMAIL='bench@example.com', SENDER_PASSWORD='bench',
+        SMTP_SERVER='127.0.0.1', SMTP_PORT=str(smtp.port), SMTP_USE_TLS='false',
+        SMTP_POOL_SIZE=str(args.workers), RESEND_LIMIT_PER_RECIPIENT='0', RESEND_LIMIT_PER_SOURCE='0',
+    )
+
+    from api_server import ApiServer
+    from email_service import EmailVerificationService
+
+    # The service reports every email on stdout, keep it out of the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        service = EmailVerificationService()
+        server = ApiServer(service, port=0, workers=args.workers, expose_codes=True).start_in_thread()
+
+    print(f"📊 {args.clients} clients x {args.requests} send+verify pairs, {args.workers} API workers")
+    print(f"{'mode':>11} {'endpoint':>9} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    try:
+        for keep_alive in (False, True):
+            with contextlib.redirect_stdout(io.StringIO()):
+                latencies, errors, elapsed = measure(server.host, server.port, args.clients, args.requests, keep_alive)
+            mode = 'keep-alive' if keep_alive else 'new-conn'
+            for path, samples in latencies.items():
+                print(f"{mode:>11} {path:>9} {len(samples) / elapsed:>10,.0f} "
+                      f"{percentile(samples, 0.5) * 1000:>9.2f} {percentile(samples, 0.99) * 1000:>9.2f} "
+                      f"{len(errors):>7}")
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            server.stop()
+            service.close()
+        smtp.stop_thread()
+
+
+if __name__ == "__main__":
+    main()
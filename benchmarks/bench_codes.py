@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Benchmark: verification codes generated per second
+Compares the buffered CSPRNG generator with per-call random.choices and secrets
+"""
+
+import argparse
+import os
+import random
+import secrets
+import string
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from code_generator import CodeGenerator
+
+
+def timed(label, count, function):
+    start = time.perf_counter()
+    codes = function()
+    elapsed = time.perf_counter() - start
+    print(f"{label:>28} {count / elapsed:>14,.0f} {elapsed / count * 1e6:>9.2f}")
+    return codes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=200000)
+    parser.add_argument('--length', type=int, default=6)
+    args = parser.parse_args()
+    count, length = args.count, args.length
+    digits = string.digits
+    generator = CodeGenerator(length)
+
+    print(f"{'generator':>28} {'codes/s':>14} {'µs/code':>9}")
+    timed("random.choices (previous)", count,
+          lambda: [''.join(random.choices(digits, k=length)) for _ in range(count)])
+    timed("secrets.choice per digit", count,
+          lambda: [''.join(secrets.choice(digits) for _ in range(length)) for _ in range(count)])
+    timed("CodeGenerator.generate", count, lambda: [generator.generate() for _ in range(count)])
+    codes = timed("CodeGenerator.generate_batch", count, lambda: generator.generate_batch(count))
+
+    # Every digit should turn up equally often in every position
+    worst = 0.0
+    for position in range(length):
+        frequencies = Counter(code[position] for code in codes)
+        expected = count / len(digits)
+        worst = max(worst, max(abs(frequencies[digit] - expected) / expected for digit in digits))
+    print(f"\nLargest per-digit deviation from uniform over {count:,} codes: {worst:.2%}")
+    alphanumeric = CodeGenerator(8, string.ascii_uppercase + string.digits)
+    timed("8 chars of A-Z0-9, batch", count, lambda: alphanumeric.generate_batch(count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmark: expired-code sweep time against table size
+Compares the expiry timing wheel in MemoryCodeStore with a full scan of the table
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from code_store import MemoryCodeStore
+
+
+def full_scan(codes, now):
+    """The previous cleanup: compare every entry"""
+    expired = [email for email, data in codes.items() if now > data.expires_at]
+    for email in expired:
+        del codes[email]
+    return expired
+
+
+def fill(size, now):
+    store = MemoryCodeStore()
+    for index in range(size):
+        store.set(f"user{index}@example.com", "123456", now + random.uniform(1, 600))
+    return store
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return (time.perf_counter() - start) * 1000, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default="10000,100000,1000000")
+    parser.add_argument('--expired-fraction', type=float, default=0.01)
+    args = parser.parse_args()
+
+    print(f"{'codes':>10} {'scan idle':>11} {'wheel idle':>11} {'scan sweep':>11} {'wheel sweep':>11} {'expired':>8}")
+    for size in (int(value) for value in args.sizes.split(',')):
+        now = time.time()
+        store = fill(size, now)
+        scan_copy = dict(store.codes)
+
+        # Nothing has expired yet
+        scan_idle, _ = timed(full_scan, scan_copy, now)
+        wheel_idle, _ = timed(store.pop_expired, now)
+
+        # Move the clock so that a fraction of the codes expired
+        later = now + 1 + 599 * args.expired_fraction
+        scan_sweep, _ = timed(full_scan, scan_copy, later)
+        wheel_sweep, expired = timed(store.pop_expired, later)
+
+        print(f"{size:>10,} {scan_idle:>9.2f}ms {wheel_idle:>9.3f}ms "
+              f"{scan_sweep:>9.2f}ms {wheel_sweep:>9.3f}ms {expired:>8,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark: write overhead of the code journal and startup replay time
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from code_journal import CodeJournal, JournaledCodeStore
+from code_store import MemoryCodeStore
+
+
+def issue_codes(store, count):
+    expires_at = time.time() + 600
+    start = time.perf_counter()
+    for index in range(count):
+        store.set(f"user{index}@example.com", "123456", expires_at)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=200000)
+    parser.add_argument('--always-count', type=int, default=2000,
+                        help="codes issued with fsync=always, which is much slower")
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp(prefix="code-journal-")
+
+    try:
+        print("✍️ Write overhead per issued code")
+        baseline = issue_codes(MemoryCodeStore(), args.count) / args.count
+        print(f"{'no journal':>12} {baseline * 1e6:>8.2f} µs")
+        for policy in ('never', 'batch', 'always'):
+            count = args.always_count if policy == 'always' else args.count
+            path = os.path.join(directory, policy)
+            store = JournaledCodeStore(MemoryCodeStore(), CodeJournal(path, fsync=policy, snapshot_every=10 ** 9))
+            per_code = issue_codes(store, count) / count
+            store.close()
+            print(f"{policy:>12} {per_code * 1e6:>8.2f} µs (+{(per_code - baseline) * 1e6:.2f} µs)")
+
+        print(f"\n♻️ Startup replay of {args.count:,} codes")
+        path = os.path.join(directory, 'batch')
+        journal = CodeJournal(path, snapshot_every=10 ** 9)
+        start = time.perf_counter()
+        restored = journal.replay(MemoryCodeStore())
+        print(f"{'from log':>12} {(time.perf_counter() - start) * 1000:>8.1f} ms ({restored:,} codes)")
+
+        store = MemoryCodeStore()
+        journal.replay(store)
+        journal.snapshot(store.items)
+        start = time.perf_counter()
+        restored = journal.replay(MemoryCodeStore())
+        print(f"{'from snapshot':>12} {(time.perf_counter() - start) * 1000:>8.1f} ms ({restored:,} codes)")
+        journal.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
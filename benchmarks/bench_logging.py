@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cost per log event on the calling thread
+Compares the old three prints per success with a synchronous handler and the queued, sampled logger
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from service_log import LOGGER_NAME, TextFormatter, configure_logging, get_logger, log_sampled
+
+EXPIRES_AT = datetime(2026, 1, 1, 12, 0)
+
+
+class SlowSink:
+    """A stream whose writes block like a terminal or a busy disk"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.stream = open(os.devnull, 'w', encoding='utf-8')
+
+    def write(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def print_success(sink, count):
+    """The three lines send_verification_email used to print per success"""
+    start = time.perf_counter()
+    for index in range(count):
+        email = f"user{index}@example.com"
+        print(f"✅ Verification email sent successfully to {email}", file=sink)
+        print(f"📧 Verification code: {index:06d}", file=sink)
+        print(f"⏰ Code expires at: {EXPIRES_AT.strftime('%Y-%m-%d %H:%M:%S')}", file=sink)
+    return time.perf_counter() - start
+
+
+def log_success(log, count):
+    """The success event as the service now logs it"""
+    start = time.perf_counter()
+    for index in range(count):
+        email = f"user{index}@example.com"
+        log_sampled(log, "✅ Verification email sent successfully to %s", email,
+                    event='sent', email=email, code=f"{index:06d}", expires_at=EXPIRES_AT)
+    return time.perf_counter() - start
+
+
+def synchronous(sink, count):
+    """A plain StreamHandler formatting and writing on the calling thread"""
+    log = logging.getLogger('bench.sync')
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(TextFormatter())
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    try:
+        return log_success(log, count)
+    finally:
+        log.removeHandler(handler)
+
+
+def queued(sink, count, **options):
+    """Caller time for the queued logger, then the time the log thread needs to catch up"""
+    settings = configure_logging(stream=sink, queue_size=count * 2, force=True, **options)
+    elapsed = log_success(get_logger('bench'), count)
+    start = time.perf_counter()
+    settings.stop()
+    drained = time.perf_counter() - start
+    logging.getLogger(LOGGER_NAME).removeHandler(settings.handler)
+    return elapsed, drained, settings.metrics()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=20000)
+    parser.add_argument('--sink-latency', type=float, default=50, help="µs each write to the sink blocks for")
+    args = parser.parse_args()
+
+    sink = SlowSink(args.sink_latency / 1e6)
+    count = args.count
+
+    rows = [('print x3', print_success(sink, count), None, count)]
+    rows.append(('sync handler', synchronous(sink, count), None, count))
+    for label, options in (
+        ('queued text', {'fmt': 'text'}),
+        ('queued json', {'fmt': 'json'}),
+        ('sampled 1%', {'fmt': 'json', 'sample': 0.01}),
+        ('level off', {'level': 'WARNING'}),
+    ):
+        elapsed, drained, metrics = queued(sink, count, **options)
+        written = 0 if label == 'level off' else count - metrics['skipped'] - metrics['dropped']
+        rows.append((label, elapsed, drained, written))
+
+    print(f"📊 {count:,} success events, sink writes block for {args.sink_latency:g} µs")
+    print(f"{'mode':>13} {'ns/event':>9} {'vs print':>9} {'drain ms':>9} {'written':>9}")
+    baseline = rows[0][1]
+    for label, elapsed, drained, written in rows:
+        drain = f"{drained * 1000:,.0f}" if drained is not None else '-'
+        print(f"{label:>13} {elapsed / count * 1e9:>9,.0f} {elapsed / baseline:>8.2f}x {drain:>9} {written:>9,}")
+    sink.stream.close()
+
+
+if __name__ == "__main__":
+    main()
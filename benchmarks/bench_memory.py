@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark: memory used by outstanding verification codes
+Fills each code store layout in a fresh process and reports the RSS growth
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_common import rss_bytes
+
+LAYOUTS = ('emails', 'dict', 'memory', 'columnar')
+
+
+def fill(layout, size):
+    """Build one layout in this process and return the RSS growth"""
+    from code_store import ColumnarCodeStore, MemoryCodeStore
+
+    now = time.time()
+    codes = [f"{random.randrange(10 ** 6):06d}" for _ in range(1000)]
+    before = rss_bytes()
+    emails = (f"user{index}@example.com" for index in range(size))
+
+    if layout == 'emails':
+        # Email strings are shared by every layout, measured separately
+        table = list(emails)
+    elif layout == 'dict':
+        # The original layout: a dict of dicts holding a str and a datetime
+        table = {}
+        expires = datetime.now() + timedelta(minutes=10)
+        for index, email in enumerate(emails):
+            table[email] = {'code': ''.join(codes[index % 1000]), 'expires_at': expires + timedelta(microseconds=index)}
+    else:
+        table = MemoryCodeStore() if layout == 'memory' else ColumnarCodeStore()
+        for index, email in enumerate(emails):
+            table.set(email, ''.join(codes[index % 1000]), now + 600 + index * 1e-6)
+
+    return rss_bytes() - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default="1000000",
+                        help="comma separated code counts, e.g. 1000000,10000000")
+    parser.add_argument('--layout', choices=LAYOUTS, help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.layout:
+        # Child process: measure one layout
+        print(json.dumps({'bytes': fill(args.layout, args.size)}))
+        return
+
+    print(f"{'codes':>12} {'layout':>10} {'MiB':>10} {'bytes/code':>11} {'excl. email':>12}")
+    for size in (int(value) for value in args.sizes.split(',')):
+        email_bytes = None
+        for layout in LAYOUTS:
+            output = subprocess.run(
+                [sys.executable, __file__, '--layout', layout, '--size', str(size)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            used = json.loads(output)['bytes']
+            if layout == 'emails':
+                # The list itself adds 8 bytes per entry on top of the strings
+                email_bytes = used - 8 * size
+                continue
+            print(f"{size:>12,} {layout:>10} {used / 2 ** 20:>10.1f} {used / size:>11.0f} "
+                  f"{(used - email_bytes) / size:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark: instrumentation overhead and a per-stage timing breakdown
+Times the hot path with metrics enabled and disabled, then sends through the fake SMTP sink
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_smtp_server import FakeSMTPServer
+from metrics import METRICS, STAGES
+
+
+def hot_path(service, count):
+    """Code generation, message build and a wrong-guess verify per iteration"""
+    start = time.perf_counter()
+    for index in range(count):
+        email = f"user{index}@example.com"
+        code = service.generate_verification_code()
+        service.build_message_bytes(email, code)
+        service.verify_code(email, "x")
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=20000)
+    parser.add_argument('--sends', type=int, default=500)
+    args = parser.parse_args()
+
+    smtp = FakeSMTPServer(keep_messages=False).start_in_thread()
+    os.environ.update(
+        SENDER_EMAIL='bench@example.com', SENDER_PASSWORD='bench',
+        SMTP_SERVER='127.0.0.1', SMTP_PORT=str(smtp.port), SMTP_USE_TLS='false',
+        RESEND_LIMIT_PER_RECIPIENT='0', CLEANUP_INTERVAL='0', VERIFY_LOCKOUT_THRESHOLD='0',
+    )
+
+    from email_service import EmailVerificationService
+
+    service = EmailVerificationService()
+    hot_path(service, 1000)  # warm caches
+
+    print(f"📊 {args.count:,} iterations of generate + build + verify")
+    print(f"{'metrics':>9} {'µs/iter':>9} {'overhead':>9}")
+    results = {}
+    for enabled in (False, True, False, True):
+        METRICS.set_enabled(enabled)
+        results.setdefault(enabled, []).append(hot_path(service, args.count))
+    baseline = min(results[False])
+    for enabled in (False, True):
+        best = min(results[enabled])
+        print(f"{'on' if enabled else 'off':>9} {best * 1e6:>9.2f} {(best / baseline - 1) * 100:>8.1f}%")
+
+    METRICS.set_enabled(True)
+    METRICS.reset()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for index in range(args.sends):
+            email = f"send{index}@example.com"
+            _, code = service.send_verification_email(email)
+            service.verify_code(email, code)
+
+    snapshot = METRICS.snapshot()
+    print(f"\n📊 Stage breakdown over {args.sends:,} sends against the fake SMTP sink")
+    print(f"{'stage':>16} {'count':>7} {'mean µs':>9} {'p50 ≤ µs':>9} {'p99 ≤ µs':>9}")
+    for stage in STAGES:
+        histogram = snapshot['histograms'][stage]
+        if not histogram['count']:
+            continue
+        p50, p99 = (f"{value * 1e6:,.0f}" if value is not None else 'over' for value in (histogram['p50'], histogram['p99']))
+        print(f"{stage:>16} {histogram['count']:>7} {histogram['mean'] * 1e6:>9.1f} {p50:>9} {p99:>9}")
+    print("Counters:", ', '.join(f"{name}={value}" for name, value in sorted(snapshot['counters'].items())))
+
+    service.close()
+    smtp.stop_thread()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark: sharded service throughput from 1 to N worker processes
+Concurrent clients send and verify codes through the supervisor, then a shard is added and removed
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from shard_supervisor import ShardSupervisor
+
+
+def start_sink():
+    """Fake SMTP sink in its own process, so it does not compete with the supervisor for the GIL"""
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'fake_smtp_server.py'), '--port', str(port)],
+        stdout=subprocess.DEVNULL
+    )
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, port
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("Fake SMTP server did not start")
+
+
+def run_clients(supervisor, clients, pairs, shards):
+    failures = []
+
+    def client(number):
+        for index in range(pairs):
+            email = f"s{shards}-c{number}-{index}@example{index % 10}.com"
+            success, code = supervisor.send_verification_email(email)
+            if not success or not supervisor.verify_code(email, code)[0]:
+                failures.append(email)
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, len(failures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--max-shards', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--pairs', type=int, default=100, help="send and verify pairs per client")
+    parser.add_argument('--codes', type=int, default=20000, help="outstanding codes when rebalancing")
+    args = parser.parse_args()
+
+    sink, port = start_sink()
+    os.environ.update(
+        SENDER_EMAIL='bench@example.com', SENDER_PASSWORD='bench',
+        SMTP_SERVER='127.0.0.1', SMTP_PORT=str(port), SMTP_USE_TLS='false',
+        RESEND_LIMIT_PER_RECIPIENT='0', RESEND_LIMIT_PER_SOURCE='0', CLEANUP_INTERVAL='0',
+    )
+
+    print(f"📊 {args.clients} clients x {args.pairs} send+verify pairs, {os.cpu_count()} CPU(s)")
+    print(f"{'shards':>7} {'pairs/s':>10} {'speedup':>8} {'failed':>7}")
+    try:
+        baseline = None
+        for shards in range(1, args.max_shards + 1):
+            supervisor = ShardSupervisor(shards, quiet=True)
+            try:
+                # Warm up the SMTP sessions of every shard
+                run_clients(supervisor, shards, 2, shards)
+                elapsed, failed = run_clients(supervisor, args.clients, args.pairs, shards)
+            finally:
+                supervisor.close()
+            rate = args.clients * args.pairs / elapsed
+            baseline = baseline or rate
+            print(f"{shards:>7} {rate:>10,.0f} {rate / baseline:>7.2f}x {failed:>7}")
+
+        shards = max(2, args.max_shards)
+        supervisor = ShardSupervisor(shards, quiet=True)
+        try:
+            supervisor.send_verification_batch([f"r{index}@example{index % 10}.com" for index in range(args.codes)])
+            for action in ('add', 'remove'):
+                moved = supervisor.moved_codes
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    supervisor.add_shard() if action == 'add' else supervisor.remove_shard()
+                elapsed = time.perf_counter() - start
+                print(f"🔀 {action} shard with {args.codes:,} codes: moved {supervisor.moved_codes - moved:,} "
+                      f"in {elapsed * 1000:.0f} ms")
+        finally:
+            supervisor.close()
+    finally:
+        sink.terminate()
+        sink.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cold start of each entry point, measured with python -X importtime
+Reports the best of several fresh interpreters, the slowest imports and which heavy modules got loaded
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# label, code run in a fresh interpreter
+ENTRY_POINTS = (
+    ('email_service', "import email_service"),
+    ('service init', "import email_service; email_service.EmailVerificationService().close()"),
+    ('api_server', "import api_server"),
+    ('start --headless', "import start, api_server"),
+    ('simple_modern', "import simple_modern"),
+)
+
+# Modules startup should not need until the first send or window
+HEAVY = ('tkinter', 'smtplib', 'email.mime.multipart', 'dotenv', 'sqlite3', 'ssl')
+
+
+def parse_importtime(stderr):
+    """{module: (self µs, cumulative µs)} from -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(own), int(cumulative))
+    return modules
+
+
+def measure(code, env):
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode:
+        return None
+    return elapsed, parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help="fresh interpreters per entry point, the best is kept")
+    parser.add_argument('--top', type=int, default=5, help="slowest imports listed per entry point")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1', LOG_LEVEL='CRITICAL', CLEANUP_INTERVAL='0',
+               SENDER_EMAIL='bench@example.com', SENDER_PASSWORD='bench')
+    # Warm the bytecode cache so every entry point starts from compiled modules
+    subprocess.run([sys.executable, '-m', 'compileall', '-q', ROOT], capture_output=True)
+
+    print(f"📊 Best of {args.runs} fresh interpreters, Python {sys.version.split()[0]}")
+    print(f"{'entry point':>17} {'wall ms':>9} {'import ms':>10} {'modules':>8}  heavy modules loaded")
+    details = []
+    for label, code in ENTRY_POINTS:
+        runs = [run for run in (measure(code, env) for _ in range(args.runs)) if run is not None]
+        if not runs:
+            print(f"{label:>17} {'-':>9} {'-':>10} {'-':>8}  (import failed)")
+            continue
+        wall = min(elapsed for elapsed, _ in runs)
+        imports = min(runs, key=lambda run: sum(own for own, _ in run[1].values()))[1]
+        total = sum(own for own, _ in imports.values())
+        heavy = [name for name in HEAVY if name in imports]
+        print(f"{label:>17} {wall * 1000:>9.1f} {total / 1000:>10.1f} {len(imports):>8}  {', '.join(heavy) or 'none'}")
+        details.append((label, imports))
+
+    for label, imports in details if args.top > 0 else ():
+        slowest = sorted(imports.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+        print(f"\n🐢 {label}: slowest imports (self ms)")
+        for name, (own, _) in slowest:
+            print(f"{own / 1000:>9.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
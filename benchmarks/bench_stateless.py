@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark: issue and verify cost per code for stateless HMAC codes
+Compares StatelessCodeStore with the in-memory and SQLite stores
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from code_store import MemoryCodeStore, SQLiteCodeStore
+from stateless_codes import StatelessCodeStore
+
+
+def issue_all(store, emails, now):
+    codes = []
+    start = time.perf_counter()
+    if store.stateless:
+        for email in emails:
+            codes.append(store.issue(email, now)[0])
+    else:
+        for email in emails:
+            code = f"{random.randrange(10 ** 6):06d}"
+            store.set(email, code, now + 600)
+            codes.append(code)
+    return time.perf_counter() - start, codes
+
+
+def verify_all(store, emails, codes, now):
+    start = time.perf_counter()
+    for email, code in zip(emails, codes):
+        store.verify(email, code, now, 5)
+    return time.perf_counter() - start
+
+
+def entries(store):
+    """Records the store holds, consumed-token entries for the stateless store"""
+    return len(store.consumed) if store.stateless else len(store)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--sqlite-count', type=int, default=10000)
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp(prefix="stateless-")
+
+    try:
+        stores = (
+            ('stateless', StatelessCodeStore(os.urandom(32)), args.count),
+            ('memory', MemoryCodeStore(), args.count),
+            ('sqlite', SQLiteCodeStore(os.path.join(directory, 'codes.db')), args.sqlite_count),
+        )
+        print(f"{'store':>10} {'issue µs':>9} {'verify µs':>10} {'wrong µs':>9} "
+              f"{'entries issued':>15} {'entries verified':>17}")
+        for name, store, count in stores:
+            emails = [f"user{index}@example.com" for index in range(count)]
+            now = time.time()
+            issued, codes = issue_all(store, emails, now)
+            after_issue = entries(store)
+            # A wrong stateless guess is checked against every live window
+            wrong = verify_all(store, emails, ['999999x'] * count, now)
+            verified = verify_all(store, emails, codes, now)
+            print(f"{name:>10} {issued / count * 1e6:>9.2f} {verified / count * 1e6:>10.2f} "
+                  f"{wrong / count * 1e6:>9.2f} {after_issue:>15,} {entries(store):>17,}")
+            store.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: end-to-end workloads against an in-process fake SMTP server
+Runs single, batch, concurrent and verify-heavy workloads, saves the results as JSON and compares them to a baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_common import percentile, rss_bytes
+from fake_smtp_server import FakeSMTPServer
+
+WORKLOADS = ('single', 'batch', 'concurrent', 'verify')
+
+
+def commit_id():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def timed(call, *args):
+    start = time.perf_counter()
+    result = call(*args)
+    return time.perf_counter() - start, result
+
+
+def run_single(service, args):
+    """One send after another from a single thread"""
+    latencies, failed = [], 0
+    for index in range(args.count):
+        elapsed, (success, _) = timed(service.send_verification_email, f"single{index}@example{index % 20}.com")
+        latencies.append(elapsed)
+        failed += not success
+    return latencies, args.count, failed
+
+
+def run_batch(service, args):
+    """send_verification_batch over shared SMTP sessions, one latency sample per batch"""
+    latencies, failed = [], 0
+    for offset in range(0, args.count, args.batch_size):
+        size = min(args.batch_size, args.count - offset)
+        recipients = [f"batch{offset + index}@example{index % 20}.com" for index in range(size)]
+        elapsed, results = timed(service.send_verification_batch, recipients)
+        latencies.append(elapsed)
+        failed += sum(1 for result in results if not result['success'])
+    return latencies, args.count, failed
+
+
+def run_concurrent(service, args):
+    """Sends from a pool of threads, as a web server would issue them"""
+    def send(index):
+        elapsed, (success, _) = timed(service.send_verification_email, f"concurrent{index}@example{index % 20}.com")
+        return elapsed, success
+
+    with ThreadPoolExecutor(args.threads) as pool:
+        results = list(pool.map(send, range(args.count)))
+    return [elapsed for elapsed, _ in results], args.count, sum(1 for _, success in results if not success)
+
+
+def run_verify(service, args):
+    """Codes issued without SMTP, then a wrong guess and the right one per email from a pool of threads"""
+    emails = [f"verify{index}@example{index % 20}.com" for index in range(args.count)]
+    codes = {email: service.issue_code(email)[0] for email in emails}
+
+    def verify(email):
+        code = codes[email]
+        wrong = str((int(code) + 1) % 10 ** len(code)).zfill(len(code))
+        first, _ = timed(service.verify_code, email, wrong)
+        second, (valid, _) = timed(service.verify_code, email, code)
+        return first, second, valid
+
+    with ThreadPoolExecutor(args.threads) as pool:
+        results = list(pool.map(verify, emails))
+    latencies = [elapsed for first, second, _ in results for elapsed in (first, second)]
+    return latencies, len(latencies), sum(1 for *_, valid in results if not valid)
+
+
+RUNNERS = {
+    'single': run_single,
+    'batch': run_batch,
+    'concurrent': run_concurrent,
+    'verify': run_verify,
+}
+
+
+def run_workload(name, service, smtp, args):
+    from metrics import METRICS
+
+    METRICS.reset()
+    rejected, throttled = smtp.rejected_count, smtp.throttled_count
+    start = time.perf_counter()
+    latencies, operations, failed = RUNNERS[name](service, args)
+    elapsed = time.perf_counter() - start
+    stages = METRICS.snapshot()['histograms']
+    return {
+        'operations': operations,
+        'seconds': elapsed,
+        'throughput': operations / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'failed': failed,
+        'smtp_rejected': smtp.rejected_count - rejected,
+        'smtp_throttled': smtp.throttled_count - throttled,
+        'rss_mb': rss_bytes() / 2 ** 20,
+        'stage_mean_us': {stage: round(histogram['mean'] * 1e6, 1)
+                          for stage, histogram in stages.items() if histogram['count']},
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print the change against a saved run, returning the workloads that regressed"""
+    print(f"\n📊 Against {baseline.get('commit') or 'baseline'} ({baseline['created']})")
+    print(f"{'workload':>11} {'ops/s':>9} {'p50':>9} {'p99':>9} {'rss':>9}")
+    regressed = []
+    for name, current in results.items():
+        before = baseline['workloads'].get(name)
+        if before is None:
+            continue
+        changes = [
+            (current['throughput'] / before['throughput'] - 1) * 100,
+            (current['p50_ms'] / before['p50_ms'] - 1) * 100 if before['p50_ms'] else 0.0,
+            (current['p99_ms'] / before['p99_ms'] - 1) * 100 if before['p99_ms'] else 0.0,
+            (current['rss_mb'] / before['rss_mb'] - 1) * 100,
+        ]
+        # Lower throughput is worse, higher latency and memory are worse
+        worse = -changes[0] > threshold or any(change > threshold for change in changes[1:])
+        if worse:
+            regressed.append(name)
+        print(f"{name:>11} " + ' '.join(f"{change:>+8.1f}%" for change in changes) + (" ⚠️" if worse else ""))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workloads', default=','.join(WORKLOADS), help="comma separated, from " + ', '.join(WORKLOADS))
+    parser.add_argument('--count', type=int, default=500, help="emails per workload")
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0, help="ms the SMTP server takes per message")
+    parser.add_argument('--error-rate', type=float, default=0, help="fraction of messages the SMTP server rejects")
+    parser.add_argument('--rate-limit', type=float, default=0, help="messages per second the SMTP server accepts")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="JSON file of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=10, help="%% change reported as a regression")
+    args = parser.parse_args()
+
+    workloads = [name.strip() for name in args.workloads.split(',') if name.strip()]
+    unknown = set(workloads) - set(WORKLOADS)
+    if unknown:
+        parser.error(f"unknown workloads: {', '.join(sorted(unknown))}")
+
+    smtp = FakeSMTPServer(
+        keep_messages=False, latency=args.latency / 1000, error_rate=args.error_rate,
+        rate_limit=args.rate_limit, seed=args.seed
+    ).start_in_thread()
+    os.environ.update(
+        SENDER_EMAIL='bench@example.com', SENDER_PASSWORD='bench',
+        SMTP_SERVER='127.0.0.1', SMTP_PORT=str(smtp.port), SMTP_USE_TLS='false',
+        SMTP_POOL_SIZE=str(args.threads), RESEND_LIMIT_PER_RECIPIENT='0', RESEND_LIMIT_PER_SOURCE='0',
+        CLEANUP_INTERVAL='0', VERIFY_LOCKOUT_THRESHOLD='0', LOG_LEVEL='CRITICAL',
+        # Failed sends are not retried, so no background work spills into the next workload
+        SEND_RETRY_ATTEMPTS='1',
+    )
+
+    from email_service import EmailVerificationService
+
+    service = EmailVerificationService()
+    started_rss = rss_bytes() / 2 ** 20
+
+    print(f"📊 {args.count:,} emails per workload, {args.threads} threads, SMTP latency {args.latency:g} ms, "
+          f"error rate {args.error_rate:g}, rate limit {args.rate_limit:g}/s")
+    print(f"{'workload':>11} {'ops':>7} {'ops/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'failed':>7} {'rss MB':>8}")
+    results = {}
+    try:
+        for name in workloads:
+            result = results[name] = run_workload(name, service, smtp, args)
+            print(f"{name:>11} {result['operations']:>7,} {result['throughput']:>9,.0f} {result['p50_ms']:>9.2f} "
+                  f"{result['p99_ms']:>9.2f} {result['failed']:>7} {result['rss_mb']:>8.1f}")
+    finally:
+        service.close()
+        smtp.stop_thread()
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit_id(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'rss_start_mb': started_rss,
+        'workloads': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressed = compare(results, baseline, args.threshold)
+        if regressed:
+            print(f"❌ Regressed beyond {args.threshold:g}%: {', '.join(regressed)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Benchmark: throughput and memory bound of the resend throttle
+Measures SendThrottle.allow for distinct recipients, one hammered recipient and many sources
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from send_throttle import SendThrottle
+
+
+def run(throttle, recipients, sources):
+    now = time.time()
+    allowed = 0
+    start = time.perf_counter()
+    for recipient, source in zip(recipients, sources):
+        allowed += throttle.allow(recipient, source, now)
+    elapsed = time.perf_counter() - start
+    return elapsed, allowed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=500000)
+    parser.add_argument('--max-keys', type=int, default=100000)
+    args = parser.parse_args()
+    count = args.count
+
+    scenarios = {
+        'distinct': ([f"user{index}@example.com" for index in range(count)], [None] * count),
+        'hammered': (["victim@example.com"] * count, [None] * count),
+        'sources': ([f"user{index}@example.com" for index in range(count)],
+                    [f"10.0.{index % 256}.{index // 256 % 256}" for index in range(count)]),
+    }
+
+    print(f"{'scenario':>10} {'requests/s':>12} {'µs/request':>11} {'allowed':>10} {'tracked':>9}")
+    for name, (recipients, sources) in scenarios.items():
+        throttle = SendThrottle(max_keys=args.max_keys)
+        elapsed, allowed = run(throttle, recipients, sources)
+        metrics = throttle.metrics()
+        tracked = metrics['tracked_recipients'] + metrics['tracked_sources']
+        print(f"{name:>10} {count / elapsed:>12,.0f} {elapsed / count * 1e6:>11.2f} {allowed:>10,} {tracked:>9,}")
+
+
+if __name__ == "__main__":
+    main()
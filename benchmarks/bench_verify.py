@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmark: verify_code throughput for correct and wrong guesses
+Compares CodeStore.verify with the previous get, == and delete sequence
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from code_store import ColumnarCodeStore, MemoryCodeStore
+
+
+def previous_verify(store, email, entered_code, now):
+    """The previous check: a lookup, a plain compare and a second lookup to consume"""
+    record = store.get(email)
+    if record is None:
+        return False
+    if now > record.expires_at:
+        store.delete(email)
+        return False
+    if record.code == entered_code:
+        return store.delete(email)
+    return False
+
+
+def fill(store, emails, expires_at):
+    for index, email in enumerate(emails):
+        store.set(email, f"{index % 1000000:06d}", expires_at)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=200000)
+    args = parser.parse_args()
+    count = args.count
+
+    emails = [f"user{index}@example.com" for index in range(count)]
+    codes = [f"{index % 1000000:06d}" for index in range(count)]
+    now = time.time()
+
+    print(f"{'store':>10} {'path':>10} {'guess':>7} {'verifies/s':>12} {'µs/verify':>10}")
+    for name, factory in (('memory', MemoryCodeStore), ('columnar', ColumnarCodeStore)):
+        for guess in ('correct', 'wrong'):
+            for path in ('previous', 'verify'):
+                store = factory()
+                fill(store, emails, now + 600)
+                guesses = codes if guess == 'correct' else ['999999x'] * count
+                start = time.perf_counter()
+                if path == 'previous':
+                    for email, entered_code in zip(emails, guesses):
+                        previous_verify(store, email, entered_code, now)
+                else:
+                    verify = store.verify
+                    for email, entered_code in zip(emails, guesses):
+                        verify(email, entered_code, now, 5)
+                elapsed = time.perf_counter() - start
+                print(f"{name:>10} {path:>10} {guess:>7} {count / elapsed:>12,.0f} {elapsed / count * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
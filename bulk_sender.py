@@ -0,0 +1,324 @@
+import csv
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+from service_log import get_logger
+
+log = get_logger('bulk_sender')
+
+# Sentinel telling a sender thread that the list is exhausted
+_DONE = object()
+
+REPORT_FIELDS = ('email', 'status', 'error', 'finished_at')
+
+# Report statuses, a 'retrying' row is followed by a 'sent' or 'failed' one once the retry ends
+STATUSES = ('sent', 'retrying', 'throttled', 'failed')
+
+THROTTLED_ERROR = "Too many verification emails requested, try again later"
+
+
+def iter_recipients(path, custom_message=""):
+    """Stream (email, custom_message) pairs from a TXT or CSV recipient list
+
+    TXT files hold one address per line, blank lines and lines starting
+    with # are skipped. CSV files use their 'email' and optional 'message'
+    columns when they have a header, otherwise the first cell holding an @.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        yield from _parse_recipients(f, path.lower().endswith('.csv'), custom_message)
+
+
+def _parse_recipients(lines, is_csv, custom_message):
+    if not is_csv:
+        for line in lines:
+            email = line.strip()
+            if email and not email.startswith('#'):
+                yield email, custom_message
+        return
+
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = [column.strip().lower() for column in header]
+    if 'email' in columns:
+        email_index = columns.index('email')
+        message_index = columns.index('message') if 'message' in columns else None
+        rows = reader
+    else:
+        email_index = message_index = None
+        # The first row is a recipient too
+        rows = _prepend(header, reader)
+    for row in rows:
+        if email_index is None:
+            email = next((cell.strip() for cell in row if '@' in cell), '')
+            message = custom_message
+        else:
+            email = row[email_index].strip() if email_index < len(row) else ''
+            message = row[message_index].strip() if message_index is not None and message_index < len(row) else ''
+            message = message or custom_message
+        if email:
+            yield email, message
+
+
+def _prepend(first, rows):
+    yield first
+    yield from rows
+
+
+class BulkSendJob:
+    """Sends verification emails to a streamed recipient list on a pool of sender threads
+
+    The list is read by one thread into a small bounded queue, so only a
+    few recipients are held in memory at a time. Every outcome is appended
+    to a CSV report as it happens. The job can be paused, resumed and
+    cancelled, and progress() reports counts, throughput and an ETA. The
+    total is known once the reader reaches the end of the list, until then
+    the ETA extrapolates from how far into the file it got.
+    on_result(email, status, error) is called for every row of the report.
+    """
+
+    def __init__(self, service, path, report_path=None, workers=4, custom_message="", on_result=None):
+        self.service = service
+        self.path = path
+        if report_path is None:
+            stem = os.path.splitext(path)[0]
+            report_path = f"{stem}_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        self.report_path = report_path
+        self.worker_count = max(1, int(workers))
+        self.custom_message = custom_message
+        self.on_result = on_result
+
+        self.total = None
+        self.read = 0
+        self.sent = 0
+        self.failed = 0
+        self.retrying = 0
+        self.throttled = 0
+        # (email, code) of sends handed to the service's retry scheduler
+        self._retries = set()
+        # Emails inside deliver_verification_result, and retry outcomes that arrived before it returned
+        self._delivering = Counter()
+        self._early = {}
+        self._size = 0
+        self._read_chars = 0
+        self.started_at = None
+        self.finished_at = None
+        self._completions = deque(maxlen=5000)
+        self._queue = queue.Queue(maxsize=self.worker_count * 4)
+        self._lock = threading.Lock()
+        self._resumed = threading.Event()
+        self._resumed.set()
+        self._cancelled = threading.Event()
+        self._threads = []
+        self._finisher = None
+        self._report = None
+        self._report_writer = None
+
+    def start(self):
+        """Start reading the list and sending"""
+        self.started_at = time.monotonic()
+        self._report = open(self.report_path, 'w', newline='', encoding='utf-8')
+        self._report_writer = csv.writer(self._report)
+        self._report_writer.writerow(REPORT_FIELDS)
+        self._report.flush()
+        self.service.add_retry_listener(self._on_retry)
+
+        reader = threading.Thread(target=self._read, name="bulk-reader", daemon=True)
+        self._threads = [reader] + [
+            threading.Thread(target=self._work, name=f"bulk-sender-{index}", daemon=True)
+            for index in range(self.worker_count)
+        ]
+        for thread in self._threads:
+            thread.start()
+        self._finisher = threading.Thread(target=self._finish, name="bulk-finish", daemon=True)
+        self._finisher.start()
+
+    def pause(self):
+        self._resumed.clear()
+
+    def resume(self):
+        self._resumed.set()
+
+    def cancel(self):
+        """Stop after the emails already being sent, the rest of the list is skipped"""
+        self._cancelled.set()
+        self._resumed.set()
+
+    @property
+    def paused(self):
+        return not self._resumed.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the job has finished or was cancelled"""
+        if self._finisher is not None:
+            self._finisher.join(timeout)
+        return self.finished_at is not None
+
+    def _read(self):
+        try:
+            self._size = os.path.getsize(self.path)
+            with open(self.path, newline='', encoding='utf-8-sig') as f:
+                recipients = _parse_recipients(self._count_chars(f), self.path.lower().endswith('.csv'),
+                                               self.custom_message)
+                for entry in recipients:
+                    with self._lock:
+                        self.read += 1
+                    while not self._cancelled.is_set():
+                        try:
+                            self._queue.put(entry, timeout=0.2)
+                            break
+                        except queue.Full:
+                            continue
+                    if self._cancelled.is_set():
+                        break
+                else:
+                    with self._lock:
+                        self.total = self.read
+        except Exception as e:
+            log.error(f"❌ Could not read recipient list {self.path}: {e}", extra={'event': 'bulk_failed', 'error': str(e)})
+            self._cancelled.set()
+        finally:
+            for _ in range(self.worker_count):
+                self._queue.put(_DONE)
+
+    def _count_chars(self, lines):
+        # How far into the file the reader is, for the ETA before the total is known
+        for line in lines:
+            self._read_chars += len(line)
+            yield line
+
+    def _work(self):
+        while True:
+            entry = self._queue.get()
+            if entry is _DONE:
+                return
+            self._resumed.wait()
+            if self._cancelled.is_set():
+                continue
+            email, custom_message = entry
+            code = None
+            delivering = False
+            try:
+                if not self.service.allow_send(email):
+                    status, error = 'throttled', THROTTLED_ERROR
+                else:
+                    with self._lock:
+                        # A retry can end before the send returns, _on_retry keeps its outcome for _record
+                        self._delivering[email] += 1
+                    delivering = True
+                    result = self.service.deliver_verification_result(email, custom_message)
+                    code, error = result['code'], result['error']
+                    if result['retrying']:
+                        status = 'retrying'
+                    else:
+                        status = 'sent' if result['success'] else 'failed'
+            except Exception as e:
+                status, error = 'failed', str(e)
+            self._record(email, status, error, code, delivering)
+
+    def _record(self, email, status, error, code=None, delivering=False):
+        rows = [(status, error)]
+        with self._lock:
+            setattr(self, status, getattr(self, status) + 1)
+            self._completions.append(time.monotonic())
+            self._write_row(email, status, error)
+            if status == 'retrying':
+                early = self._early.pop((email, code), None)
+                if early is None:
+                    self._retries.add((email, code))
+                else:
+                    self._settle_retry(email, *early)
+                    rows.append(early)
+            if delivering:
+                self._delivering[email] -= 1
+                if not self._delivering[email]:
+                    del self._delivering[email]
+                    # Outcomes of retries this job did not start
+                    for key in [key for key in self._early if key[0] == email]:
+                        del self._early[key]
+        if self.on_result is not None:
+            for status, error in rows:
+                self.on_result(email, status, error)
+
+    def _on_retry(self, email, code, status, error):
+        """Correct the report once a send this job saw retrying was sent or given up on"""
+        with self._lock:
+            if (email, code) not in self._retries:
+                if email in self._delivering:
+                    self._early[(email, code)] = (status, error)
+                return
+            self._retries.discard((email, code))
+            self._settle_retry(email, status, error)
+            settled = self.finished_at is not None and not self._retries
+        if settled:
+            self.service.remove_retry_listener(self._on_retry)
+        if self.on_result is not None:
+            self.on_result(email, status, error)
+
+    def _settle_retry(self, email, status, error):
+        # Caller holds the lock
+        self.retrying -= 1
+        setattr(self, status, getattr(self, status) + 1)
+        self._write_row(email, status, error)
+
+    def _write_row(self, email, status, error):
+        # Caller holds the lock, rows for retries that end after the job reopen the report
+        row = (email, status, error or '', datetime.now().isoformat(timespec='seconds'))
+        if self._report.closed:
+            with open(self.report_path, 'a', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerow(row)
+        else:
+            self._report_writer.writerow(row)
+            self._report.flush()
+
+    def _finish(self):
+        for thread in self._threads:
+            thread.join()
+        with self._lock:
+            self._report.close()
+            self.finished_at = time.monotonic()
+            settled = not self._retries
+        if settled:
+            self.service.remove_retry_listener(self._on_retry)
+
+    def progress(self, window=10.0):
+        """Counts, throughput over the last window seconds and the estimated time left"""
+        now = time.monotonic()
+        with self._lock:
+            done = self.sent + self.failed + self.retrying + self.throttled
+            recent = 0
+            for finished in reversed(self._completions):
+                if now - finished > window:
+                    break
+                recent += 1
+            elapsed = (self.finished_at or now) - self.started_at if self.started_at else 0.0
+            rate = recent / min(window, elapsed) if elapsed > 0 else 0.0
+            total = self.total
+            if total is None and self._read_chars:
+                # Until the whole list is read, extrapolate from how far into the file the reader got
+                total = self.read * max(self._size, self._read_chars) / self._read_chars
+            eta = None
+            if total is not None and rate > 0:
+                eta = max(0, total - done) / rate
+            if self.finished_at is not None:
+                state = 'cancelled' if self._cancelled.is_set() else 'finished'
+            else:
+                state = 'paused' if self.paused else 'running'
+            return {
+                'state': state,
+                'total': self.total,
+                'read': self.read,
+                'done': done,
+                'sent': self.sent,
+                'failed': self.failed,
+                'retrying': self.retrying,
+                'throttled': self.throttled,
+                'rate': rate,
+                'eta': eta,
+                'elapsed': elapsed,
+            }
@@ -0,0 +1,65 @@
+import os
+import string
+import threading
+
+
+class CodeGenerator:
+    """Uniformly random codes cut from bulk operating system entropy
+
+    Random bytes are read from os.urandom a buffer at a time. Bytes at or
+    above the largest multiple of the alphabet size are rejected and the
+    rest map onto the alphabet, so every character is equally likely with
+    no modulo bias. Both steps run inside bytes.translate.
+    """
+
+    def __init__(self, length=6, alphabet=string.digits, buffer_size=4096):
+        alphabet = ''.join(dict.fromkeys(alphabet))
+        if not 2 <= len(alphabet) <= 256 or not alphabet.isascii():
+            raise ValueError("The code alphabet needs 2 to 256 distinct ASCII characters")
+        if length < 1:
+            raise ValueError("Codes need at least one character")
+        self.length = length
+        self.alphabet = alphabet
+        self.buffer_size = max(buffer_size, length * 4)
+
+        accepted = 256 - 256 % len(alphabet)
+        self._table = bytes(ord(alphabet[value % len(alphabet)]) for value in range(256))
+        self._rejected = bytes(range(accepted, 256))
+        self._pool = ''
+        self._position = 0
+        self._lock = threading.Lock()
+
+    @property
+    def numeric(self):
+        return self.alphabet.isdigit()
+
+    def _characters(self, count):
+        # Caller holds the lock
+        pool, position = self._pool, self._position
+        if len(pool) - position < count:
+            chunks = [pool[position:]]
+            available = len(chunks[0])
+            while available < count:
+                chunk = os.urandom(max(self.buffer_size, count - available)).translate(
+                    self._table, self._rejected
+                ).decode('ascii')
+                chunks.append(chunk)
+                available += len(chunk)
+            pool, position = ''.join(chunks), 0
+        self._pool, self._position = pool, position + count
+        return pool[position:position + count]
+
+    def generate(self):
+        """One code"""
+        with self._lock:
+            return self._characters(self.length)
+
+    def generate_batch(self, count):
+        """count independent codes from one entropy read
+
+        Codes are kept per email, so two recipients may draw the same code.
+        """
+        length = self.length
+        with self._lock:
+            characters = self._characters(count * length)
+        return [characters[start:start + length] for start in range(0, count * length, length)]
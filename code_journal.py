@@ -0,0 +1,288 @@
+import json
+import os
+import threading
+import time
+
+from code_store import INVALID, MISSING, CodeStore
+from service_log import get_logger
+
+log = get_logger('code_journal')
+
+LOG_FILE = 'codes.log'
+SNAPSHOT_FILE = 'codes.snapshot'
+
+# Event markers, one JSON array per line: [marker, email, ...]
+ISSUE = 'I'
+CONSUME = 'C'
+EXPIRE = 'E'
+ATTEMPT = 'A'
+
+FSYNC_POLICIES = ('always', 'batch', 'never')
+
+
+def encode_event(*fields):
+    """One journal line, JSON escapes any newline or tab an email could carry"""
+    return json.dumps(fields, ensure_ascii=True, separators=(',', ':')) + '\n'
+
+
+def decode_event(line):
+    """The fields of a journal line, or None when the line is not a well-formed event"""
+    try:
+        fields = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(fields, list) or len(fields) < 2 or not all(isinstance(field, str) for field in fields[:2]):
+        return None
+    marker = fields[0]
+    if marker == ISSUE:
+        if len(fields) != 4 or not isinstance(fields[2], str):
+            return None
+        expires_at = fields[3]
+        if isinstance(expires_at, bool) or not isinstance(expires_at, (int, float)):
+            return None
+        return fields
+    if marker in (CONSUME, EXPIRE, ATTEMPT) and len(fields) == 2:
+        return fields
+    return None
+
+
+class CodeJournal:
+    """Append-only log of issue/consume/expire/failed-attempt events with compact snapshots
+
+    With fsync='batch' events are buffered and a background thread flushes
+    and fsyncs them every flush_interval seconds, so a crash loses at most
+    that window. 'always' fsyncs every event, 'never' leaves it to the OS.
+    The same thread takes a snapshot once snapshot_every events were
+    logged, whatever the policy.
+    """
+
+    def __init__(self, directory, fsync='batch', flush_interval=0.05, snapshot_every=100000):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {', '.join(FSYNC_POLICIES)}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fsync = fsync
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self.log_path = os.path.join(directory, LOG_FILE)
+        self.previous_log_path = self.log_path + '.old'
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._log = open(self.log_path, 'a', encoding='utf-8')
+        self._events_since_snapshot = 0
+        self.snapshot_source = None
+        self.malformed = 0
+        self._stop = threading.Event()
+        # Snapshots are taken here for every policy, appends run under the store's lock
+        self._flusher = threading.Thread(target=self._flush_loop, name="code-journal", daemon=True)
+        self._flusher.start()
+
+    def _append(self, line):
+        with self._lock:
+            self._events_since_snapshot += 1
+            if self.fsync == 'always':
+                self._log.write(line)
+                self._log.flush()
+                os.fsync(self._log.fileno())
+            else:
+                self._buffer.append(line)
+
+    def record_issue(self, email, code, expires_at):
+        self._append(encode_event(ISSUE, email, code, expires_at))
+
+    def record_consume(self, email):
+        self._append(encode_event(CONSUME, email))
+
+    def record_attempt(self, email):
+        self._append(encode_event(ATTEMPT, email))
+
+    def record_expire(self, emails):
+        if emails:
+            self._append(''.join(encode_event(EXPIRE, email) for email in emails))
+
+    def _write_buffer(self):
+        # Caller holds the lock
+        if self._buffer:
+            self._log.write(''.join(self._buffer))
+            self._buffer.clear()
+            self._log.flush()
+            if self.fsync == 'batch':
+                os.fsync(self._log.fileno())
+
+    def flush(self):
+        """Write buffered events to disk"""
+        with self._lock:
+            self._write_buffer()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                if self.snapshot_source is not None and self._events_since_snapshot >= self.snapshot_every:
+                    self.snapshot_source()
+            except Exception as e:
+                log.warning(f"⚠️ Code journal flush failed: {e}", extra={'event': 'journal_failed', 'error': str(e)})
+
+    def snapshot(self, items, lock=None):
+        """Write the live table as a snapshot and start an empty log
+
+        items() must return the (email, PendingCode) pairs of the table. The
+        caller's lock keeps the table and the log in step while they are
+        captured, and is released before the snapshot hits the disk. The
+        previous log is kept until the snapshot is in place.
+        """
+        if lock is not None:
+            lock.acquire()
+        try:
+            with self._lock:
+                entries = list(items())
+                self._write_buffer()
+                self._log.close()
+                if os.path.exists(self.previous_log_path):
+                    # An earlier snapshot never finished, keep both logs
+                    with open(self.previous_log_path, 'a', encoding='utf-8') as previous, \
+                            open(self.log_path, 'r', encoding='utf-8') as current:
+                        previous.write(current.read())
+                    os.remove(self.log_path)
+                else:
+                    os.replace(self.log_path, self.previous_log_path)
+                self._log = open(self.log_path, 'a', encoding='utf-8')
+                self._events_since_snapshot = 0
+        finally:
+            if lock is not None:
+                lock.release()
+
+        temporary = self.snapshot_path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            for email, record in entries:
+                f.write(encode_event(ISSUE, email, record.code, record.expires_at))
+                if record.attempts:
+                    f.write(encode_event(ATTEMPT, email) * record.attempts)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.snapshot_path)
+        os.remove(self.previous_log_path)
+
+    def replay(self, store, now=None):
+        """Rebuild a store from the snapshot and log, skipping expired codes
+
+        Lines that do not decode to a well-formed event are skipped and
+        counted in self.malformed rather than trusted.
+        """
+        now = time.time() if now is None else now
+        live = {}
+        self.malformed = 0
+        # A leftover previous log means the last snapshot may not have been written
+        for path in (self.snapshot_path, self.previous_log_path, self.log_path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    lines = f.read().split('\n')
+            except FileNotFoundError:
+                continue
+            # The last piece is empty, or a torn write from a crash that never completed
+            for line in lines[:-1]:
+                fields = decode_event(line)
+                if fields is None:
+                    self.malformed += 1
+                elif fields[0] == ISSUE:
+                    live[fields[1]] = [fields[2], fields[3], 0]
+                elif fields[0] == ATTEMPT:
+                    entry = live.get(fields[1])
+                    if entry is not None:
+                        entry[2] += 1
+                else:
+                    live.pop(fields[1], None)
+        if self.malformed:
+            log.warning(f"⚠️ Skipped {self.malformed} malformed code journal records",
+                        extra={'event': 'journal_malformed', 'count': self.malformed})
+
+        restored = 0
+        for email, (code, expires_at, attempts) in live.items():
+            if expires_at > now:
+                store.set(email, code, expires_at)
+                for _ in range(attempts):
+                    store.add_failed_attempt(email)
+                restored += 1
+        return restored
+
+    def close(self):
+        self._stop.set()
+        self._flusher.join()
+        with self._lock:
+            self._write_buffer()
+            self._log.close()
+
+
+class JournaledCodeStore(CodeStore):
+    """In-process code store made durable by a CodeJournal
+
+    The table is replayed from the journal on startup and snapshotted in
+    the background once enough events have been logged.
+    """
+
+    def __init__(self, backend, journal):
+        self.backend = backend
+        self.journal = journal
+        self._lock = threading.Lock()
+
+        start = time.perf_counter()
+        restored = journal.replay(backend)
+        if restored:
+            elapsed = (time.perf_counter() - start) * 1000
+            log.info(f"♻️ Restored {restored} verification codes in {elapsed:.0f} ms",
+                     extra={'event': 'journal_restored', 'count': restored})
+        # Start from a compact snapshot of what was restored
+        self.snapshot()
+        journal.snapshot_source = self.snapshot
+
+    def set(self, email, code, expires_at):
+        with self._lock:
+            self.backend.set(email, code, expires_at)
+            self.journal.record_issue(email, code, expires_at)
+
+    def get(self, email):
+        return self.backend.get(email)
+
+    def delete(self, email):
+        with self._lock:
+            removed = self.backend.delete(email)
+            if removed:
+                self.journal.record_consume(email)
+        return removed
+
+    def add_failed_attempt(self, email):
+        with self._lock:
+            attempts = self.backend.add_failed_attempt(email)
+            if attempts:
+                self.journal.record_attempt(email)
+        return attempts
+
+    def verify(self, email, entered_code, now, max_attempts):
+        with self._lock:
+            status = self.backend.verify(email, entered_code, now, max_attempts)
+            if status is INVALID:
+                self.journal.record_attempt(email)
+            elif status is not MISSING:
+                self.journal.record_consume(email)
+        return status
+
+    def pop_expired(self, now=None):
+        with self._lock:
+            expired = self.backend.pop_expired(now)
+            self.journal.record_expire(expired)
+        return expired
+
+    def items(self):
+        return self.backend.items()
+
+    def snapshot(self):
+        self.journal.snapshot(self.backend.items, self._lock)
+
+    def __len__(self):
+        return len(self.backend)
+
+    def close(self):
+        self.journal.close()
+        self.backend.close()
@@ -0,0 +1,729 @@
+import hmac
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from settings import get_settings
+
+
+# Outcomes of CodeStore.verify
+VERIFIED = 'verified'
+INVALID = 'invalid'
+EXPIRED = 'expired'
+MISSING = 'missing'
+EXHAUSTED = 'exhausted'
+
+
+def codes_match(code, entered_code):
+    """Constant-time comparison of a stored code with a guess"""
+    try:
+        return hmac.compare_digest(code, entered_code)
+    except TypeError:
+        # Non-ASCII guesses can never match a code
+        return False
+
+
+class PendingCode:
+    """Outstanding verification code, expiry as Unix time in seconds"""
+
+    __slots__ = ('code', 'expires_at', 'attempts')
+
+    def __init__(self, code, expires_at, attempts=0):
+        self.code = code
+        self.expires_at = expires_at
+        self.attempts = attempts
+
+    def __repr__(self):
+        return f"PendingCode(code={self.code!r}, expires_at={self.expires_at!r}, attempts={self.attempts!r})"
+
+
+class CodeStore:
+    """Storage interface for outstanding verification codes, records are PendingCode"""
+
+    # Stateless stores derive codes with issue() instead of storing them with set()
+    stateless = False
+    # Shared stores are visible to every process, sharded workers need not migrate them
+    shared = False
+
+    def set(self, email, code, expires_at):
+        raise NotImplementedError
+
+    def get(self, email):
+        """Return the PendingCode for an email, or None"""
+        raise NotImplementedError
+
+    def delete(self, email):
+        """Remove a record, returning True only if this call removed it"""
+        raise NotImplementedError
+
+    def is_outstanding(self, email, code, now=None):
+        """Whether code is still the email's code, not consumed, replaced or revoked"""
+        record = self.get(email)
+        return record is not None and record.code == code
+
+    def add_failed_attempt(self, email):
+        """Count a wrong guess against the email's code, returning its failed attempts (0 without a code)"""
+        raise NotImplementedError
+
+    def verify(self, email, entered_code, now, max_attempts):
+        """Check a guess, consuming the code on a match or once max_attempts guesses failed
+
+        Returns VERIFIED, INVALID, EXPIRED, MISSING or EXHAUSTED.
+        """
+        record = self.get(email)
+        if record is None:
+            return MISSING
+        if now > record.expires_at:
+            self.delete(email)
+            return EXPIRED
+        if codes_match(record.code, entered_code):
+            # The delete makes sure a code is consumed only once
+            return VERIFIED if self.delete(email) else MISSING
+        if self.add_failed_attempt(email) >= max_attempts:
+            self.delete(email)
+            return EXHAUSTED
+        return INVALID
+
+    def pop_expired(self, now=None):
+        """Remove expired records and return the affected emails"""
+        raise NotImplementedError
+
+    def items(self):
+        """Return (email, PendingCode) pairs of every stored code"""
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def __contains__(self, email):
+        return self.get(email) is not None
+
+    def close(self):
+        pass
+
+
+class ExpiryIndex:
+    """Timing wheel of expiry buckets with lazy deletion
+
+    Each bucket holds the keys whose codes expire within one resolution
+    step. A sweep only visits buckets that are entirely in the past, so its
+    cost grows with the number of expired codes rather than the table size.
+    Overwritten or consumed codes leave stale keys that are skipped when
+    their bucket comes due. With a typecode, buckets are compact arrays of
+    integer keys.
+    """
+
+    def __init__(self, resolution=1.0, typecode=None):
+        self.resolution = resolution
+        self.typecode = typecode
+        self._buckets = {}
+        self._next_bucket = None
+        self._size = 0
+
+    def push(self, expires_at, key):
+        bucket = int(expires_at // self.resolution)
+        entries = self._buckets.get(bucket)
+        if entries is None:
+            entries = self._buckets[bucket] = array(self.typecode) if self.typecode else []
+            if self._next_bucket is None or bucket < self._next_bucket:
+                self._next_bucket = bucket
+        entries.append(key)
+        self._size += 1
+
+    def pop_due(self, now, is_due):
+        """Pop keys of elapsed buckets, keeping those for which is_due(key, now) holds"""
+        due = []
+        if self._next_bucket is None:
+            return due
+
+        # Buckets strictly before this one lie entirely in the past
+        end = int(now // self.resolution)
+        if end - self._next_bucket > len(self._buckets):
+            # Long gap since the last sweep, visit the existing buckets only
+            buckets = sorted(bucket for bucket in self._buckets if bucket < end)
+        else:
+            buckets = range(self._next_bucket, end)
+
+        for bucket in buckets:
+            entries = self._buckets.pop(bucket, None)
+            if entries is None:
+                continue
+            self._size -= len(entries)
+            for key in entries:
+                if is_due(key, now):
+                    due.append(key)
+
+        # Every remaining bucket is at or after end
+        self._next_bucket = end if self._buckets else None
+        return due
+
+    def __len__(self):
+        return self._size
+
+
+class MemoryCodeStore(CodeStore):
+    """Codes kept in a dict owned by one process, with an expiry index for sweeps"""
+
+    def __init__(self):
+        self.codes = {}
+        self.expiry_index = ExpiryIndex()
+        self._lock = threading.Lock()
+
+    def _is_due(self, email, now):
+        record = self.codes.get(email)
+        return record is not None and now > record.expires_at
+
+    def set(self, email, code, expires_at):
+        with self._lock:
+            self.codes[email] = PendingCode(code, expires_at)
+            self.expiry_index.push(expires_at, email)
+
+    def get(self, email):
+        return self.codes.get(email)
+
+    def delete(self, email):
+        with self._lock:
+            return self.codes.pop(email, None) is not None
+
+    def add_failed_attempt(self, email):
+        with self._lock:
+            record = self.codes.get(email)
+            if record is None:
+                return 0
+            record.attempts += 1
+            return record.attempts
+
+    def verify(self, email, entered_code, now, max_attempts):
+        # One dict lookup: the record is taken out and only put back after a wrong guess
+        with self._lock:
+            record = self.codes.pop(email, None)
+            if record is None:
+                return MISSING
+            if now > record.expires_at:
+                return EXPIRED
+            if codes_match(record.code, entered_code):
+                return VERIFIED
+            record.attempts += 1
+            if record.attempts >= max_attempts:
+                return EXHAUSTED
+            self.codes[email] = record
+            return INVALID
+
+    def pop_expired(self, now=None):
+        now = time.time() if now is None else now
+        expired = []
+        with self._lock:
+            for email in self.expiry_index.pop_due(now, self._is_due):
+                # Stale duplicates of one email can both come due
+                if self.codes.pop(email, None) is not None:
+                    expired.append(email)
+        return expired
+
+    def items(self):
+        return list(self.codes.items())
+
+    def __len__(self):
+        return len(self.codes)
+
+
+class ColumnarCodeStore(CodeStore):
+    """Codes kept as integers in array columns indexed by an email-to-slot map
+
+    Uses a few dozen bytes per code besides the email string itself. Codes
+    must be numeric, they are stored as integers and zero-padded on read.
+    email_column maps slots back to emails for expiry sweeps, and failed
+    guesses are counted in a byte per slot.
+    """
+
+    def __init__(self, code_length=6):
+        self.code_length = code_length
+        self.slots = {}
+        self.email_column = []
+        self.code_column = array('Q')
+        self.expiry_column = array('d')
+        self.attempts_column = array('B')
+        self._free_slots = array('Q')
+        self.expiry_index = ExpiryIndex(typecode='Q')
+        self._lock = threading.Lock()
+
+    def _is_due(self, slot, now):
+        # A freed slot has an infinite deadline
+        return now > self.expiry_column[slot]
+
+    def set(self, email, code, expires_at):
+        value = int(code)
+        with self._lock:
+            slot = self.slots.get(email)
+            if slot is None:
+                if self._free_slots:
+                    slot = self._free_slots.pop()
+                    self.email_column[slot] = email
+                    self.code_column[slot] = value
+                    self.expiry_column[slot] = expires_at
+                    self.attempts_column[slot] = 0
+                else:
+                    slot = len(self.code_column)
+                    self.email_column.append(email)
+                    self.code_column.append(value)
+                    self.expiry_column.append(expires_at)
+                    self.attempts_column.append(0)
+                self.slots[email] = slot
+            else:
+                self.code_column[slot] = value
+                self.expiry_column[slot] = expires_at
+                self.attempts_column[slot] = 0
+            self.expiry_index.push(expires_at, slot)
+
+    def get(self, email):
+        slot = self.slots.get(email)
+        if slot is None:
+            return None
+        return PendingCode(str(self.code_column[slot]).zfill(self.code_length), self.expiry_column[slot],
+                           self.attempts_column[slot])
+
+    def _free(self, slot):
+        self.email_column[slot] = None
+        self.expiry_column[slot] = float('inf')
+        self._free_slots.append(slot)
+
+    def delete(self, email):
+        with self._lock:
+            slot = self.slots.pop(email, None)
+            if slot is None:
+                return False
+            self._free(slot)
+            return True
+
+    def add_failed_attempt(self, email):
+        with self._lock:
+            slot = self.slots.get(email)
+            if slot is None:
+                return 0
+            attempts = min(self.attempts_column[slot] + 1, 255)
+            self.attempts_column[slot] = attempts
+            return attempts
+
+    def verify(self, email, entered_code, now, max_attempts):
+        with self._lock:
+            slot = self.slots.get(email)
+            if slot is None:
+                return MISSING
+            if now > self.expiry_column[slot]:
+                del self.slots[email]
+                self._free(slot)
+                return EXPIRED
+            if codes_match(str(self.code_column[slot]).zfill(self.code_length), entered_code):
+                del self.slots[email]
+                self._free(slot)
+                return VERIFIED
+            attempts = min(self.attempts_column[slot] + 1, 255)
+            self.attempts_column[slot] = attempts
+            if attempts >= max_attempts:
+                del self.slots[email]
+                self._free(slot)
+                return EXHAUSTED
+            return INVALID
+
+    def pop_expired(self, now=None):
+        now = time.time() if now is None else now
+        expired = []
+        with self._lock:
+            for slot in self.expiry_index.pop_due(now, self._is_due):
+                email = self.email_column[slot]
+                # Stale duplicates of one slot can both come due
+                if email is None:
+                    continue
+                del self.slots[email]
+                self._free(slot)
+                expired.append(email)
+        return expired
+
+    def items(self):
+        return [(email, self.get(email)) for email in list(self.slots)]
+
+    def __len__(self):
+        return len(self.slots)
+
+
+class SQLiteCodeStore(CodeStore):
+    """Codes kept in a SQLite file shared by the worker processes on one host"""
+
+    shared = True
+
+    def __init__(self, path='verification_codes.db', timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS verification_codes ("
+            "email TEXT PRIMARY KEY, code TEXT NOT NULL, expires_at REAL NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(verification_codes)")]
+        if 'attempts' not in columns:
+            # Files created before attempts were counted
+            connection.execute("ALTER TABLE verification_codes ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS verification_codes_expires_at "
+            "ON verification_codes (expires_at)"
+        )
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Backend modules are imported by the store that uses them, not by every process
+            import sqlite3
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def set(self, email, code, expires_at):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO verification_codes (email, code, expires_at) VALUES (?, ?, ?)",
+            (email, code, expires_at)
+        )
+
+    def get(self, email):
+        row = self._connection().execute(
+            "SELECT code, expires_at, attempts FROM verification_codes WHERE email = ?", (email,)
+        ).fetchone()
+        if row is None:
+            return None
+        return PendingCode(row[0], row[1], row[2])
+
+    def delete(self, email):
+        cursor = self._connection().execute(
+            "DELETE FROM verification_codes WHERE email = ?", (email,)
+        )
+        return cursor.rowcount > 0
+
+    def add_failed_attempt(self, email):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "UPDATE verification_codes SET attempts = attempts + 1 WHERE email = ?", (email,)
+            )
+            row = connection.execute(
+                "SELECT attempts FROM verification_codes WHERE email = ?", (email,)
+            ).fetchone()
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return 0 if row is None else row[0]
+
+    def pop_expired(self, now=None):
+        now = time.time() if now is None else now
+        connection = self._connection()
+        # One write transaction so the select and delete see the same rows
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                "SELECT email FROM verification_codes WHERE expires_at < ?", (now,)
+            ).fetchall()
+            connection.execute("DELETE FROM verification_codes WHERE expires_at < ?", (now,))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return [row[0] for row in rows]
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM verification_codes").fetchone()[0]
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+class RedisError(Exception):
+    """Error reply from a Redis-protocol server"""
+
+
+class RedisClient:
+    """Minimal RESP client for the handful of commands the code store needs"""
+
+    def __init__(self, host='127.0.0.1', port=6379, db=0, password=None, timeout=5.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        import socket
+        self._sock = socket.create_connection((self.host, self.port), self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile('rb')
+        if self.password:
+            self._call('AUTH', self.password)
+        if self.db:
+            self._call('SELECT', self.db)
+
+    def _read_reply(self):
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise RedisError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._file.read(length + 2)
+            return data[:-2].decode()
+        if kind == b'*':
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    def _call(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = str(arg).encode()
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        self._sock.sendall(b''.join(parts))
+        return self._read_reply()
+
+    def execute(self, *args):
+        """Run one command, reconnecting once if the connection dropped"""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._call(*args)
+                except (ConnectionError, OSError):
+                    self.close()
+                    if attempt:
+                        raise
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._file = None
+
+
+class RedisCodeStore(CodeStore):
+    """Codes kept in Redis (or any Redis-protocol server) with native key expiry
+
+    Failed guesses are counted under a separate key per issued code, so
+    issuing a new code starts from zero without an extra round trip.
+    Records returned by get() therefore report no attempts.
+    """
+
+    shared = True
+
+    def __init__(self, client, prefix='verification:'):
+        self.client = client
+        self.prefix = prefix
+        self.attempts_prefix = prefix.rstrip(':') + '-attempts:'
+
+    @classmethod
+    def from_url(cls, url, prefix='verification:'):
+        from urllib.parse import urlparse
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip('/') or 0)
+        client = RedisClient(parsed.hostname or '127.0.0.1', parsed.port or 6379, db, parsed.password)
+        return cls(client, prefix)
+
+    def set(self, email, code, expires_at):
+        ttl_ms = max(1, int((expires_at - time.time()) * 1000))
+        self.client.execute('SET', self.prefix + email, f"{code}|{expires_at!r}", 'PX', ttl_ms)
+
+    def get(self, email):
+        value = self.client.execute('GET', self.prefix + email)
+        if value is None:
+            return None
+        code, _, expires_at = value.partition('|')
+        return PendingCode(code, float(expires_at))
+
+    def delete(self, email):
+        return self.client.execute('DEL', self.prefix + email) > 0
+
+    def _count_failure(self, email, record):
+        key = f"{self.attempts_prefix}{email}|{record.code}|{record.expires_at!r}"
+        attempts = self.client.execute('INCR', key)
+        if attempts == 1:
+            # The counter goes away with the code it belongs to
+            ttl_ms = max(1, int((record.expires_at - time.time()) * 1000))
+            self.client.execute('PEXPIRE', key, ttl_ms)
+        return attempts
+
+    def add_failed_attempt(self, email):
+        record = self.get(email)
+        if record is None:
+            return 0
+        return self._count_failure(email, record)
+
+    def verify(self, email, entered_code, now, max_attempts):
+        record = self.get(email)
+        if record is None:
+            return MISSING
+        if now > record.expires_at:
+            self.delete(email)
+            return EXPIRED
+        if codes_match(record.code, entered_code):
+            return VERIFIED if self.delete(email) else MISSING
+        if self._count_failure(email, record) >= max_attempts:
+            self.delete(email)
+            return EXHAUSTED
+        return INVALID
+
+    def pop_expired(self, now=None):
+        # Redis evicts expired keys on its own
+        return []
+
+    def __len__(self):
+        count = 0
+        cursor = '0'
+        while True:
+            cursor, keys = self.client.execute('SCAN', cursor, 'MATCH', self.prefix + '*', 'COUNT', 1000)
+            count += len(keys)
+            if cursor == '0':
+                return count
+
+    def close(self):
+        self.client.close()
+
+
+class LRUCachedCodeStore(CodeStore):
+    """Bounded read-through LRU cache in front of a shared store
+
+    Cached entries live for at most ttl seconds so codes consumed by another
+    worker are not served for long. Consuming a code always goes through the
+    shared store, whose delete decides which worker wins.
+    """
+
+    shared = True
+
+    def __init__(self, backend, max_entries=10000, ttl=1.0):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, email, record):
+        with self._lock:
+            self._entries[email] = (record, time.monotonic() + self.ttl)
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set(self, email, code, expires_at):
+        self.backend.set(email, code, expires_at)
+        self._remember(email, PendingCode(code, expires_at))
+
+    def get(self, email):
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(email)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        record = self.backend.get(email)
+        if record is not None:
+            self._remember(email, record)
+        return record
+
+    def delete(self, email):
+        with self._lock:
+            self._entries.pop(email, None)
+        return self.backend.delete(email)
+
+    def add_failed_attempt(self, email):
+        with self._lock:
+            self._entries.pop(email, None)
+        return self.backend.add_failed_attempt(email)
+
+    def verify(self, email, entered_code, now, max_attempts):
+        # Checked against the shared store, the cached copy may have been replaced by another worker
+        with self._lock:
+            self._entries.pop(email, None)
+        return self.backend.verify(email, entered_code, now, max_attempts)
+
+    def pop_expired(self, now=None):
+        expired = self.backend.pop_expired(now)
+        with self._lock:
+            for email in expired:
+                self._entries.pop(email, None)
+        return expired
+
+    def __len__(self):
+        return len(self.backend)
+
+    def close(self):
+        self.backend.close()
+
+
+def create_code_store(kind=None, path=None, url=None, cache_size=None, cache_ttl=None, lifetime=600,
+                      code_length=6, numeric=True, settings=None):
+    """Build the code store selected by arguments or the CODE_STORE* settings"""
+    settings = settings or get_settings()
+    kind = (kind or settings.code_store).lower()
+    if kind in ('columnar', 'stateless') and not (numeric and code_length <= 18):
+        raise ValueError(f"CODE_STORE={kind} only supports numeric codes of up to 18 digits")
+    if kind == 'stateless':
+        # Imported here, the stateless module builds on this one
+        from stateless_codes import StatelessCodeStore
+        return StatelessCodeStore(
+            settings.code_secret,
+            digits=code_length,
+            lifetime=lifetime,
+            step=settings.code_step
+        )
+    if kind in ('memory', 'columnar'):
+        store = MemoryCodeStore() if kind == 'memory' else ColumnarCodeStore(code_length)
+        journal_dir = settings.code_journal_dir
+        if journal_dir:
+            # Imported here, the journal module builds on this one
+            from code_journal import CodeJournal, JournaledCodeStore
+            journal = CodeJournal(
+                journal_dir,
+                fsync=settings.code_journal_fsync,
+                snapshot_every=settings.code_journal_snapshot_every
+            )
+            store = JournaledCodeStore(store, journal)
+        return store
+
+    if kind == 'sqlite':
+        store = SQLiteCodeStore(path or settings.code_store_path)
+    elif kind == 'redis':
+        store = RedisCodeStore.from_url(url or settings.redis_url)
+    else:
+        raise ValueError(f"Unknown code store: {kind}")
+
+    if cache_size is None:
+        cache_size = settings.code_cache_size
+    if cache_size > 0:
+        if cache_ttl is None:
+            cache_ttl = settings.code_cache_ttl
+        store = LRUCachedCodeStore(store, cache_size, cache_ttl)
+    return store
@@ -1,165 +1,260 @@
-import smtplib
-import random
-import string
-from datetime import datetime, timedelta
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import os
-from dotenv import load_dotenv
+from datetime import datetime
+import queue
+import threading
+import time
+from code_generator import CodeGenerator
+from code_store import EXHAUSTED, EXPIRED, INVALID, MISSING, VERIFIED, create_code_store
+from email_templates import TemplateRegistry
+from metrics import METRICS
+from mime_cache import MessageCache
+from rate_limit import DeliveryRateLimiter, DomainScheduler, parse_rate_overrides, recipient_domain
+from retry_scheduler import CANCELLED, TRANSIENT, DeadLetterStore, RetryScheduler, classify_smtp_error
+from send_queue import SendQueue
+from send_throttle import SendThrottle
+from service_log import configure_logging, get_logger, log_sampled
+from settings import get_settings
+from verify_lockout import VerifyLockout
+
+log = get_logger('service')
+
+VERIFY_FAILURE_MESSAGES = {
+    MISSING: "No verification code found for this email",
+    EXPIRED: "Verification code has expired",
+    INVALID: "Invalid verification code",
+    EXHAUSTED: "Too many failed attempts, please request a new code",
+}
 
 class EmailVerificationService:
-    def __init__(self):
-        # Load environment variables
-        load_dotenv()
+    def __init__(self, settings=None):
+        # Configuration parsed once per process from .env and the environment
+        settings = self.settings = settings or get_settings()
         
-        self.sender_email = os.getenv('SENDER_EMAIL')
-        self.sender_password = os.getenv('SENDER_PASSWORD')
-        self.smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
-        self.smtp_port = int(os.getenv('SMTP_PORT', 587))
-        self.app_name = os.getenv('APP_NAME', 'Email Verification Service')
+        # Leveled logging through a background thread (LOG_LEVEL, LOG_FORMAT, LOG_FILE, ...)
+        configure_logging(settings=settings)
         
-        # Store verification codes with expiration times
-        self.verification_codes = {}
-    
-    def generate_verification_code(self):
-        """Generate a 6-digit verification code"""
-        return ''.join(random.choices(string.digits, k=6))
-    
-    def create_email_content(self, recipient_email, verification_code):
-        """Create the email content with the verification code"""
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body {{
-                    font-family: Arial, sans-serif;
-                    background-color: #f4f4f4;
-                    margin: 0;
-                    padding: 20px;
-                }}
-                .container {{
-                    max-width: 600px;
-                    margin: 0 auto;
-                    background-color: white;
-                    padding: 30px;
-                    border-radius: 10px;
-                    box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-                }}
-                .header {{
-                    text-align: center;
-                    margin-bottom: 30px;
-                }}
-                .code-box {{
-                    background-color: #f8f9fa;
-                    border: 2px dashed #007bff;
-                    border-radius: 8px;
-                    padding: 20px;
-                    text-align: center;
-                    margin: 20px 0;
-                }}
-                .verification-code {{
-                    font-size: 32px;
-                    font-weight: bold;
-                    color: #007bff;
-                    letter-spacing: 5px;
-                    margin: 10px 0;
-                }}
-                .footer {{
-                    margin-top: 30px;
-                    text-align: center;
-                    color: #666;
-                    font-size: 14px;
-                }}
-                .warning {{
-                    background-color: #fff3cd;
-                    border: 1px solid #ffeaa7;
-                    color: #856404;
-                    padding: 15px;
-                    border-radius: 5px;
-                    margin: 20px 0;
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1 style="color: #333;">Email Verification</h1>
-                    <h2 style="color: #666;">{self.app_name}</h2>
-                </div>
-                
-                <p>Hello,</p>
-                <p>You have requested email verification. Please use the following 6-digit code to complete your verification:</p>
-                
-                <div class="code-box">
-                    <p style="margin: 0; color: #333;">Your verification code is:</p>
-                    <div class="verification-code">{verification_code}</div>
-                </div>
-                
-                <div class="warning">
-                    <strong>⚠️ Important:</strong> This code will expire in 10 minutes for security reasons.
-                </div>
-                
-                <p>If you didn't request this verification, please ignore this email.</p>
-                
-                <div class="footer">
-                    <p>This is an automated message from {self.app_name}</p>
-                    <p>Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        # Stage timings and event counters (METRICS_ENABLED=false makes them no-ops)
+        METRICS.set_enabled(settings.metrics_enabled)
         
-        text_content = f"""
-        Email Verification - {self.app_name}
+        self.sender_email = settings.sender_email
+        self.sender_password = settings.sender_password
+        self.smtp_server = settings.smtp_server
+        self.smtp_port = settings.smtp_port
+        self.app_name = settings.app_name
+        self.smtp_use_tls = settings.smtp_use_tls
         
-        Hello,
+        # SMTP connection pool settings
+        self.smtp_pool_size = settings.smtp_pool_size
+        self.smtp_pool_idle_timeout = settings.smtp_pool_idle_timeout
+        self._smtp_pool = None
+        self._smtp_pool_key = None
         
-        You have requested email verification. Please use the following 6-digit code to complete your verification:
+        # Delivery pacing per recipient domain and sender account (a rate of 0 disables)
+        self.rate_limiter = DeliveryRateLimiter(
+            domain_rate=settings.send_rate_per_domain,
+            domain_burst=settings.send_burst_per_domain,
+            sender_rate=settings.send_rate_per_sender,
+            sender_burst=settings.send_burst_per_sender,
+            domain_overrides=parse_rate_overrides(settings.send_domain_limits),
+            max_in_flight=settings.send_domain_concurrency
+        )
         
-        Verification Code: {verification_code}
+        # Abuse protection: sends allowed per recipient and per source within RESEND_WINDOW seconds
+        self.send_throttle = SendThrottle(
+            recipient_limit=settings.resend_limit_per_recipient,
+            source_limit=settings.resend_limit_per_source,
+            window=settings.resend_window,
+            max_keys=settings.resend_max_tracked
+        )
         
-        ⚠️ Important: This code will expire in 10 minutes for security reasons.
+        # Brute-force protection: guesses per code and a decaying lockout per email
+        self.verify_max_attempts = settings.verify_max_attempts
+        self.verify_lockout = VerifyLockout(
+            threshold=settings.verify_lockout_threshold,
+            half_life=settings.verify_lockout_half_life
+        )
         
-        If you didn't request this verification, please ignore this email.
+        # Retries of transient send failures (1 attempt disables retrying)
+        self.send_retry_attempts = settings.send_retry_attempts
+        self.send_retry_base_delay = settings.send_retry_base_delay
+        self.send_retry_max_delay = settings.send_retry_max_delay
+        self.dead_letters = DeadLetterStore(path=settings.dead_letter_file)
+        self._retry_scheduler = None
+        self._retry_listeners = []
         
-        This is an automated message from {self.app_name}
-        Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-        """
+        # Background send queue settings
+        self.send_queue_workers = settings.send_queue_workers or self.smtp_pool_size
+        self.send_queue_size = settings.send_queue_size
+        self.send_queue_timeout = settings.send_queue_timeout
+        self._send_queue = None
+        self._send_queue_lock = threading.Lock()
         
-        return html_content, text_content
+        # Email templates, optionally loaded from TEMPLATE_DIR/<locale>/
+        self.templates = TemplateRegistry(
+            settings.template_dir,
+            default_locale=settings.default_locale,
+            reload_interval=settings.template_reload_interval
+        )
+        self.message_cache = MessageCache()
+        self._timestamp_second = None
+        self._timestamp_text = ''
+        
+        # Codes drawn from the OS CSPRNG, CODE_LENGTH characters of CODE_ALPHABET
+        self.code_generator = CodeGenerator(
+            length=settings.code_length,
+            alphabet=settings.code_alphabet or '0123456789'
+        )
+        
+        # Store verification codes with expiration times (CODE_STORE selects the backend)
+        self.code_lifetime = settings.code_lifetime
+        self.code_store = create_code_store(
+            settings=settings,
+            lifetime=self.code_lifetime,
+            code_length=self.code_generator.length,
+            numeric=self.code_generator.numeric
+        )
+        
+        # Background sweep of expired codes (0 disables it)
+        self.cleanup_interval = settings.cleanup_interval
+        self._cleanup_stop = threading.Event()
+        self._cleanup_thread = None
+        if self.cleanup_interval > 0:
+            self.start_cleanup_thread()
+    
+    def get_smtp_pool(self):
+        """Get the SMTP pool, rebuilding it if the SMTP settings changed"""
+        key = (self.smtp_server, self.smtp_port, self.sender_email, self.sender_password)
+        if self._smtp_pool is None or self._smtp_pool_key != key:
+            if self._smtp_pool is not None:
+                self._smtp_pool.close()
+            # Imported on first use, smtplib pulls in ssl and the email package
+            from smtp_pool import SMTPConnectionPool
+            self._smtp_pool = SMTPConnectionPool(
+                self.smtp_server,
+                self.smtp_port,
+                self.sender_email,
+                self.sender_password,
+                max_size=self.smtp_pool_size,
+                idle_timeout=self.smtp_pool_idle_timeout,
+                use_tls=self.smtp_use_tls
+            )
+            self._smtp_pool_key = key
+        return self._smtp_pool
     
-    def send_verification_email(self, recipient_email, custom_message=""):
-        """Send verification email to the recipient"""
+    def send_message(self, message):
+        """Send a message over a pooled SMTP session"""
+        import smtplib
+        pool = self.get_smtp_pool()
         try:
-            # Generate verification code
+            with pool.connection() as server, METRICS.timer('smtp_data'):
+                server.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped a reused session, retry once on a fresh one
+            with pool.connection() as server, METRICS.timer('smtp_data'):
+                server.send_message(message)
+        METRICS.inc('sent')
+    
+    def send_message_bytes(self, recipient_email, message_bytes, paced=True):
+        """Send pre-encoded message bytes over a pooled SMTP session
+        
+        Waits for the rate limiter unless the caller already holds a slot.
+        """
+        if paced:
+            with self.rate_limiter.slot(recipient_domain(recipient_email), self.sender_email):
+                self.send_message_bytes(recipient_email, message_bytes, paced=False)
+            return
+        import smtplib
+        pool = self.get_smtp_pool()
+        try:
+            with pool.connection() as server, METRICS.timer('smtp_data'):
+                server.sendmail(self.sender_email, [recipient_email], message_bytes)
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped a reused session, retry once on a fresh one
+            with pool.connection() as server, METRICS.timer('smtp_data'):
+                server.sendmail(self.sender_email, [recipient_email], message_bytes)
+        METRICS.inc('sent')
+    
+    def close(self):
+        """Drain the send queue, stop the cleanup thread, close the code store and SMTP sessions"""
+        if self._send_queue is not None:
+            self._send_queue.stop()
+            self._send_queue = None
+        if self._retry_scheduler is not None:
+            self._retry_scheduler.stop()
+            self._retry_scheduler = None
+        self.stop_cleanup_thread()
+        self.code_store.close()
+        if self._smtp_pool is not None:
+            self._smtp_pool.close()
+            self._smtp_pool = None
+            self._smtp_pool_key = None
+    
+    def generate_verification_code(self):
+        """Generate a verification code from the operating system CSPRNG"""
+        with METRICS.timer('code_generation'):
+            return self.code_generator.generate()
+    
+    def generate_verification_codes(self, count):
+        """Generate count verification codes in one go, for bulk sends"""
+        if self.code_store.stateless:
+            # Stateless codes are derived per email when issued
+            return []
+        with METRICS.timer('code_generation'):
+            return self.code_generator.generate_batch(count)
+    
+    def _timestamp(self):
+        """Current time formatted for the email footer, cached per second"""
+        now = int(time.time())
+        if now != self._timestamp_second:
+            self._timestamp_second = now
+            self._timestamp_text = datetime.fromtimestamp(now).strftime('%Y-%m-%d %H:%M:%S')
+        return self._timestamp_text
+    
+    def get_templates(self, locale=None):
+        """Get the precompiled templates for a locale with the app name filled in"""
+        return self.templates.get_bound(locale, self.app_name)
+    
+    def create_email_content(self, recipient_email, verification_code, custom_message="", locale=None):
+        """Create the email content with the verification code"""
+        _, html_content, text_content = self.get_templates(locale).render(
+            verification_code, self._timestamp(), custom_message
+        )
+        return html_content, text_content
+    
+    def issue_code(self, recipient_email, verification_code=None):
+        """Store a verification code for the recipient, generating one unless given"""
+        if self.code_store.stateless:
+            # The code is derived from the email and time, nothing to store
+            with METRICS.timer('code_generation'):
+                verification_code, expires_at = self.code_store.issue(recipient_email)
+            return verification_code, datetime.fromtimestamp(expires_at)
+        
+        if verification_code is None:
             verification_code = self.generate_verification_code()
-            
-            # Store code with expiration time (10 minutes)
-            expiration_time = datetime.now() + timedelta(minutes=10)
-            self.verification_codes[recipient_email] = {
-                'code': verification_code,
-                'expires_at': expiration_time
-            }
-            
-            # Create email content
-            html_content, text_content = self.create_email_content(recipient_email, verification_code)
-            
+        
+        # Store code with expiration time (CODE_LIFETIME, 10 minutes by default)
+        expires_at = time.time() + self.code_lifetime
+        self.code_store.set(recipient_email, verification_code, expires_at)
+        return verification_code, datetime.fromtimestamp(expires_at)
+    
+    def build_message(self, recipient_email, verification_code, custom_message="", locale=None):
+        """Build the MIME message carrying the verification code"""
+        # Create email content
+        with METRICS.timer('template_render'):
+            subject, html_content, text_content = self.get_templates(locale).render(
+                verification_code, self._timestamp(), custom_message
+            )
+        
+        # email.mime is only needed on this path, not for the pre-encoded messages
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+        
+        with METRICS.timer('mime_build'):
             # Create message
             message = MIMEMultipart("alternative")
-            message["Subject"] = f"Email Verification Code - {self.app_name}"
+            message["Subject"] = subject
             message["From"] = self.sender_email
             message["To"] = recipient_email
             
-            # Add custom message if provided
-            if custom_message:
-                text_content = f"{custom_message}\n\n{text_content}"
-                html_content = html_content.replace(
-                    "<p>Hello,</p>", 
-                    f"<p>Hello,</p><p>{custom_message}</p>"
-                )
-            
             # Create text and HTML parts
             text_part = MIMEText(text_content, "plain")
             html_part = MIMEText(html_content, "html")
@@ -167,55 +262,397 @@ class EmailVerificationService:
             # Add parts to message
             message.attach(text_part)
             message.attach(html_part)
+        
+        return message
+    
+    def build_message_bytes(self, recipient_email, verification_code, custom_message="", locale=None):
+        """Build the encoded message from the cached skeleton for its template
+        
+        Rendering and encoding are fused in the skeleton, so template_render
+        times resolving the (possibly reloaded) templates and their skeleton,
+        and mime_build the splicing of this message.
+        """
+        with METRICS.timer('template_render'):
+            skeleton = self.message_cache.get(self.get_templates(locale), self.sender_email)
+        with METRICS.timer('mime_build'):
+            return skeleton.render(recipient_email, verification_code, self._timestamp(), custom_message)
+    
+    def allow_send(self, recipient_email, source=None):
+        """Check the resend limits before any code is issued or SMTP work is done"""
+        if self.send_throttle.allow(recipient_email, source):
+            return True
+        METRICS.inc('throttled')
+        log.warning(f"🚫 Too many verification emails requested for {recipient_email}, try again later",
+                    extra={'event': 'throttled', 'email': recipient_email})
+        return False
+    
+    def send_verification_email(self, recipient_email, custom_message="", locale=None, source=None):
+        """Send verification email to the recipient
+        
+        Returns (True, code) once the email is sent, or when a transient
+        failure was handed to the retry scheduler. Permanent failures and
+        requests over the resend limits return (False, None). source names
+        the requester, e.g. a client address, for the per-source limit.
+        """
+        if not self.allow_send(recipient_email, source):
+            return False, None
+        return self.deliver_verification_email(recipient_email, custom_message, locale)
+    
+    def deliver_verification_email(self, recipient_email, custom_message="", locale=None):
+        """Issue a code and send its email, for callers that already checked allow_send"""
+        result = self.deliver_verification_result(recipient_email, custom_message, locale)
+        return result['success'], result['code']
+    
+    def deliver_verification_result(self, recipient_email, custom_message="", locale=None):
+        """Like deliver_verification_email, but returns a result entry as send_verification_batch does
+        
+        'retrying' marks a transient failure handed to the retry scheduler,
+        whose outcome reaches add_retry_listener() callbacks later. 'error'
+        keeps the failure's text.
+        """
+        try:
+            # Generate verification code
+            verification_code, expiration_time = self.issue_code(recipient_email)
+        except Exception as e:
+            METRICS.inc('failed')
+            log.error(f"❌ Failed to send email: {e}", extra={'event': 'failed', 'email': recipient_email, 'error': str(e)})
+            return {'email': recipient_email, 'success': False, 'code': None, 'error': str(e), 'retrying': False}
+        
+        try:
+            # Create message
+            message_bytes = self.build_message_bytes(recipient_email, verification_code, custom_message, locale)
             
             # Send email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.sender_email, self.sender_password)
-                server.send_message(message)
+            self.send_message_bytes(recipient_email, message_bytes)
             
-            print(f"✅ Verification email sent successfully to {recipient_email}")
-            print(f"📧 Verification code: {verification_code}")
-            print(f"⏰ Code expires at: {expiration_time.strftime('%Y-%m-%d %H:%M:%S')}")
+            # Successes are the high-volume event: formatted on the log thread, and LOG_SUCCESS_SAMPLE keeps a fraction
+            log_sampled(
+                log, "✅ Verification email sent successfully to %s", recipient_email,
+                event='sent', email=recipient_email, code=verification_code, expires_at=expiration_time
+            )
             
-            return True, verification_code
+            return {'email': recipient_email, 'success': True, 'code': verification_code, 'error': None,
+                    'retrying': False}
             
         except Exception as e:
-            print(f"❌ Failed to send email: {str(e)}")
+            log.error(f"❌ Failed to send email: {e}", extra={'event': 'failed', 'email': recipient_email, 'error': str(e)})
+            return self._batch_failure(recipient_email, verification_code, custom_message, locale, e)
+    
+    def add_retry_listener(self, callback):
+        """Call callback(email, code, status, error) once a retried send ends
+        
+        status is 'sent' when a retry got through, 'failed' when the email
+        was dead-lettered or its code was no longer outstanding.
+        """
+        with self._send_queue_lock:
+            self._retry_listeners.append(callback)
+    
+    def remove_retry_listener(self, callback):
+        with self._send_queue_lock:
+            if callback in self._retry_listeners:
+                self._retry_listeners.remove(callback)
+    
+    def _notify_retry(self, recipient_email, verification_code, status, error=None):
+        with self._send_queue_lock:
+            listeners = list(self._retry_listeners)
+        for callback in listeners:
+            try:
+                callback(recipient_email, verification_code, status, error)
+            except Exception as e:
+                log.warning(f"⚠️ Retry listener failed: {e}", extra={'event': 'listener_failed', 'error': str(e)})
+    
+    def get_retry_scheduler(self):
+        """Get the scheduler retrying transient send failures"""
+        with self._send_queue_lock:
+            if self._retry_scheduler is None:
+                self._retry_scheduler = RetryScheduler(
+                    self._retry_send,
+                    max_attempts=self.send_retry_attempts,
+                    base_delay=self.send_retry_base_delay,
+                    max_delay=self.send_retry_max_delay,
+                    dead_letters=self.dead_letters,
+                    on_dead=self._on_dead_letter
+                )
+            return self._retry_scheduler
+    
+    def _code_is_current(self, recipient_email, verification_code):
+        return self.code_store.is_outstanding(recipient_email, verification_code)
+    
+    def revoke_code(self, recipient_email, verification_code):
+        """Delete a code whose email never went out, unless it was replaced since"""
+        if self._code_is_current(recipient_email, verification_code):
+            self.code_store.delete(recipient_email)
+    
+    def _retry_send(self, job):
+        recipient_email, verification_code, custom_message, locale = job
+        # Skip codes that were verified, expired or replaced in the meantime
+        if not self._code_is_current(recipient_email, verification_code):
+            self._notify_retry(recipient_email, verification_code, 'failed',
+                               "Code was verified, expired or replaced before the retry")
+            return
+        message_bytes = self.build_message_bytes(recipient_email, verification_code, custom_message, locale)
+        self.send_message_bytes(recipient_email, message_bytes)
+        log_sampled(log, "✅ Verification email sent successfully to %s after retrying", recipient_email,
+                    event='sent', email=recipient_email)
+        self._notify_retry(recipient_email, verification_code, 'sent')
+    
+    def _on_dead_letter(self, job, entry):
+        recipient_email, verification_code = job[0], job[1]
+        # The email never went out, its code must not stay valid
+        self.revoke_code(recipient_email, verification_code)
+        METRICS.inc('failed')
+        log.error(f"❌ Gave up on email to {recipient_email} after {entry['attempts']} attempt(s): {entry['error']}",
+                  extra={'event': 'dead_letter', 'email': recipient_email, 'attempts': entry['attempts'],
+                         'error': entry['error']})
+        if entry['attempts'] > 1 or entry['classification'] == CANCELLED:
+            # Only sends reported as retrying, a first failure is reported to the caller directly
+            self._notify_retry(recipient_email, verification_code, 'failed', entry['error'])
+    
+    def handle_send_failure(self, recipient_email, verification_code, custom_message, locale, error):
+        """Schedule a retry for transient failures, otherwise drop the code
+        
+        Returns True when the email will be retried in the background.
+        """
+        classification = classify_smtp_error(error)
+        scheduler = self.get_retry_scheduler()
+        job = (recipient_email, verification_code, custom_message, locale)
+        if classification == TRANSIENT and self.send_retry_attempts > 1:
+            if scheduler.schedule(job, recipient_email):
+                METRICS.inc('retried')
+                log.warning(f"⏳ Sending to {recipient_email} failed ({error}), retrying in the background",
+                            extra={'event': 'retrying', 'email': recipient_email, 'error': str(error)})
+                return True
+        scheduler.fail(job, recipient_email, error, 1, classification)
+        return False
+    
+    def metrics(self):
+        """Counters of the service and of the parts that have been started"""
+        metrics = {
+            'dead_letters': len(self.dead_letters),
+            'rate_limiter': self.rate_limiter.metrics(),
+            'send_throttle': self.send_throttle.metrics(),
+            'verify_lockout': self.verify_lockout.metrics(),
+            'instrumentation': METRICS.snapshot(),
+        }
+        if self._smtp_pool is not None:
+            metrics['smtp_pool'] = self._smtp_pool.stats()
+        if self._retry_scheduler is not None:
+            metrics['retry'] = self._retry_scheduler.metrics()
+        if self._send_queue is not None:
+            metrics['send_queue'] = self._send_queue.metrics()
+        return metrics
+    
+    def get_send_queue(self):
+        """Get the background send queue, starting its workers on first use"""
+        with self._send_queue_lock:
+            if self._send_queue is None:
+                self._send_queue = SendQueue(self, self.send_queue_workers, self.send_queue_size)
+                self._send_queue.start()
+            return self._send_queue
+    
+    def enqueue_verification_email(self, recipient_email, custom_message="", locale=None, source=None):
+        """Issue a code and queue its email for a background worker
+        
+        Returns (True, code) without waiting for SMTP, or (False, None) when
+        the request is over the resend limits or the queue stays full for
+        SEND_QUEUE_TIMEOUT seconds.
+        """
+        if not self.allow_send(recipient_email, source):
+            return False, None
+        send_queue = self.get_send_queue()
+        verification_code, _ = self.issue_code(recipient_email)
+        try:
+            send_queue.enqueue(recipient_email, verification_code, custom_message, locale,
+                               timeout=self.send_queue_timeout)
+        except queue.Full:
+            self.code_store.delete(recipient_email)
+            log.error(f"❌ Send queue full, could not queue email to {recipient_email}",
+                      extra={'event': 'queue_full', 'email': recipient_email})
             return False, None
+        return True, verification_code
     
-    def verify_code(self, email, entered_code):
-        """Verify if the entered code is correct and not expired"""
-        if email not in self.verification_codes:
-            return False, "No verification code found for this email"
+    def send_verification_batch(self, recipients, custom_message="", locale=None, source=None):
+        """Send verification emails to many recipients over shared SMTP sessions
+        
+        recipients is an iterable of email addresses or (email, custom_message)
+        pairs. Returns one result dict per recipient, in input order, with
+        'email', 'success', 'code', 'error' and 'retrying' keys. A failing
+        recipient does not stop the batch, and transient failures are retried
+        in the background. When the SMTP server cannot be reached, the
+        remaining recipients fail without dialing again. Recipients are sent
+        round-robin across their domains at the pace the rate limiter allows.
+        Recipients over the resend limits are rejected up front.
+        """
+        import smtplib
+        recipients = list(recipients)
+        results = [None] * len(recipients)
+        pool = self.get_smtp_pool()
+        pending = DomainScheduler(lambda domain: self.rate_limiter.reserve(domain, self.sender_email))
+        for index, entry in enumerate(recipients):
+            email = entry if isinstance(entry, str) else entry[0]
+            if not self.allow_send(email, source):
+                results[index] = {'email': email, 'success': False, 'code': None,
+                                  'error': "Too many verification emails requested", 'retrying': False}
+                continue
+            pending.put(recipient_domain(email), (index, entry))
+        pending.put_control(None)
+        # Codes for the whole batch, drawn from one entropy read
+        codes = iter(self.generate_verification_codes(pending.qsize() - 1))
+        current = None
+        reconnects = 0
+        unreachable = None
+        
+        while True:
+            connected = False
+            try:
+                with pool.connection() as server:
+                    connected = True
+                    while True:
+                        if current is None:
+                            current = pending.get()[1]
+                            reconnects = 0
+                            if current is None:
+                                break
+                        
+                        index, entry = current
+                        email, message_text = (entry, custom_message) if isinstance(entry, str) else entry
+                        
+                        code = None
+                        try:
+                            code, _ = self.issue_code(email, next(codes, None))
+                            message_bytes = self.build_message_bytes(email, code, message_text, locale)
+                            with METRICS.timer('smtp_data'):
+                                server.sendmail(self.sender_email, [email], message_bytes)
+                        except smtplib.SMTPServerDisconnected:
+                            # Let the pool drop the session, the recipient is retried
+                            self.code_store.delete(email)
+                            raise
+                        except Exception as e:
+                            if isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException):
+                                self.code_store.delete(email)
+                                raise
+                            results[index] = self._batch_failure(email, code, message_text, locale, e)
+                            current = None
+                            try:
+                                server.rset()
+                            except smtplib.SMTPException:
+                                pass
+                            continue
+                        
+                        METRICS.inc('sent')
+                        results[index] = {'email': email, 'success': True, 'code': code, 'error': None,
+                                          'retrying': False}
+                        current = None
+                break
+            except Exception as e:
+                if not connected:
+                    # Connecting failed, every other recipient would dial the same dead server
+                    unreachable = e
+                    break
+                # The session dropped mid-batch
+                if current is None:
+                    if not pending.qsize():
+                        break
+                    current = pending.get()[1]
+                    reconnects = 0
+                    if current is None:
+                        break
+                reconnects += 1
+                if reconnects > 1:
+                    index, entry = current
+                    email, message_text = (entry, custom_message) if isinstance(entry, str) else entry
+                    # Connection failures are transient, hand the recipient to the retry scheduler
+                    try:
+                        code, _ = self.issue_code(email)
+                    except Exception:
+                        code = None
+                    results[index] = self._batch_failure(email, code, message_text, locale, e)
+                    current = None
         
-        stored_data = self.verification_codes[email]
+        if unreachable is not None:
+            remaining = pending.drain()
+            if current is not None:
+                remaining.append(current)
+            log.error(f"❌ Could not connect to the SMTP server, {len(remaining)} batch recipients not sent: {unreachable}",
+                      extra={'event': 'failed', 'count': len(remaining), 'error': str(unreachable)})
+            for index, entry in remaining:
+                METRICS.inc('failed')
+                results[index] = {'email': entry if isinstance(entry, str) else entry[0], 'success': False,
+                                  'code': None, 'error': str(unreachable), 'retrying': False}
         
-        # Check if code is expired
-        if datetime.now() > stored_data['expires_at']:
-            del self.verification_codes[email]
-            return False, "Verification code has expired"
+        sent = sum(1 for result in results if result['success'] and not result['retrying'])
+        retrying = sum(1 for result in results if result['retrying'])
+        log.info(f"📦 Batch finished: {sent} sent, {retrying} retrying, {len(results) - sent - retrying} failed",
+                 extra={'event': 'batch', 'count': len(results)})
+        return results
+    
+    def _batch_failure(self, email, code, custom_message, locale, error):
+        """Result entry for a failed batch recipient, retrying it when the error is transient"""
+        if code is None:
+            # No code was issued, so no retry or dead letter records the failure
+            METRICS.inc('failed')
+        elif self.handle_send_failure(email, code, custom_message, locale, error):
+            return {'email': email, 'success': True, 'code': code, 'error': str(error), 'retrying': True}
+        return {'email': email, 'success': False, 'code': None, 'error': str(error), 'retrying': False}
+    
+    def verify_code(self, email, entered_code):
+        """Verify if the entered code is correct and not expired
         
-        # Check if code matches
-        if stored_data['code'] == entered_code:
-            del self.verification_codes[email]
+        A code is dropped after VERIFY_MAX_ATTEMPTS wrong guesses, and
+        emails that keep failing are locked out for a while.
+        """
+        with METRICS.timer('verify'):
+            now = time.time()
+            if self.verify_lockout.is_locked(email, now):
+                METRICS.inc('locked_out')
+                return False, "Too many failed attempts, please try again later"
+            
+            status = self.code_store.verify(email, entered_code, now, self.verify_max_attempts)
+        # Statuses name their counters: verified, invalid, expired, missing, exhausted
+        METRICS.inc(status)
+        if status is VERIFIED:
+            self.verify_lockout.clear(email)
             return True, "Verification successful"
-        else:
-            return False, "Invalid verification code"
+        if status is INVALID or status is EXHAUSTED:
+            self.verify_lockout.record_failure(email, now)
+        return False, VERIFY_FAILURE_MESSAGES[status]
     
     def cleanup_expired_codes(self):
         """Remove expired verification codes"""
-        current_time = datetime.now()
-        expired_emails = [
-            email for email, data in self.verification_codes.items()
-            if current_time > data['expires_at']
-        ]
-        
-        for email in expired_emails:
-            del self.verification_codes[email]
+        with METRICS.timer('expiry_sweep'):
+            expired_emails = self.code_store.pop_expired(time.time())
+        METRICS.inc('expired_swept', len(expired_emails))
         
         if expired_emails:
-            print(f"🧹 Cleaned up {len(expired_emails)} expired codes")
+            log.info(f"🧹 Cleaned up {len(expired_emails)} expired codes",
+                     extra={'event': 'expired_swept', 'count': len(expired_emails)})
+        return len(expired_emails)
+    
+    def start_cleanup_thread(self, interval=None):
+        """Sweep expired codes on a background thread every interval seconds"""
+        if interval is not None:
+            self.cleanup_interval = interval
+        if self._cleanup_thread is not None and self._cleanup_thread.is_alive():
+            return
+        
+        self._cleanup_stop.clear()
+        
+        def sweep():
+            while not self._cleanup_stop.wait(self.cleanup_interval):
+                try:
+                    self.cleanup_expired_codes()
+                except Exception as e:
+                    log.warning(f"⚠️ Cleanup failed: {e}", extra={'event': 'cleanup_failed', 'error': str(e)})
+        
+        self._cleanup_thread = threading.Thread(target=sweep, name="code-cleanup", daemon=True)
+        self._cleanup_thread.start()
+    
+    def stop_cleanup_thread(self):
+        """Stop the background sweep"""
+        self._cleanup_stop.set()
+        if self._cleanup_thread is not None:
+            self._cleanup_thread.join()
+            self._cleanup_thread = None
 
 if __name__ == "__main__":
     # Example usage
@@ -0,0 +1,307 @@
+import html
+import os
+import re
+import threading
+import time
+
+PLACEHOLDER_PATTERN = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+# Locale names that may become a directory name, e.g. en, pt-BR or zh_Hant
+LOCALE_PATTERN = re.compile(r'[A-Za-z]{2,3}([_-][A-Za-z0-9]{2,8})?')
+
+# Locale directory lookups remembered at most, the cache is cleared beyond it
+MAX_LOCALE_LOOKUPS = 1000
+
+# File names looked up in each locale directory
+HTML_TEMPLATE_FILE = 'verification.html'
+TEXT_TEMPLATE_FILE = 'verification.txt'
+SUBJECT_TEMPLATE_FILE = 'subject.txt'
+
+DEFAULT_SUBJECT_TEMPLATE = "Email Verification Code - {{app_name}}"
+
+DEFAULT_HTML_TEMPLATE = """
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <style>
+                body {
+                    font-family: Arial, sans-serif;
+                    background-color: #f4f4f4;
+                    margin: 0;
+                    padding: 20px;
+                }
+                .container {
+                    max-width: 600px;
+                    margin: 0 auto;
+                    background-color: white;
+                    padding: 30px;
+                    border-radius: 10px;
+                    box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+                }
+                .header {
+                    text-align: center;
+                    margin-bottom: 30px;
+                }
+                .code-box {
+                    background-color: #f8f9fa;
+                    border: 2px dashed #007bff;
+                    border-radius: 8px;
+                    padding: 20px;
+                    text-align: center;
+                    margin: 20px 0;
+                }
+                .verification-code {
+                    font-size: 32px;
+                    font-weight: bold;
+                    color: #007bff;
+                    letter-spacing: 5px;
+                    margin: 10px 0;
+                }
+                .footer {
+                    margin-top: 30px;
+                    text-align: center;
+                    color: #666;
+                    font-size: 14px;
+                }
+                .warning {
+                    background-color: #fff3cd;
+                    border: 1px solid #ffeaa7;
+                    color: #856404;
+                    padding: 15px;
+                    border-radius: 5px;
+                    margin: 20px 0;
+                }
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <div class="header">
+                    <h1 style="color: #333;">Email Verification</h1>
+                    <h2 style="color: #666;">{{app_name}}</h2>
+                </div>
+                
+                <p>Hello,</p>{{custom_message}}
+                <p>You have requested email verification. Please use the following code to complete your verification:</p>
+                
+                <div class="code-box">
+                    <p style="margin: 0; color: #333;">Your verification code is:</p>
+                    <div class="verification-code">{{code}}</div>
+                </div>
+                
+                <div class="warning">
+                    <strong>⚠️ Important:</strong> This code will expire in 10 minutes for security reasons.
+                </div>
+                
+                <p>If you didn't request this verification, please ignore this email.</p>
+                
+                <div class="footer">
+                    <p>This is an automated message from {{app_name}}</p>
+                    <p>Generated on: {{timestamp}}</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+
+DEFAULT_TEXT_TEMPLATE = """{{custom_message}}
+        Email Verification - {{app_name}}
+        
+        Hello,
+        
+        You have requested email verification. Please use the following code to complete your verification:
+        
+        Verification Code: {{code}}
+        
+        ⚠️ Important: This code will expire in 10 minutes for security reasons.
+        
+        If you didn't request this verification, please ignore this email.
+        
+        This is an automated message from {{app_name}}
+        Generated on: {{timestamp}}
+        """
+
+
+class EmailTemplate:
+    """Template split once into static chunks and {{placeholder}} slots"""
+
+    def __init__(self, source):
+        self.source = source
+        self._chunks = []
+        self._fields = []
+
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(source):
+            self._chunks.append(source[position:match.start()])
+            self._fields.append(match.group(1))
+            position = match.end()
+        self._chunks.append(source[position:])
+
+    @property
+    def fields(self):
+        return tuple(self._fields)
+
+    def bind(self, **values):
+        """Return a copy with some placeholders folded into the static text"""
+        bound = EmailTemplate.__new__(EmailTemplate)
+        bound.source = self.source
+        bound._chunks = [self._chunks[0]]
+        bound._fields = []
+        for field, chunk in zip(self._fields, self._chunks[1:]):
+            if field in values:
+                bound._chunks[-1] += str(values[field]) + chunk
+            else:
+                bound._fields.append(field)
+                bound._chunks.append(chunk)
+        return bound
+
+    def render(self, values):
+        """Splice the values into the precompiled chunks"""
+        chunks = self._chunks
+        parts = [chunks[0]]
+        for field, chunk in zip(self._fields, chunks[1:]):
+            parts.append(values[field])
+            parts.append(chunk)
+        return ''.join(parts)
+
+
+class TemplateSet:
+    """Subject, HTML and text templates for one locale"""
+
+    def __init__(self, subject, html_body, text_body, locale='en'):
+        self.locale = locale
+        self.subject = EmailTemplate(subject)
+        self.html = EmailTemplate(html_body)
+        self.text = EmailTemplate(text_body)
+
+    def bind(self, **values):
+        bound = TemplateSet.__new__(TemplateSet)
+        bound.locale = self.locale
+        bound.subject = self.subject.bind(**values)
+        bound.html = self.html.bind(**values)
+        bound.text = self.text.bind(**values)
+        return bound
+
+    @staticmethod
+    def html_custom_message(custom_message):
+        """Escaped paragraph spliced into the HTML body"""
+        return f"<p>{html.escape(custom_message)}</p>"
+
+    @staticmethod
+    def text_custom_message(custom_message):
+        """Lead paragraph spliced into the text body"""
+        return f"{custom_message}\n\n"
+
+    def render(self, code, timestamp, custom_message=""):
+        """Render (subject, html_content, text_content) for one message"""
+        values = {'code': code, 'timestamp': timestamp, 'custom_message': ''}
+        subject = self.subject.render(values)
+
+        if custom_message:
+            values['custom_message'] = self.html_custom_message(custom_message)
+        html_content = self.html.render(values)
+
+        if custom_message:
+            values['custom_message'] = self.text_custom_message(custom_message)
+        text_content = self.text.render(values)
+
+        return subject, html_content, text_content
+
+
+class TemplateRegistry:
+    """Loads template sets per locale from a directory, reloading edited files"""
+
+    def __init__(self, directory=None, default_locale='en', reload_interval=2.0):
+        self.directory = directory
+        self.default_locale = default_locale
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        # locale -> (template set, file mtimes, last check time)
+        self._cache = {}
+        # (locale, app_name) -> template set with app_name folded in
+        self._bound = {}
+        # locale -> (directory exists, last check time), misses included
+        self._exists = {}
+
+    def _paths(self, locale):
+        base = os.path.join(self.directory, locale)
+        return [os.path.join(base, name) for name in
+                (SUBJECT_TEMPLATE_FILE, HTML_TEMPLATE_FILE, TEXT_TEMPLATE_FILE)]
+
+    @staticmethod
+    def _mtimes(paths):
+        mtimes = []
+        for path in paths:
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def _load(self, locale, paths):
+        """Read a locale from disk, falling back to built-in templates per file"""
+        defaults = (DEFAULT_SUBJECT_TEMPLATE, DEFAULT_HTML_TEMPLATE, DEFAULT_TEXT_TEMPLATE)
+        sources = []
+        for path, default in zip(paths, defaults):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    sources.append(f.read())
+            except OSError:
+                sources.append(default)
+        subject = sources[0].strip()
+        return TemplateSet(subject, sources[1], sources[2], locale)
+
+    def _locale_exists(self, locale):
+        """Whether locale names a directory of templates, checked at most every reload_interval"""
+        if not self.directory or not LOCALE_PATTERN.fullmatch(locale):
+            return False
+        now = time.monotonic()
+        entry = self._exists.get(locale)
+        if entry is not None and now - entry[1] < self.reload_interval:
+            return entry[0]
+        exists = os.path.isdir(os.path.join(self.directory, locale))
+        if len(self._exists) >= MAX_LOCALE_LOOKUPS:
+            self._exists.clear()
+        self._exists[locale] = (exists, now)
+        return exists
+
+    def get(self, locale=None):
+        """Return the template set for a locale, or the default locale"""
+        locale = locale or self.default_locale
+        if not self._locale_exists(locale):
+            locale = self.default_locale
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(locale)
+            if entry is not None and now - entry[2] < self.reload_interval:
+                return entry[0]
+
+            if not self.directory:
+                templates = entry[0] if entry else TemplateSet(
+                    DEFAULT_SUBJECT_TEMPLATE, DEFAULT_HTML_TEMPLATE, DEFAULT_TEXT_TEMPLATE, locale)
+                self._cache[locale] = (templates, None, float('inf'))
+                return templates
+
+            paths = self._paths(locale)
+            mtimes = self._mtimes(paths)
+            if entry is not None and entry[1] == mtimes:
+                self._cache[locale] = (entry[0], mtimes, now)
+                return entry[0]
+
+            # New or edited files, recompile and drop stale bound copies
+            templates = self._load(locale, paths)
+            self._cache[locale] = (templates, mtimes, now)
+            for key in [key for key in self._bound if key[0] == locale]:
+                del self._bound[key]
+            return templates
+
+    def get_bound(self, locale=None, app_name=''):
+        """Return the template set with app_name already spliced in"""
+        templates = self.get(locale)
+        key = (templates.locale, app_name)
+        with self._lock:
+            bound = self._bound.get(key)
+            if bound is None or bound[0] is not templates:
+                bound = (templates, templates.bind(app_name=app_name))
+                self._bound[key] = bound
+            return bound[1]
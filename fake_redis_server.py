@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Local Redis-protocol stand-in for development and benchmarking
+Implements the small command subset used by RedisCodeStore, kept in memory
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import threading
+import time
+
+
+class FakeRedisServer:
+    """Asyncio RESP server with GET/SET/DEL/INCR/SCAN and key expiry"""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        # key -> (value, expires_at or None)
+        self.data = {}
+        self.command_count = 0
+        self._server = None
+        self._handlers = {}
+        self._loop = None
+        self._thread = None
+
+    def _lookup(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time():
+            del self.data[key]
+            return None
+        return entry[0]
+
+    @staticmethod
+    def _encode(value):
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, int):
+            return f":{value}\r\n".encode()
+        if isinstance(value, list):
+            return f"*{len(value)}\r\n".encode() + b''.join(FakeRedisServer._encode(v) for v in value)
+        data = value if isinstance(value, bytes) else str(value).encode()
+        return f"${len(data)}\r\n".encode() + data + b"\r\n"
+
+    def _execute(self, args):
+        name = args[0].decode().upper()
+        self.command_count += 1
+
+        if name in ('PING',):
+            return b"+PONG\r\n"
+        if name in ('SELECT', 'AUTH'):
+            return b"+OK\r\n"
+        if name == 'GET':
+            return self._encode(self._lookup(args[1]))
+        if name == 'SET':
+            expires_at = None
+            options = [arg.decode().upper() for arg in args[3:]]
+            for index, option in enumerate(options[:-1]):
+                if option == 'PX':
+                    expires_at = time.time() + int(options[index + 1]) / 1000
+                elif option == 'EX':
+                    expires_at = time.time() + int(options[index + 1])
+            self.data[args[1]] = (args[2], expires_at)
+            return b"+OK\r\n"
+        if name == 'DEL':
+            removed = 0
+            for key in args[1:]:
+                if self._lookup(key) is not None:
+                    del self.data[key]
+                    removed += 1
+            return self._encode(removed)
+        if name == 'INCR':
+            value = int(self._lookup(args[1]) or 0) + 1
+            expires_at = self.data[args[1]][1] if args[1] in self.data else None
+            self.data[args[1]] = (str(value).encode(), expires_at)
+            return self._encode(value)
+        if name == 'PEXPIRE':
+            value = self._lookup(args[1])
+            if value is None:
+                return self._encode(0)
+            self.data[args[1]] = (value, time.time() + int(args[2]) / 1000)
+            return self._encode(1)
+        if name == 'DBSIZE':
+            return self._encode(len(self.data))
+        if name == 'FLUSHDB':
+            self.data.clear()
+            return b"+OK\r\n"
+        if name == 'SCAN':
+            pattern = '*'
+            options = [arg.decode() for arg in args[2:]]
+            for index, option in enumerate(options[:-1]):
+                if option.upper() == 'MATCH':
+                    pattern = options[index + 1]
+            keys = [key for key in list(self.data)
+                    if self._lookup(key) is not None and fnmatch.fnmatchcase(key.decode(), pattern)]
+            return self._encode(["0", keys])
+        return f"-ERR unknown command '{name}'\r\n".encode()
+
+    async def _handle(self, reader, writer):
+        self._handlers[asyncio.current_task()] = writer
+        try:
+            while True:
+                header = await reader.readline()
+                if not header:
+                    break
+                if not header.startswith(b'*'):
+                    args = header.split()
+                else:
+                    args = []
+                    for _ in range(int(header[1:])):
+                        length = int((await reader.readline())[1:])
+                        args.append((await reader.readexactly(length + 2))[:-2])
+                if args:
+                    writer.write(self._execute(args))
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._handlers.pop(asyncio.current_task(), None)
+            writer.close()
+
+    async def start(self):
+        """Start listening on the current event loop"""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        # Disconnect clients that are still connected and let their handlers finish
+        handlers = list(self._handlers.items())
+        for _, writer in handlers:
+            writer.transport.abort()
+        await asyncio.gather(*(task for task, _ in handlers), return_exceptions=True)
+        await self._server.wait_closed()
+
+    @property
+    def url(self):
+        return f"redis://{self.host}:{self.port}/0"
+
+    def start_in_thread(self):
+        """Run the server on its own event loop thread, for blocking clients"""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop_thread(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake Redis server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    args = parser.parse_args()
+
+    async def serve():
+        server = await FakeRedisServer(args.host, args.port).start()
+        print(f"🗄️ Fake Redis server listening on {server.host}:{server.port}")
+        print(f"Use CODE_STORE=redis and REDIS_URL={server.url} to point the service at it")
+        await server._server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("\n👋 Fake Redis server stopped")
+
+
+if __name__ == "__main__":
+    main()
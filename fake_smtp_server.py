@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Local SMTP stand-in for development and benchmarking
+Accepts any login and keeps received messages in memory instead of delivering them
+"""
+
+import argparse
+import asyncio
+import random
+import threading
+import time
+
+ERROR_REPLIES = {
+    4: "4.3.0 Temporary failure, try again later",
+    5: "5.1.1 Mailbox unavailable",
+}
+
+
+class FakeSMTPServer:
+    """Asyncio SMTP sink that records every accepted message
+
+    Can behave like a slow or struggling provider: latency delays the reply
+    to each message and connect_latency the greeting, error_rate answers
+    that fraction of messages with error_code, and rate_limit refuses
+    recipients with 450 beyond that many messages per second (with a burst
+    of rate_burst). seed makes the injected errors repeatable.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, keep_messages=True, latency=0.0, connect_latency=0.0,
+                 error_rate=0.0, error_code=451, rate_limit=0.0, rate_burst=10, seed=None):
+        self.host = host
+        self.port = port
+        self.keep_messages = keep_messages
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self._random = random.Random(seed)
+        # Token bucket of the rate limit, only touched from the event loop
+        self._tokens = float(rate_burst)
+        self._refilled = time.monotonic()
+        self.messages = []
+        self.message_count = 0
+        self.connection_count = 0
+        self.rejected_count = 0
+        self.throttled_count = 0
+        self._server = None
+        self._handlers = {}
+        self._loop = None
+        self._thread = None
+
+    def _take_token(self):
+        """Whether one more message fits in the rate limit"""
+        if self.rate_limit <= 0:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.rate_burst, self._tokens + (now - self._refilled) * self.rate_limit)
+        self._refilled = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    async def _handle(self, reader, writer):
+        self._handlers[asyncio.current_task()] = writer
+        self.connection_count += 1
+
+        def reply(line):
+            writer.write(line.encode('ascii') + b'\r\n')
+
+        if self.connect_latency:
+            await asyncio.sleep(self.connect_latency)
+        reply("220 localhost fake SMTP ready")
+        mail_from = None
+        recipients = []
+        try:
+            while True:
+                raw = await reader.readline()
+                if not raw:
+                    break
+                line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+                verb = line.split(' ', 1)[0].upper()
+
+                if verb in ('EHLO', 'HELO'):
+                    reply("250-localhost")
+                    reply("250-AUTH PLAIN LOGIN")
+                    reply("250-8BITMIME")
+                    reply("250 SIZE 35882577")
+                elif verb == 'AUTH':
+                    if line.upper().startswith('AUTH LOGIN'):
+                        reply("334 VXNlcm5hbWU6")
+                        await writer.drain()
+                        await reader.readline()
+                        reply("334 UGFzc3dvcmQ6")
+                        await writer.drain()
+                        await reader.readline()
+                    reply("235 Authentication successful")
+                elif verb == 'MAIL':
+                    mail_from = line[10:].strip('<> ')
+                    recipients = []
+                    reply("250 OK")
+                elif verb == 'RCPT':
+                    if self._take_token():
+                        recipients.append(line[8:].strip('<> '))
+                        reply("250 OK")
+                    else:
+                        self.throttled_count += 1
+                        reply("450 4.2.1 Rate limit exceeded, try again later")
+                elif verb == 'DATA':
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    chunks = []
+                    while True:
+                        data_line = await reader.readline()
+                        if not data_line or data_line == b'.\r\n':
+                            break
+                        if data_line.startswith(b'..'):
+                            data_line = data_line[1:]
+                        chunks.append(data_line)
+                    if self.latency:
+                        await asyncio.sleep(self.latency)
+                    if self.error_rate and self._random.random() < self.error_rate:
+                        self.rejected_count += 1
+                        reply(f"{self.error_code} {ERROR_REPLIES[self.error_code // 100]}")
+                    else:
+                        self.message_count += 1
+                        if self.keep_messages:
+                            self.messages.append((mail_from, recipients, b''.join(chunks)))
+                        reply("250 OK queued")
+                elif verb in ('RSET', 'NOOP'):
+                    reply("250 OK")
+                elif verb == 'QUIT':
+                    reply("221 Bye")
+                    await writer.drain()
+                    break
+                else:
+                    reply("502 Command not implemented")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._handlers.pop(asyncio.current_task(), None)
+            writer.close()
+
+    async def start(self):
+        """Start listening on the current event loop"""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        # Disconnect clients that are still connected and let their handlers finish
+        handlers = list(self._handlers.items())
+        for _, writer in handlers:
+            writer.transport.abort()
+        await asyncio.gather(*(task for task, _ in handlers), return_exceptions=True)
+        await self._server.wait_closed()
+
+    def start_in_thread(self):
+        """Run the server on its own event loop thread, for blocking clients"""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop_thread(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake SMTP server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1025)
+    parser.add_argument('--latency', type=float, default=0, help="ms before each message is acknowledged")
+    parser.add_argument('--connect-latency', type=float, default=0, help="ms before the greeting")
+    parser.add_argument('--error-rate', type=float, default=0, help="fraction of messages rejected")
+    parser.add_argument('--error-code', type=int, default=451, choices=(451, 550))
+    parser.add_argument('--rate-limit', type=float, default=0, help="messages per second accepted, 0 for no limit")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    async def serve():
+        server = await FakeSMTPServer(
+            args.host, args.port, keep_messages=False,
+            latency=args.latency / 1000, connect_latency=args.connect_latency / 1000,
+            error_rate=args.error_rate, error_code=args.error_code, rate_limit=args.rate_limit, seed=args.seed
+        ).start()
+        print(f"📬 Fake SMTP server listening on {server.host}:{server.port}")
+        print("Use SMTP_SERVER/SMTP_PORT to point the service at it and set SMTP_USE_TLS=false")
+        await server._server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("\n👋 Fake SMTP server stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,26 +16,19 @@ def print_banner():
     print("🎨 Launching with modern UI...")
 
 def check_settings():
-    """Check if settings file exists"""
-    if os.path.exists("app_settings.json"):
-        try:
-            import json
-            with open("app_settings.json", 'r') as f:
-                settings = json.load(f)
-            
-            recent_count = len(settings.get('recent_recipients', []))
-            last_saved = settings.get('last_saved', 'Unknown')
-            
-            print(f"✅ Found saved settings")
-            print(f"📧 Recent recipients: {recent_count}")
-            print(f"💾 Last saved: {last_saved}")
-            return True
-        except:
-            print("⚠️ Settings file found but corrupted")
-            return False
-    else:
+    """Check if settings file exists
+    
+    Only the file's metadata is read, the GUI parses it when it loads.
+    """
+    try:
+        modified = os.path.getmtime("app_settings.json")
+    except OSError:
         print("📝 No saved settings (first run)")
         return False
+    
+    print(f"✅ Found saved settings")
+    print(f"💾 Last saved: {datetime.fromtimestamp(modified).strftime('%Y-%m-%d %H:%M:%S')}")
+    return True
 
 def launch_with_splash():
     """Launch with beautiful splash screen"""
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Load generator and soak test for the email verification service
+Issues codes at a target rate and verifies them the way users do: promptly, late, wrongly or never
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_common import percentile, rss_bytes
+from fake_smtp_server import FakeSMTPServer
+
+# Counters of the metrics registry reported per interval
+OUTCOMES = ('sent', 'failed', 'throttled', 'verified', 'invalid', 'expired', 'missing', 'exhausted', 'locked_out')
+
+ISSUE = 'issue'
+VERIFY = 'verify'
+
+
+def parse_duration(text):
+    """Seconds from '90', '90s', '15m' or '4h'"""
+    text = text.strip().lower()
+    units = {'s': 1, 'm': 60, 'h': 3600}
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def slope_per_hour(points):
+    """Least-squares slope of (seconds, value) points, per hour"""
+    if len(points) < 2:
+        return 0.0
+    mean_t = sum(t for t, _ in points) / len(points)
+    mean_v = sum(v for _, v in points) / len(points)
+    spread = sum((t - mean_t) ** 2 for t, _ in points)
+    if not spread:
+        return 0.0
+    return sum((t - mean_t) * (v - mean_v) for t, v in points) / spread * 3600
+
+
+class UserModel:
+    """How recipients respond to their codes
+
+    never_fraction never verify, late_fraction verify only after the code
+    expired, and wrong_fraction mistype it one to three times first. The
+    rest verify after a log-normal delay around verify_delay seconds.
+    """
+
+    def __init__(self, lifetime, verify_delay=20.0, never_fraction=0.2, late_fraction=0.05,
+                 wrong_fraction=0.1, seed=None):
+        self.lifetime = lifetime
+        self.verify_delay = verify_delay
+        self.never_fraction = never_fraction
+        self.late_fraction = late_fraction
+        self.wrong_fraction = wrong_fraction
+        self.random = random.Random(seed)
+
+    def plan(self, code):
+        """(delay, guess) verify attempts for a freshly issued code"""
+        roll = self.random.random()
+        if roll < self.never_fraction:
+            return []
+        if roll < self.never_fraction + self.late_fraction:
+            return [(self.lifetime * self.random.uniform(1.05, 1.5), code)]
+        # Spread around the median delay, but always within the code's lifetime
+        delay = min(self.random.lognormvariate(math.log(self.verify_delay), 0.8), self.lifetime * 0.9)
+        attempts = []
+        if self.random.random() < self.wrong_fraction:
+            for index in range(self.random.randint(1, 3)):
+                attempts.append((delay * (index + 1) / 4, self.wrong_guess(code)))
+        attempts.append((delay, code))
+        return attempts
+
+    def wrong_guess(self, code):
+        position = self.random.randrange(len(code))
+        replacement = self.random.choice([digit for digit in '0123456789' if digit != code[position]])
+        return code[:position] + replacement + code[position + 1:]
+
+
+class LoadGenerator:
+    """Open-loop load: events run at their scheduled time, however slow the service is
+
+    Latency is measured from when an event was due, so queueing behind a
+    slow service shows up in the tail instead of lowering the offered
+    rate. Events beyond max_in_flight are shed and counted.
+    """
+
+    def __init__(self, service, rate, users, workers=16, population=100000, send=True,
+                 poisson=True, seed=None):
+        self.service = service
+        self.rate = rate
+        self.users = users
+        self.send = send
+        self.poisson = poisson
+        self.population = population
+        self.random = random.Random(seed)
+        self.max_in_flight = workers * 50
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='load')
+
+        self._events = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._issuing = False
+        self._thread = None
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.shed = 0
+        self.errors = 0
+        self._window = {ISSUE: [], VERIFY: []}
+
+    def _schedule(self, due, kind, *args):
+        with self._condition:
+            heapq.heappush(self._events, (due, next(self._sequence), kind, args))
+            self._condition.notify()
+
+    def _next_arrival(self, due):
+        gap = self.random.expovariate(self.rate) if self.poisson else 1 / self.rate
+        return due + gap
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._condition:
+                now = time.monotonic()
+                ready = []
+                while self._events and self._events[0][0] <= now:
+                    ready.append(heapq.heappop(self._events))
+                if not ready:
+                    timeout = self._events[0][0] - now if self._events else 0.1
+                    self._condition.wait(min(timeout, 0.1))
+                    continue
+            for due, _, kind, args in ready:
+                if kind == ISSUE and self._issuing:
+                    self._schedule(self._next_arrival(due), ISSUE)
+                with self._lock:
+                    if self.in_flight >= self.max_in_flight:
+                        self.shed += 1
+                        continue
+                    self.in_flight += 1
+                self.executor.submit(self._execute, due, kind, args)
+
+    def _execute(self, due, kind, args):
+        try:
+            if kind == ISSUE:
+                self._issue()
+            else:
+                self.service.verify_code(*args)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+        finally:
+            elapsed = time.monotonic() - due
+            with self._lock:
+                self.in_flight -= 1
+                self._window[kind].append(elapsed)
+
+    def _issue(self):
+        user = self.random.randrange(self.population)
+        email = f"user{user}@example{user % 50}.com"
+        if self.send:
+            success, code = self.service.send_verification_email(email)
+        else:
+            code, _ = self.service.issue_code(email)
+            success = True
+        if not success or not code:
+            return
+        now = time.monotonic()
+        for delay, guess in self.users.plan(code):
+            self._schedule(now + delay, VERIFY, email, guess)
+
+    def start(self):
+        self._issuing = True
+        self._schedule(time.monotonic(), ISSUE)
+        self._thread = threading.Thread(target=self._run, name='load-scheduler', daemon=True)
+        self._thread.start()
+        return self
+
+    def take_window(self):
+        """Latencies since the last call, with the current backlog"""
+        with self._lock:
+            window, self._window = self._window, {ISSUE: [], VERIFY: []}
+            state = {'in_flight': self.in_flight, 'shed': self.shed, 'errors': self.errors}
+        with self._condition:
+            state['scheduled'] = len(self._events)
+        return window, state
+
+    def stop(self):
+        self._issuing = False
+        self._stop.set()
+        with self._condition:
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class SoakReport:
+    """Samples the service each interval and keeps the time series"""
+
+    def __init__(self, service, generator):
+        self.service = service
+        self.generator = generator
+        self.started = time.monotonic()
+        self.rss_start = rss_bytes()
+        self.samples = []
+        self._counters = {}
+        self._sweeps = (0, 0.0, [])
+
+    def _sweep_delta(self, snapshot):
+        histogram = snapshot['histograms'].get('expiry_sweep')
+        if histogram is None:
+            return 0, 0.0, None
+        count, total, buckets = self._sweeps
+        self._sweeps = (histogram['count'], histogram['sum'], histogram['buckets'])
+        sweeps = histogram['count'] - count
+        if not sweeps:
+            return 0, 0.0, None
+        # Upper bound of the slowest bucket that gained a sweep this interval
+        previous = dict(buckets)
+        longest = None
+        for bound, seen in histogram['buckets']:
+            if seen - previous.get(bound, 0) == sweeps:
+                longest = bound
+                break
+        return sweeps, (histogram['sum'] - total) / sweeps, longest
+
+    def sample(self):
+        from metrics import METRICS
+
+        window, state = self.generator.take_window()
+        snapshot = METRICS.snapshot()
+        counters = {name: snapshot['counters'].get(name, 0) for name in OUTCOMES}
+        delta = {name: counters[name] - self._counters.get(name, 0) for name in OUTCOMES}
+        self._counters = counters
+        sweeps, sweep_mean, sweep_max = self._sweep_delta(snapshot)
+        codes = len(self.service.code_store) if not self.service.code_store.shared else None
+
+        sample = {
+            'elapsed': time.monotonic() - self.started,
+            'issued': len(window[ISSUE]),
+            'verifies': len(window[VERIFY]),
+            'issue_p50_ms': percentile(window[ISSUE], 0.5) * 1000,
+            'issue_p99_ms': percentile(window[ISSUE], 0.99) * 1000,
+            'issue_max_ms': max(window[ISSUE], default=0.0) * 1000,
+            'verify_p50_ms': percentile(window[VERIFY], 0.5) * 1000,
+            'verify_p99_ms': percentile(window[VERIFY], 0.99) * 1000,
+            'verify_max_ms': max(window[VERIFY], default=0.0) * 1000,
+            'outstanding_codes': codes,
+            'rss_mb': rss_bytes() / 2 ** 20,
+            'sweeps': sweeps,
+            'sweep_mean_ms': sweep_mean * 1000,
+            'sweep_max_ms': sweep_max * 1000 if sweep_max is not None else None,
+            'outcomes': delta,
+        }
+        sample.update(state)
+        self.samples.append(sample)
+        return sample
+
+    @staticmethod
+    def header():
+        return (f"{'time':>7} {'issued':>7} {'verify':>7} {'iss p99':>8} {'ver p99':>8} {'ver max':>8} "
+                f"{'codes':>8} {'rss MB':>7} {'sweep ms':>9} {'expired':>7} {'shed':>6}")
+
+    @staticmethod
+    def row(sample):
+        codes = f"{sample['outstanding_codes']:,}" if sample['outstanding_codes'] is not None else '-'
+        sweep = f"{sample['sweep_mean_ms']:.1f}" if sample['sweeps'] else '-'
+        return (f"{sample['elapsed']:>6.0f}s {sample['issued']:>7,} {sample['verifies']:>7,} "
+                f"{sample['issue_p99_ms']:>8.1f} {sample['verify_p99_ms']:>8.2f} {sample['verify_max_ms']:>8.1f} "
+                f"{codes:>8} {sample['rss_mb']:>7.1f} {sweep:>9} {sample['outcomes']['expired']:>7} "
+                f"{sample['shed']:>6}")
+
+    def summary(self):
+        """Totals and trends over the run; growth is fitted on its second half to skip the warm-up"""
+        samples = self.samples
+        steady = samples[len(samples) // 2:]
+        totals = {name: sum(sample['outcomes'][name] for sample in samples) for name in OUTCOMES}
+        codes = [sample['outstanding_codes'] for sample in samples if sample['outstanding_codes'] is not None]
+        sweep_maxima = [sample['sweep_max_ms'] for sample in samples if sample['sweep_max_ms'] is not None]
+        return {
+            'duration': samples[-1]['elapsed'] if samples else 0.0,
+            'issued': sum(sample['issued'] for sample in samples),
+            'verifies': sum(sample['verifies'] for sample in samples),
+            'outcomes': totals,
+            'shed': samples[-1]['shed'] if samples else 0,
+            'errors': samples[-1]['errors'] if samples else 0,
+            'rss_start_mb': self.rss_start / 2 ** 20,
+            'rss_peak_mb': max((sample['rss_mb'] for sample in samples), default=0.0),
+            'rss_growth_mb_per_hour': slope_per_hour([(s['elapsed'], s['rss_mb']) for s in steady]),
+            'codes_peak': max(codes, default=None),
+            'codes_growth_per_hour': slope_per_hour(
+                [(s['elapsed'], s['outstanding_codes']) for s in steady if s['outstanding_codes'] is not None]
+            ),
+            'worst_issue_p99_ms': max((sample['issue_p99_ms'] for sample in samples), default=0.0),
+            'worst_verify_p99_ms': max((sample['verify_p99_ms'] for sample in samples), default=0.0),
+            'sweeps': sum(sample['sweeps'] for sample in samples),
+            'sweep_max_ms': max(sweep_maxima, default=None),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rate', type=float, default=50, help="codes issued per second")
+    parser.add_argument('--duration', help="how long to run, e.g. 90s, 15m or 4h (default 60s)")
+    parser.add_argument('--soak', action='store_true', help="run for 4 hours unless --duration is given")
+    parser.add_argument('--report-interval', type=float, default=None, help="seconds between report lines")
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--population', type=int, default=100000, help="distinct recipients addressed")
+    parser.add_argument('--no-send', action='store_true', help="issue codes without sending emails")
+    parser.add_argument('--uniform', action='store_true', help="evenly spaced arrivals instead of Poisson")
+    parser.add_argument('--lifetime', type=float, help="code lifetime in seconds (CODE_LIFETIME)")
+    parser.add_argument('--cleanup-interval', type=float, help="seconds between expiry sweeps (CLEANUP_INTERVAL)")
+    parser.add_argument('--verify-delay', type=float, default=20, help="median seconds before a user verifies")
+    parser.add_argument('--never', type=float, default=0.2, help="fraction of codes never verified")
+    parser.add_argument('--late', type=float, default=0.05, help="fraction verified after expiry")
+    parser.add_argument('--wrong', type=float, default=0.1, help="fraction mistyped before the right code")
+    parser.add_argument('--latency', type=float, default=0, help="ms the fake SMTP server takes per message")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--output', help="write the time series and summary to this JSON file")
+    args = parser.parse_args()
+
+    if args.duration:
+        duration = parse_duration(args.duration)
+    else:
+        duration = 4 * 3600 if args.soak else 60
+    interval = args.report_interval or (60 if duration >= 3600 else 5)
+
+    smtp = None
+    if not args.no_send:
+        smtp = FakeSMTPServer(keep_messages=False, latency=args.latency / 1000, seed=args.seed).start_in_thread()
+        os.environ.update(
+            SENDER_EMAIL='load@example.com', SENDER_PASSWORD='load',
+            SMTP_SERVER='127.0.0.1', SMTP_PORT=str(smtp.port), SMTP_USE_TLS='false',
+        )
+    # Outcomes and sweep pauses are read from the metrics registry
+    os.environ['METRICS_ENABLED'] = 'true'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('SMTP_POOL_SIZE', str(args.workers))
+    if args.lifetime is not None:
+        os.environ['CODE_LIFETIME'] = str(args.lifetime)
+    if args.cleanup_interval is not None:
+        os.environ['CLEANUP_INTERVAL'] = str(args.cleanup_interval)
+
+    from email_service import EmailVerificationService
+
+    service = EmailVerificationService()
+    users = UserModel(service.code_lifetime, args.verify_delay, args.never, args.late, args.wrong, args.seed)
+    generator = LoadGenerator(service, args.rate, users, args.workers, args.population,
+                              send=not args.no_send, poisson=not args.uniform, seed=args.seed)
+    report = SoakReport(service, generator)
+
+    print(f"🏋️ {args.rate:g} codes/s for {duration:,.0f}s, code lifetime {service.code_lifetime:g}s, "
+          f"sweeps every {service.cleanup_interval:g}s")
+    print(SoakReport.header())
+    generator.start()
+    deadline = time.monotonic() + duration
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(interval, remaining))
+            print(SoakReport.row(report.sample()), flush=True)
+    except KeyboardInterrupt:
+        print("\n⏹️ Stopped early")
+    finally:
+        generator.stop()
+        service.close()
+        if smtp is not None:
+            smtp.stop_thread()
+
+    summary = report.summary()
+    outcomes = summary['outcomes']
+    print(f"\n📊 {summary['issued']:,} issued, {summary['verifies']:,} verify attempts in {summary['duration']:,.0f}s")
+    print("Outcomes: " + ', '.join(f"{name}={outcomes[name]:,}" for name in OUTCOMES))
+    print(f"Worst p99: issue {summary['worst_issue_p99_ms']:.1f} ms, verify {summary['worst_verify_p99_ms']:.2f} ms")
+    if summary['codes_peak'] is not None:
+        print(f"Outstanding codes: peak {summary['codes_peak']:,}, "
+              f"trend {summary['codes_growth_per_hour']:+,.0f}/h over the second half")
+    print(f"RSS: {summary['rss_start_mb']:.1f} MB at start, peak {summary['rss_peak_mb']:.1f} MB, "
+          f"trend {summary['rss_growth_mb_per_hour']:+.1f} MB/h over the second half")
+    if summary['sweeps']:
+        print(f"Expiry sweeps: {summary['sweeps']}, slowest ≤ {summary['sweep_max_ms']:.1f} ms")
+    if summary['shed']:
+        print(f"⚠️ {summary['shed']:,} events shed, the service could not keep up with {args.rate:g}/s")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'parameters': vars(args), 'summary': summary, 'samples': report.samples}, f, indent=2)
+        print(f"💾 Time series written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
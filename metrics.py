@@ -0,0 +1,309 @@
+import bisect
+import json
+import threading
+import time
+
+# Stages of the send and verify path that are timed
+STAGES = (
+    'code_generation', 'template_render', 'mime_build',
+    'smtp_connect', 'smtp_tls', 'smtp_auth', 'smtp_data', 'verify',
+)
+
+# Bucket upper bounds in seconds, from 10 µs to 10 s
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Timing:
+    """Context manager observing the time spent in its block"""
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class NullTiming:
+    """Timing stand-in that does nothing when metrics are disabled"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMING = NullTiming()
+
+
+class Histogram:
+    """Counts of observations per fixed bucket, with their sum
+
+    Each thread counts into its own row, so observing takes no lock. The
+    rows are only summed when a snapshot is taken, and the rows of threads
+    that have exited are folded into one retired row.
+    """
+
+    __slots__ = ('bounds', '_local', '_rows', '_retired', '_lock')
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self._local = threading.local()
+        # (thread, row) per thread that has observed
+        self._rows = []
+        # One count per bucket, one for observations above the last bound, then the sum
+        self._retired = [0] * (len(bounds) + 1) + [0.0]
+        self._lock = threading.Lock()
+
+    def _retire(self):
+        # Caller holds the lock, an exited thread no longer writes to its row
+        live = []
+        for thread, row in self._rows:
+            if thread.is_alive():
+                live.append((thread, row))
+            else:
+                self._retired = [retired + value for retired, value in zip(self._retired, row)]
+        self._rows = live
+
+    def _row(self):
+        row = self._local.row = [0] * (len(self.bounds) + 1) + [0.0]
+        with self._lock:
+            self._retire()
+            self._rows.append((threading.current_thread(), row))
+        return row
+
+    def observe(self, seconds):
+        try:
+            row = self._local.row
+        except AttributeError:
+            row = self._row()
+        row[bisect.bisect_left(self.bounds, seconds)] += 1
+        row[-1] += seconds
+
+    def time(self):
+        return Timing(self)
+
+    def _totals(self):
+        with self._lock:
+            self._retire()
+            rows = [list(row) for _, row in self._rows]
+            rows.append(self._retired)
+        totals = [sum(column) for column in zip(*rows)]
+        return totals[:-1], totals[-1]
+
+    @staticmethod
+    def _quantile(bounds, counts, fraction):
+        count = sum(counts)
+        if not count:
+            return 0.0
+        rank = fraction * count
+        seen = 0
+        for bound, bucket in zip(bounds, counts):
+            seen += bucket
+            if seen >= rank:
+                return bound
+        # Beyond the last bound, nothing more precise is known
+        return None
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of observations, None past the last bucket"""
+        counts, _ = self._totals()
+        return self._quantile(self.bounds, counts, fraction)
+
+    def snapshot(self):
+        counts, total = self._totals()
+        count = sum(counts)
+        cumulative = []
+        seen = 0
+        for bound, bucket in zip(self.bounds, counts):
+            seen += bucket
+            cumulative.append([bound, seen])
+        return {
+            'count': count,
+            'sum': total,
+            'mean': total / count if count else 0.0,
+            'p50': self._quantile(self.bounds, counts, 0.5),
+            'p99': self._quantile(self.bounds, counts, 0.99),
+            'buckets': cumulative,
+        }
+
+
+class MetricsRegistry:
+    """Stage timing histograms and event counters for one process
+
+    timer(stage) times a with block and inc(name) bumps a counter. Like
+    histogram rows, counters are kept per thread and summed on snapshot,
+    those of exited threads folded into one retired table.
+    A disabled registry hands out a shared no-op timer and ignores counts,
+    so instrumented code pays only for a method call.
+    """
+
+    def __init__(self, enabled=True, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.histograms = {stage: Histogram(buckets) for stage in STAGES}
+        self._local = threading.local()
+        # (thread, counters) per thread that has counted
+        self._counters = []
+        self._retired = {}
+        self._lock = threading.Lock()
+        self.set_enabled(enabled)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if enabled:
+            self.__dict__.pop('timer', None)
+            self.__dict__.pop('inc', None)
+        else:
+            # Shadow the methods so disabled calls skip every lookup
+            self.timer = self.null_timer
+            self.inc = self.null_inc
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram(self.buckets))
+        return histogram
+
+    def timer(self, name):
+        """Time a with block into the named histogram"""
+        histogram = self.histograms.get(name)
+        return Timing(histogram if histogram is not None else self.histogram(name))
+
+    def inc(self, name, amount=1):
+        """Add to a counter"""
+        try:
+            counters = self._local.counters
+        except AttributeError:
+            counters = self._local.counters = {}
+            with self._lock:
+                self._retire()
+                self._counters.append((threading.current_thread(), counters))
+        counters[name] = counters.get(name, 0) + amount
+
+    def _retire(self):
+        # Caller holds the lock, an exited thread no longer writes to its counters
+        live = []
+        for thread, counters in self._counters:
+            if thread.is_alive():
+                live.append((thread, counters))
+            else:
+                for name, value in counters.items():
+                    self._retired[name] = self._retired.get(name, 0) + value
+        self._counters = live
+
+    @property
+    def counters(self):
+        with self._lock:
+            self._retire()
+            totals = dict(self._retired)
+            # Copying a dict is atomic under the GIL, its thread may be counting
+            tables = [dict(counters) for _, counters in self._counters]
+        for counters in tables:
+            for name, value in counters.items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    @staticmethod
+    def null_timer(name):
+        return NULL_TIMING
+
+    @staticmethod
+    def null_inc(name, amount=1):
+        pass
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {stage: Histogram(self.buckets) for stage in STAGES}
+            self._local = threading.local()
+            self._counters = []
+            self._retired = {}
+
+    def snapshot(self):
+        """Counters and histograms as plain data, for JSON"""
+        counters = self.counters
+        with self._lock:
+            histograms = dict(self.histograms)
+        return {
+            'enabled': self.enabled,
+            'counters': counters,
+            'histograms': {name: histogram.snapshot() for name, histogram in histograms.items()},
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self, prefix='email_verification'):
+        return prometheus_text([({}, self.snapshot())], prefix)
+
+
+def _labels(labels, extra=None):
+    pairs = dict(labels)
+    if extra:
+        pairs.update(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs.items()) + '}'
+
+
+# SMTP pool stats exported by prometheus_text, as (stat, metric type)
+POOL_STATS = (
+    ('hits', 'counter'), ('misses', 'counter'), ('created', 'counter'), ('discarded', 'counter'),
+    ('idle', 'gauge'), ('max_size', 'gauge'),
+)
+
+
+def prometheus_text(snapshots, prefix='email_verification', pools=()):
+    """Render (labels, snapshot) pairs in the Prometheus text exposition format
+
+    Several snapshots, e.g. one per shard, share each metric family and are
+    told apart by their labels. pools holds (labels, SMTPConnectionPool.stats())
+    pairs for the processes whose pool has been started.
+    """
+    lines = []
+    counter_names = sorted({name for _, snapshot in snapshots for name in snapshot['counters']})
+    for name in counter_names:
+        metric = f"{prefix}_{name}_total"
+        lines.append(f"# TYPE {metric} counter")
+        for labels, snapshot in snapshots:
+            lines.append(f"{metric}{_labels(labels)} {snapshot['counters'].get(name, 0)}")
+
+    histogram_names = sorted({name for _, snapshot in snapshots for name in snapshot['histograms']})
+    metric = f"{prefix}_stage_seconds"
+    if histogram_names:
+        lines.append(f"# HELP {metric} Time spent per stage of the send and verify path")
+        lines.append(f"# TYPE {metric} histogram")
+    for name in histogram_names:
+        for labels, snapshot in snapshots:
+            histogram = snapshot['histograms'].get(name)
+            if histogram is None:
+                continue
+            stage = dict(labels, stage=name)
+            for bound, count in histogram['buckets']:
+                lines.append(f"{metric}_bucket{_labels(stage, {'le': repr(float(bound))})} {count}")
+            lines.append(f"{metric}_bucket{_labels(stage, {'le': '+Inf'})} {histogram['count']}")
+            lines.append(f"{metric}_sum{_labels(stage)} {histogram['sum']!r}")
+            lines.append(f"{metric}_count{_labels(stage)} {histogram['count']}")
+
+    for stat, kind in POOL_STATS if pools else ():
+        metric = f"{prefix}_smtp_pool_{stat}" + ('_total' if kind == 'counter' else '')
+        lines.append(f"# TYPE {metric} {kind}")
+        for labels, stats in pools:
+            lines.append(f"{metric}{_labels(labels)} {stats[stat]}")
+    return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry, services apply METRICS_ENABLED=false from their settings to make it a no-op
+METRICS = MetricsRegistry()
@@ -0,0 +1,134 @@
+import os
+import threading
+from email import quoprimime
+
+CRLF = '\r\n'
+SOFT_BREAK = b'=\r\n'
+
+
+def encode_quoted_printable(text):
+    """Quoted-printable encode UTF-8 text with CRLF line endings"""
+    return quoprimime.body_encode(
+        text.encode('utf-8').decode('latin-1'), maxlinelen=76, eol=CRLF
+    ).encode('ascii')
+
+
+def check_header_value(value, name):
+    """Reject a value that would end its header line and start another one"""
+    if '\r' in value or '\n' in value:
+        raise ValueError(f"{name} header value must not contain line breaks")
+    return value
+
+
+def encode_header_value(value):
+    """RFC 2047 encode a header value only when it is not plain ASCII"""
+    if value.isascii():
+        return value
+    from email.header import Header
+    return Header(value, 'utf-8').encode()
+
+
+class EncodedTemplate:
+    """Template body pre-encoded as quoted-printable chunks"""
+
+    def __init__(self, template):
+        self.fields = template.fields
+        self.chunks = [encode_quoted_printable(chunk) for chunk in template._chunks]
+
+    def render(self, values, parts):
+        """Append the encoded body to parts, splicing in encoded values"""
+        chunks = self.chunks
+        parts.append(chunks[0])
+        for field, chunk in zip(self.fields, chunks[1:]):
+            # Soft line breaks keep spliced values within the 76 column limit
+            parts.append(SOFT_BREAK)
+            parts.append(encode_quoted_printable(values[field]))
+            parts.append(SOFT_BREAK)
+            parts.append(chunk)
+
+
+class MessageSkeleton:
+    """Pre-encoded headers and bodies of a verification email for one template set"""
+
+    def __init__(self, templates, sender_email):
+        self.templates = templates
+        self.sender_email = sender_email
+        boundary = f"==============={os.urandom(16).hex()}=="
+
+        # A subject without placeholders is encoded once
+        self.subject = None
+        if not templates.subject.fields:
+            self.subject = encode_header_value(templates.subject.render({})).encode('ascii')
+
+        self.head = (
+            f'Content-Type: multipart/alternative; boundary="{boundary}"{CRLF}'
+            f'MIME-Version: 1.0{CRLF}'
+            f'Subject: '
+        ).encode('ascii')
+        from_value = encode_header_value(check_header_value(sender_email or "", 'From'))
+        self.from_to = f'{CRLF}From: {from_value}{CRLF}To: '.encode('ascii')
+
+        part_headers = (
+            'MIME-Version: 1.0' + CRLF +
+            'Content-Transfer-Encoding: quoted-printable' + CRLF + CRLF
+        )
+        self.text_head = (
+            f'{CRLF}{CRLF}--{boundary}{CRLF}'
+            f'Content-Type: text/plain; charset="utf-8"{CRLF}' + part_headers
+        ).encode('ascii')
+        self.html_head = (
+            f'{CRLF}--{boundary}{CRLF}'
+            f'Content-Type: text/html; charset="utf-8"{CRLF}' + part_headers
+        ).encode('ascii')
+        self.tail = f'{CRLF}--{boundary}--{CRLF}'.encode('ascii')
+
+        self.text = EncodedTemplate(templates.text)
+        self.html = EncodedTemplate(templates.html)
+
+    def render(self, recipient_email, code, timestamp, custom_message=""):
+        """Produce the final message bytes for one recipient"""
+        # Spliced into the precompiled To: header, where email.mime used to refuse line breaks
+        check_header_value(recipient_email, 'To')
+        templates = self.templates
+        values = {'code': code, 'timestamp': timestamp, 'custom_message': ''}
+
+        parts = [self.head]
+        if self.subject is not None:
+            parts.append(self.subject)
+        else:
+            parts.append(encode_header_value(templates.subject.render(values)).encode('ascii'))
+        parts.append(self.from_to)
+        parts.append(encode_header_value(recipient_email).encode('ascii'))
+
+        parts.append(self.text_head)
+        if custom_message:
+            values['custom_message'] = templates.text_custom_message(custom_message)
+        self.text.render(values, parts)
+
+        parts.append(self.html_head)
+        if custom_message:
+            values['custom_message'] = templates.html_custom_message(custom_message)
+        self.html.render(values, parts)
+
+        parts.append(self.tail)
+        return b''.join(parts)
+
+
+class MessageCache:
+    """Caches message skeletons per template set and sender"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._skeletons = {}
+
+    def get(self, templates, sender_email):
+        key = (id(templates), sender_email)
+        skeleton = self._skeletons.get(key)
+        if skeleton is None or skeleton.templates is not templates:
+            with self._lock:
+                skeleton = MessageSkeleton(templates, sender_email)
+                # Template sets are replaced on reload, keep the cache small
+                if len(self._skeletons) > 64:
+                    self._skeletons.clear()
+                self._skeletons[key] = skeleton
+        return skeleton
@@ -0,0 +1,333 @@
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# How long to wait before checking again when a domain has no free delivery slot
+SLOT_POLL_INTERVAL = 0.05
+
+
+def recipient_domain(email):
+    """Lower-cased domain part of an email address"""
+    return email.rpartition('@')[2].lower()
+
+
+def parse_rate_overrides(value):
+    """Parse 'gmail.com=20/40,yahoo.com=5' into {domain: (rate, burst)}
+
+    The burst defaults to the rate when it is left out.
+    """
+    overrides = {}
+    for entry in (value or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        domain, _, limit = entry.partition('=')
+        rate, _, burst = limit.partition('/')
+        rate = float(rate)
+        overrides[domain.strip().lower()] = (rate, float(burst) if burst else max(rate, 1))
+    return overrides
+
+
+class TokenBucket:
+    """Refills rate tokens per second up to burst, one token per message"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def wait_time(self, now):
+        """Seconds until a token is available, 0 when one is available now"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class KeyedRateLimiter:
+    """Token buckets created on demand per key, least recently used ones evicted
+
+    A rate of 0 leaves a key unlimited. Evicting a bucket only forgets how
+    depleted it was, so max_keys bounds memory without blocking anyone.
+    Sent and throttled counts are kept for the max_counted most recently
+    limited keys, older keys fold into one aggregate.
+    """
+
+    def __init__(self, rate, burst, overrides=None, max_keys=10000, max_counted=100):
+        self.rate = rate
+        self.burst = burst
+        self.overrides = overrides or {}
+        self.max_keys = max_keys
+        self.max_counted = max_counted
+        self._buckets = OrderedDict()
+        # key: [allowed, throttled]
+        self._counts = OrderedDict()
+        self.other = [0, 0]
+
+    def limits(self, key):
+        return self.overrides.get(key, (self.rate, self.burst))
+
+    def bucket(self, key, now):
+        """The bucket for key, or None when the key is unlimited"""
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            self._buckets.move_to_end(key)
+            return bucket
+        rate, burst = self.limits(key)
+        if rate <= 0:
+            return None
+        bucket = self._buckets[key] = TokenBucket(rate, max(burst, 1), now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return bucket
+
+    def count(self, key, allowed):
+        """Count a decision for a key that has a bucket, unlimited keys are not counted"""
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0, 0]
+            if len(self._counts) > self.max_counted:
+                _, evicted = self._counts.popitem(last=False)
+                self.other[0] += evicted[0]
+                self.other[1] += evicted[1]
+        else:
+            self._counts.move_to_end(key)
+        counts[0 if allowed else 1] += 1
+
+    def counts(self):
+        """{key: (allowed, throttled)} of the counted keys"""
+        return {key: tuple(counts) for key, counts in self._counts.items()}
+
+
+class DeliveryRateLimiter:
+    """Paces deliveries per recipient domain and per sender account
+
+    A message needs a token from both its domain bucket and its sender
+    bucket, and optionally one of max_in_flight delivery slots for its
+    domain. Tokens are only taken when both buckets have one.
+    """
+
+    def __init__(self, domain_rate=0, domain_burst=1, sender_rate=0, sender_burst=1,
+                 domain_overrides=None, max_in_flight=0):
+        self.domains = KeyedRateLimiter(domain_rate, domain_burst, domain_overrides)
+        self.senders = KeyedRateLimiter(sender_rate, sender_burst)
+        self.max_in_flight = max_in_flight
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def _reserve(self, domain, sender, now):
+        # Caller holds the lock
+        domain_bucket = self.domains.bucket(domain, now)
+        sender_bucket = self.senders.bucket(sender, now) if sender else None
+        wait = 0.0
+        if domain_bucket is not None:
+            wait = domain_bucket.wait_time(now)
+            if wait:
+                self.domains.count(domain, False)
+        if sender_bucket is not None:
+            sender_wait = sender_bucket.wait_time(now)
+            if sender_wait:
+                self.senders.count(sender, False)
+                wait = max(wait, sender_wait)
+        if wait:
+            return wait
+
+        if domain_bucket is not None:
+            domain_bucket.take()
+            self.domains.count(domain, True)
+        if sender_bucket is not None:
+            sender_bucket.take()
+            self.senders.count(sender, True)
+        return 0.0
+
+    def reserve(self, domain, sender=None, now=None):
+        """Take the tokens for one message, or return the seconds to wait for them"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return self._reserve(domain, sender, now)
+
+    def try_begin(self, domain, sender=None, now=None):
+        """Like reserve, but also claim a delivery slot that end(domain) releases"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            in_flight = self._in_flight.get(domain, 0)
+            if self.max_in_flight and in_flight >= self.max_in_flight:
+                return SLOT_POLL_INTERVAL
+            wait = self._reserve(domain, sender, now)
+            if not wait:
+                self._in_flight[domain] = in_flight + 1
+            return wait
+
+    def end(self, domain):
+        """Release the delivery slot claimed by try_begin"""
+        with self._lock:
+            in_flight = self._in_flight.get(domain, 0) - 1
+            if in_flight > 0:
+                self._in_flight[domain] = in_flight
+            else:
+                self._in_flight.pop(domain, None)
+
+    def wait_for(self, domain, sender=None):
+        """Block until try_begin succeeds"""
+        while True:
+            wait = self.try_begin(domain, sender)
+            if not wait:
+                return
+            with self._lock:
+                self.waited += wait
+            time.sleep(wait)
+
+    @contextmanager
+    def slot(self, domain, sender=None):
+        """Hold a paced delivery slot for domain while the block runs"""
+        self.wait_for(domain, sender)
+        try:
+            yield
+        finally:
+            self.end(domain)
+
+    def metrics(self):
+        """Counts for rate-limited domains and senders, those no longer tracked summed under 'other_*'"""
+        with self._lock:
+            domain_counts = self.domains.counts()
+            sender_counts = self.senders.counts()
+            return {
+                'domains': {
+                    domain: {
+                        'sent': domain_counts.get(domain, (0, 0))[0],
+                        'throttled': domain_counts.get(domain, (0, 0))[1],
+                        'in_flight': self._in_flight.get(domain, 0),
+                    }
+                    for domain in set(domain_counts) | set(self._in_flight)
+                },
+                'senders': {
+                    sender: {'sent': allowed, 'throttled': throttled}
+                    for sender, (allowed, throttled) in sender_counts.items()
+                },
+                'other_domains': {'sent': self.domains.other[0], 'throttled': self.domains.other[1]},
+                'other_senders': {'sent': self.senders.other[0], 'throttled': self.senders.other[1]},
+                'waited_seconds': self.waited,
+            }
+
+
+class DomainScheduler:
+    """Bounded queue handing out items round-robin across recipient domains
+
+    ready(domain) is asked before an item leaves the queue and returns 0
+    once it has taken the domain's tokens, or the seconds to wait. Items of
+    a throttled domain stay queued while other domains keep moving, so one
+    slow provider does not hold up the rest. Control items are handed out
+    once no domain item is left.
+    """
+
+    def __init__(self, ready, maxsize=0):
+        self.ready = ready
+        self.maxsize = maxsize
+        self._domains = OrderedDict()
+        self._not_before = {}
+        self._control = deque()
+        self._size = 0
+        self._unfinished = 0
+        self._condition = threading.Condition()
+
+    def put(self, domain, item, timeout=None):
+        """Queue an item for domain, raising queue.Full after timeout"""
+        with self._condition:
+            if self.maxsize > 0:
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while self._size >= self.maxsize:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise queue.Full
+                    self._condition.wait(remaining)
+            pending = self._domains.get(domain)
+            if pending is None:
+                pending = self._domains[domain] = deque()
+            pending.append(item)
+            self._size += 1
+            self._unfinished += 1
+            self._condition.notify_all()
+
+    def put_control(self, item):
+        """Queue an item that ignores maxsize and goes out after every domain item"""
+        with self._condition:
+            self._control.append(item)
+            self._unfinished += 1
+            self._condition.notify_all()
+
+    def get(self):
+        """Block until an item may go out, returning (domain, item)
+
+        Control items come back with a domain of None.
+        """
+        with self._condition:
+            while True:
+                earliest = None
+                now = time.monotonic()
+                for domain in list(self._domains):
+                    # Throttled domains are not asked again before they can be ready
+                    wait = self._not_before.get(domain, 0) - now
+                    if wait <= 0:
+                        wait = self.ready(domain)
+                        if wait:
+                            self._not_before[domain] = now + wait
+                        else:
+                            self._not_before.pop(domain, None)
+                    if not wait:
+                        pending = self._domains[domain]
+                        item = pending.popleft()
+                        if pending:
+                            # Served domains go to the back of the rotation
+                            self._domains.move_to_end(domain)
+                        else:
+                            del self._domains[domain]
+                            self._not_before.pop(domain, None)
+                        self._size -= 1
+                        self._condition.notify_all()
+                        return domain, item
+                    earliest = wait if earliest is None else min(earliest, wait)
+                if earliest is None and self._control:
+                    return None, self._control.popleft()
+                self._condition.wait(earliest)
+
+    def drain(self):
+        """Remove and return every queued domain item without asking ready()"""
+        with self._condition:
+            items = [item for pending in self._domains.values() for item in pending]
+            self._domains.clear()
+            self._not_before.clear()
+            self._size = 0
+            self._unfinished -= len(items)
+            self._condition.notify_all()
+            return items
+
+    def task_done(self):
+        with self._condition:
+            self._unfinished -= 1
+            if self._unfinished <= 0:
+                self._condition.notify_all()
+
+    def join(self):
+        """Block until every queued item has been handled"""
+        with self._condition:
+            while self._unfinished > 0:
+                self._condition.wait()
+
+    def qsize(self):
+        with self._condition:
+            return self._size + len(self._control)
+
+    def backlog(self):
+        """Queued items per domain"""
+        with self._condition:
+            return {domain: len(pending) for domain, pending in self._domains.items()}
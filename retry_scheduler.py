@@ -0,0 +1,168 @@
+import heapq
+import itertools
+import json
+import random
+import threading
+import time
+from collections import deque
+
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+# Dead letters of jobs still waiting for a retry when the scheduler stopped
+CANCELLED = 'cancelled'
+
+
+def classify_smtp_error(error):
+    """Tell failures worth retrying apart from ones that will fail again"""
+    import asyncio
+    import smtplib
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return PERMANENT
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return TRANSIENT if any(400 <= code < 500 for code in codes) else PERMANENT
+    if isinstance(error, smtplib.SMTPResponseException):
+        return TRANSIENT if 400 <= error.smtp_code < 500 else PERMANENT
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return TRANSIENT
+    if isinstance(error, smtplib.SMTPException):
+        return PERMANENT
+    # asyncio.TimeoutError is only the builtin TimeoutError from Python 3.11
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError, OSError)):
+        # Timeouts, resets and refused or unreachable connections
+        return TRANSIENT
+    return PERMANENT
+
+
+class DeadLetterStore:
+    """Keeps the most recent undeliverable messages, optionally appended to a JSONL file"""
+
+    def __init__(self, max_entries=1000, path=None):
+        self.entries = deque(maxlen=max_entries)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def add(self, recipient_email, error, attempts, classification):
+        entry = {
+            'email': recipient_email,
+            'error': str(error),
+            'classification': classification,
+            'attempts': attempts,
+            'failed_at': time.time(),
+        }
+        with self._lock:
+            self.entries.append(entry)
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry) + '\n')
+        return entry
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class RetryScheduler:
+    """Retries transient send failures with jittered exponential backoff
+
+    Jobs wait in a heap ordered by due time and run on one background
+    thread. send(job) performs a delivery attempt and may raise. A job is
+    dead-lettered after a permanent failure or max_attempts attempts, and
+    jobs still waiting when the scheduler stops are dead-lettered as
+    cancelled.
+    """
+
+    def __init__(self, send, max_attempts=5, base_delay=2.0, max_delay=300.0,
+                 dead_letters=None, on_dead=None):
+        self.send = send
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.dead_letters = dead_letters if dead_letters is not None else DeadLetterStore()
+        self.on_dead = on_dead
+
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+        # Counters
+        self.scheduled = 0
+        self.recovered = 0
+        self.dead = 0
+
+    def backoff(self, attempt):
+        """Full-jitter delay before the given retry attempt"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def schedule(self, job, recipient_email, attempts=1):
+        """Queue a job that has failed attempts times"""
+        due = time.monotonic() + self.backoff(attempts)
+        with self._condition:
+            if self._stopped:
+                return False
+            heapq.heappush(self._heap, (due, next(self._sequence), job, recipient_email, attempts))
+            self.scheduled += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="send-retry", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return True
+
+    def fail(self, job, recipient_email, error, attempts, classification):
+        """Record a delivery that will not be retried, on_dead(job, entry) is called"""
+        with self._condition:
+            self.dead += 1
+        entry = self.dead_letters.add(recipient_email, error, attempts, classification)
+        if self.on_dead is not None:
+            self.on_dead(job, entry)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(timeout)
+                if self._stopped:
+                    return
+                _, _, job, recipient_email, attempts = heapq.heappop(self._heap)
+
+            try:
+                self.send(job)
+            except Exception as e:
+                attempts += 1
+                classification = classify_smtp_error(e)
+                if classification == TRANSIENT and attempts < self.max_attempts:
+                    if not self.schedule(job, recipient_email, attempts):
+                        # Stopped while this attempt ran
+                        self.fail(job, recipient_email, e, attempts, CANCELLED)
+                else:
+                    self.fail(job, recipient_email, e, attempts, classification)
+            else:
+                with self._condition:
+                    self.recovered += 1
+
+    def pending(self):
+        with self._condition:
+            return len(self._heap)
+
+    def stop(self):
+        """Stop retrying, pending jobs are dead-lettered so on_dead can revoke them"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        with self._condition:
+            pending, self._heap = sorted(self._heap), []
+        for _, _, job, recipient_email, attempts in pending:
+            self.fail(job, recipient_email, "Stopped before the email could be retried", attempts, CANCELLED)
+
+    def metrics(self):
+        with self._condition:
+            return {
+                'pending': len(self._heap),
+                'scheduled': self.scheduled,
+                'recovered': self.recovered,
+                'dead': self.dead,
+            }
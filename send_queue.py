@@ -0,0 +1,151 @@
+import queue
+import threading
+import time
+from collections import deque
+
+from rate_limit import DomainScheduler, recipient_domain
+from service_log import get_logger
+
+log = get_logger('send_queue')
+
+# Sentinel telling a worker to exit
+_STOP = object()
+
+
+class SendQueue:
+    """Bounded queue of verification emails drained by sender worker threads
+
+    Codes are issued before enqueueing, so callers get them back at once.
+    Workers take messages round-robin across recipient domains as the
+    service's rate limiter allows, send them over the SMTP pool and hand
+    failures to the service's retry handling. A full queue pushes back on
+    callers instead of growing without bound.
+    """
+
+    def __init__(self, service, workers=4, max_size=1000, callback=None):
+        self.service = service
+        self.worker_count = max(1, int(workers))
+        self.callback = callback
+        limiter = service.rate_limiter
+        self._queue = DomainScheduler(lambda domain: limiter.try_begin(domain, service.sender_email), max_size)
+        self._workers = []
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.enqueued = 0
+        self.sent = 0
+        self.failed = 0
+        self.retrying = 0
+        self.rejected = 0
+        self._completions = deque(maxlen=10000)
+
+    def start(self):
+        """Start the sender workers"""
+        with self._lock:
+            if self._workers:
+                return
+            for index in range(self.worker_count):
+                worker = threading.Thread(target=self._work, name=f"sender-{index}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def stop(self, drain=True):
+        """Stop the workers, sending what is already queued when drain is set
+
+        Without drain, queued emails are dropped and their codes deleted.
+        """
+        with self._lock:
+            workers, self._workers = self._workers, []
+        if not drain:
+            discarded = self._queue.drain()
+            for recipient_email, code, _, _ in discarded:
+                # The email never went out, its code must not stay valid
+                self.service.revoke_code(recipient_email, code)
+            if discarded:
+                with self._lock:
+                    self.failed += len(discarded)
+                log.warning(f"⚠️ Discarded {len(discarded)} queued email(s) and revoked their codes",
+                            extra={'event': 'queue_discarded', 'count': len(discarded)})
+        for _ in workers:
+            self._queue.put_control(_STOP)
+        for worker in workers:
+            worker.join()
+
+    def enqueue(self, recipient_email, code, custom_message="", locale=None, timeout=None):
+        """Queue a message for an issued code, raising queue.Full after timeout"""
+        try:
+            self._queue.put(recipient_domain(recipient_email), (recipient_email, code, custom_message, locale),
+                            timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise
+        with self._lock:
+            self.enqueued += 1
+
+    def join(self):
+        """Block until every queued message has been handled"""
+        self._queue.join()
+
+    def _work(self):
+        while True:
+            domain, job = self._queue.get()
+            try:
+                if job is _STOP:
+                    return
+                try:
+                    self._send(*job)
+                finally:
+                    # Free the delivery slot the scheduler claimed for the domain
+                    self.service.rate_limiter.end(domain)
+            finally:
+                self._queue.task_done()
+
+    def _send(self, recipient_email, code, custom_message, locale):
+        service = self.service
+        error = None
+        try:
+            message_bytes = service.build_message_bytes(recipient_email, code, custom_message, locale)
+            service.send_message_bytes(recipient_email, message_bytes, paced=False)
+        except Exception as e:
+            error = e
+
+        retrying = False
+        if error is not None:
+            log.error(f"❌ Failed to send email to {recipient_email}: {error}",
+                      extra={'event': 'failed', 'email': recipient_email, 'error': str(error)})
+            retrying = service.handle_send_failure(recipient_email, code, custom_message, locale, error)
+
+        with self._lock:
+            if error is None:
+                self.sent += 1
+            elif retrying:
+                self.retrying += 1
+            else:
+                self.failed += 1
+            self._completions.append(time.monotonic())
+
+        if self.callback is not None:
+            self.callback(recipient_email, error is None, code, error)
+
+    def metrics(self, window=10.0):
+        """Queue depth, counters and the drain rate over the last window seconds"""
+        now = time.monotonic()
+        with self._lock:
+            recent = 0
+            for finished in reversed(self._completions):
+                if now - finished > window:
+                    break
+                recent += 1
+            return {
+                'depth': self._queue.qsize(),
+                'capacity': self._queue.maxsize,
+                'backlog': self._queue.backlog(),
+                'workers': len(self._workers),
+                'enqueued': self.enqueued,
+                'sent': self.sent,
+                'failed': self.failed,
+                'retrying': self.retrying,
+                'rejected': self.rejected,
+                'drain_rate': recent / window,
+            }
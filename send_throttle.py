@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class WindowCount:
+    """Request counts of a key for the current and the previous window"""
+
+    __slots__ = ('window', 'current', 'previous')
+
+    def __init__(self, window):
+        self.window = window
+        self.current = 0
+        self.previous = 0
+
+
+class SlidingWindowCounter:
+    """Approximate per-key request counts over a sliding window in O(1)
+
+    Each key keeps the count of the current fixed window and the one before
+    it, and the previous count is weighted by how much of it still overlaps
+    the sliding window. Keys beyond max_keys are evicted least recently
+    used first, which bounds memory at the cost of forgetting quiet keys.
+    """
+
+    def __init__(self, limit, window, max_keys=100000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._counts = OrderedDict()
+
+    def entry(self, key, now):
+        """Counts of key, rolled forward to the window holding now"""
+        window = int(now // self.window)
+        entry = self._counts.get(key)
+        if entry is None:
+            entry = self._counts[key] = WindowCount(window)
+            if len(self._counts) > self.max_keys:
+                self._counts.popitem(last=False)
+            return entry
+        self._counts.move_to_end(key)
+        if entry.window != window:
+            entry.previous = entry.current if entry.window == window - 1 else 0
+            entry.current = 0
+            entry.window = window
+        return entry
+
+    def estimate(self, entry, now):
+        """Requests of an entry within the sliding window ending at now"""
+        overlap = 1 - (now % self.window) / self.window
+        return entry.previous * overlap + entry.current
+
+    def __len__(self):
+        return len(self._counts)
+
+
+class SendThrottle:
+    """Rejects verification emails beyond per-recipient and per-source limits
+
+    A request counts against both its recipient and its source (a client
+    address or account) and is only counted when both allow it. A limit of
+    0 disables that check.
+    """
+
+    def __init__(self, recipient_limit=5, source_limit=50, window=600, max_keys=100000):
+        self.recipients = SlidingWindowCounter(recipient_limit, window, max_keys)
+        self.sources = SlidingWindowCounter(source_limit, window, max_keys)
+        self._lock = threading.Lock()
+
+        # Counters
+        self.allowed = 0
+        self.rejected_recipient = 0
+        self.rejected_source = 0
+
+    def allow(self, recipient_email, source=None, now=None):
+        """Count a send request, returning False when it is over a limit"""
+        now = time.time() if now is None else now
+        recipients, sources = self.recipients, self.sources
+        with self._lock:
+            recipient_entry = source_entry = None
+            if recipients.limit:
+                recipient_entry = recipients.entry(recipient_email.strip().lower(), now)
+                if recipients.estimate(recipient_entry, now) + 1 > recipients.limit:
+                    self.rejected_recipient += 1
+                    return False
+            if source is not None and sources.limit:
+                source_entry = sources.entry(source, now)
+                if sources.estimate(source_entry, now) + 1 > sources.limit:
+                    self.rejected_source += 1
+                    return False
+            if recipient_entry is not None:
+                recipient_entry.current += 1
+            if source_entry is not None:
+                source_entry.current += 1
+            self.allowed += 1
+            return True
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'allowed': self.allowed,
+                'rejected_recipient': self.rejected_recipient,
+                'rejected_source': self.rejected_source,
+                'tracked_recipients': len(self.recipients),
+                'tracked_sources': len(self.sources),
+            }
@@ -0,0 +1,194 @@
+import atexit
+import itertools
+import json
+import logging
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+from settings import get_settings
+
+LOGGER_NAME = 'email_verification'
+
+# Record attributes carried into the JSON sink when present
+FIELDS = ('event', 'email', 'code', 'expires_at', 'error', 'attempts', 'count')
+
+REDACTED = '[redacted]'
+
+
+def get_logger(name):
+    """Logger under the service namespace, e.g. get_logger('service')"""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+def redact_code(code, redact=True):
+    """How a verification code may appear in logs"""
+    if code is None or not redact:
+        return code
+    return REDACTED
+
+
+class BufferedQueueHandler(QueueHandler):
+    """Hands records to the log thread without formatting them or blocking
+
+    Verification codes are redacted before a record leaves the calling
+    thread. When the queue is full, records are dropped and counted rather
+    than waited on.
+    """
+
+    def __init__(self, log_queue, redact=True):
+        super().__init__(log_queue)
+        self.redact = redact
+        self.dropped = 0
+
+    def emit(self, record):
+        if self.redact and getattr(record, 'code', None) is not None:
+            record.code = REDACTED
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Formatting happens on the log thread, the caller only pays for the put
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    """Timestamp, level and message, with the code appended when a record carries one"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s %(message)s', '%Y-%m-%d %H:%M:%S')
+
+    def format(self, record):
+        line = super().format(record)
+        code = getattr(record, 'code', None)
+        return f"{line} (code {code})" if code is not None else line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the record's structured fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': record.created,
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class LogSettings:
+    """State of the configured logging pipeline"""
+
+    def __init__(self, handler, listener, sink, sample_every=1):
+        self.handler = handler
+        self.listener = listener
+        self.sink = sink
+        self.sample_every = sample_every
+        self.sampled = itertools.count()
+        self.skipped = 0
+        self.stopped = False
+
+    def metrics(self):
+        return {
+            'queued': self.handler.queue.qsize(),
+            'dropped': self.handler.dropped,
+            'skipped': self.skipped,
+        }
+
+    def stop(self):
+        """Write out every queued record and stop the log thread"""
+        if not self.stopped:
+            self.stopped = True
+            self.listener.stop()
+            self.sink.flush()
+
+
+_log_settings = None
+_log_settings_lock = threading.Lock()
+
+
+def configure_logging(level=None, fmt=None, path=None, sample=None, redact=None, queue_size=None,
+                      stream=None, force=False, settings=None):
+    """Route service logs through a bounded queue to one sink on a background thread
+
+    Arguments default to the settings' LOG_LEVEL, LOG_FORMAT (text or
+    json), LOG_FILE (stdout when empty), LOG_SUCCESS_SAMPLE (fraction of
+    success events kept), LOG_REDACT_CODES and LOG_QUEUE_SIZE. Only the
+    first call configures anything unless force is set.
+    """
+    global _log_settings
+    with _log_settings_lock:
+        if _log_settings is not None:
+            if not force:
+                return _log_settings
+            _log_settings.stop()
+            logging.getLogger(LOGGER_NAME).removeHandler(_log_settings.handler)
+
+        settings = settings or get_settings()
+        level = (level or settings.log_level).upper()
+        fmt = (fmt or settings.log_format).lower()
+        path = path if path is not None else settings.log_file
+        sample = float(sample if sample is not None else settings.log_success_sample)
+        if redact is None:
+            redact = settings.log_redact_codes
+        queue_size = int(queue_size if queue_size is not None else settings.log_queue_size)
+
+        if path:
+            sink = logging.FileHandler(path, encoding='utf-8')
+        else:
+            sink = logging.StreamHandler(stream or sys.stdout)
+        sink.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+
+        handler = BufferedQueueHandler(queue.Queue(queue_size), redact)
+        listener = QueueListener(handler.queue, sink)
+        listener.start()
+
+        logger = logging.getLogger(LOGGER_NAME)
+        logger.setLevel(level)
+        logger.addHandler(handler)
+        # Records stop here rather than also reaching handlers of the root logger
+        logger.propagate = False
+
+        # Every nth success event is kept, none at a sample of 0
+        sample_every = max(1, round(1 / sample)) if sample > 0 else 0
+        _log_settings = LogSettings(handler, listener, sink, sample_every)
+        return _log_settings
+
+
+def log_sampled(logger, message, *args, **fields):
+    """Log a high-volume info event, keeping the LOG_SUCCESS_SAMPLE fraction of them
+
+    The decision is taken before a record is built, so a skipped event
+    costs a counter increment. fields become the record's extra attributes.
+    """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    log_settings = _log_settings
+    if log_settings is not None and log_settings.sample_every != 1:
+        if not log_settings.sample_every or next(log_settings.sampled) % log_settings.sample_every:
+            log_settings.skipped += 1
+            return
+    logger.info(message, *args, extra=fields)
+
+
+def shutdown_logging():
+    """Flush and stop the log thread, called at exit"""
+    global _log_settings
+    with _log_settings_lock:
+        if _log_settings is not None:
+            _log_settings.stop()
+            logging.getLogger(LOGGER_NAME).removeHandler(_log_settings.handler)
+            _log_settings = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,181 @@
+import os
+import threading
+
+
+def _flag(default):
+    """Parse a boolean variable, anything but the opposite of the default keeps it"""
+    if default:
+        return lambda value: value.lower() != 'false'
+    return lambda value: value.lower() == 'true'
+
+
+def _optional(value):
+    return value or None
+
+
+# attribute, environment variable, parser, default
+FIELDS = (
+    ('sender_email', 'SENDER_EMAIL', str, None),
+    ('sender_password', 'SENDER_PASSWORD', str, None),
+    ('smtp_server', 'SMTP_SERVER', str, 'smtp.gmail.com'),
+    ('smtp_port', 'SMTP_PORT', int, 587),
+    ('smtp_use_tls', 'SMTP_USE_TLS', _flag(True), True),
+    ('app_name', 'APP_NAME', str, 'Email Verification Service'),
+    ('smtp_pool_size', 'SMTP_POOL_SIZE', int, 4),
+    ('smtp_pool_idle_timeout', 'SMTP_POOL_IDLE_TIMEOUT', float, 60.0),
+    ('smtp_max_concurrency', 'SMTP_MAX_CONCURRENCY', int, 20),
+    ('send_rate_per_domain', 'SEND_RATE_PER_DOMAIN', float, 0.0),
+    ('send_burst_per_domain', 'SEND_BURST_PER_DOMAIN', float, 10.0),
+    ('send_rate_per_sender', 'SEND_RATE_PER_SENDER', float, 0.0),
+    ('send_burst_per_sender', 'SEND_BURST_PER_SENDER', float, 10.0),
+    ('send_domain_limits', 'SEND_DOMAIN_LIMITS', _optional, None),
+    ('send_domain_concurrency', 'SEND_DOMAIN_CONCURRENCY', int, 0),
+    ('resend_limit_per_recipient', 'RESEND_LIMIT_PER_RECIPIENT', int, 5),
+    ('resend_limit_per_source', 'RESEND_LIMIT_PER_SOURCE', int, 50),
+    ('resend_window', 'RESEND_WINDOW', float, 600.0),
+    ('resend_max_tracked', 'RESEND_MAX_TRACKED', int, 100000),
+    ('verify_max_attempts', 'VERIFY_MAX_ATTEMPTS', int, 5),
+    ('verify_lockout_threshold', 'VERIFY_LOCKOUT_THRESHOLD', float, 10.0),
+    ('verify_lockout_half_life', 'VERIFY_LOCKOUT_HALF_LIFE', float, 900.0),
+    ('send_retry_attempts', 'SEND_RETRY_ATTEMPTS', int, 5),
+    ('send_retry_base_delay', 'SEND_RETRY_BASE_DELAY', float, 2.0),
+    ('send_retry_max_delay', 'SEND_RETRY_MAX_DELAY', float, 300.0),
+    ('dead_letter_file', 'DEAD_LETTER_FILE', _optional, None),
+    # Defaults to the SMTP pool size
+    ('send_queue_workers', 'SEND_QUEUE_WORKERS', int, None),
+    ('send_queue_size', 'SEND_QUEUE_SIZE', int, 1000),
+    ('send_queue_timeout', 'SEND_QUEUE_TIMEOUT', float, 5.0),
+    ('template_dir', 'TEMPLATE_DIR', _optional, None),
+    ('default_locale', 'DEFAULT_LOCALE', str, 'en'),
+    ('template_reload_interval', 'TEMPLATE_RELOAD_INTERVAL', float, 2.0),
+    ('code_length', 'CODE_LENGTH', int, 6),
+    ('code_alphabet', 'CODE_ALPHABET', _optional, None),
+    # Verification codes expire after 10 minutes
+    ('code_lifetime', 'CODE_LIFETIME', float, 10 * 60.0),
+    ('cleanup_interval', 'CLEANUP_INTERVAL', float, 60.0),
+    ('metrics_enabled', 'METRICS_ENABLED', _flag(True), True),
+    # Code store backend
+    ('code_store', 'CODE_STORE', str.lower, 'memory'),
+    ('code_secret', 'CODE_SECRET', _optional, None),
+    ('code_step', 'CODE_STEP', float, 60.0),
+    ('code_journal_dir', 'CODE_JOURNAL_DIR', _optional, None),
+    ('code_journal_fsync', 'CODE_JOURNAL_FSYNC', str, 'batch'),
+    ('code_journal_snapshot_every', 'CODE_JOURNAL_SNAPSHOT_EVERY', int, 100000),
+    ('code_store_path', 'CODE_STORE_PATH', str, 'verification_codes.db'),
+    ('redis_url', 'REDIS_URL', str, 'redis://127.0.0.1:6379/0'),
+    ('code_cache_size', 'CODE_CACHE_SIZE', int, 0),
+    ('code_cache_ttl', 'CODE_CACHE_TTL', float, 1.0),
+    # Logging
+    ('log_level', 'LOG_LEVEL', str.upper, 'INFO'),
+    ('log_format', 'LOG_FORMAT', str.lower, 'text'),
+    ('log_file', 'LOG_FILE', str, ''),
+    ('log_success_sample', 'LOG_SUCCESS_SAMPLE', float, 1.0),
+    ('log_redact_codes', 'LOG_REDACT_CODES', _flag(True), True),
+    ('log_queue_size', 'LOG_QUEUE_SIZE', int, 10000),
+    # HTTP API
+    ('api_host', 'API_HOST', str, '127.0.0.1'),
+    ('api_port', 'API_PORT', int, 8080),
+    ('api_workers', 'API_WORKERS', int, 16),
+    ('api_shards', 'API_SHARDS', int, 0),
+    ('api_token', 'API_TOKEN', _optional, None),
+    ('api_expose_codes', 'API_EXPOSE_CODES', _flag(False), False),
+    ('api_trust_proxy', 'API_TRUST_PROXY', _flag(False), False),
+    ('api_max_body', 'API_MAX_BODY', int, 1 << 20),
+    ('api_max_batch', 'API_MAX_BATCH', int, 1000),
+    ('api_keepalive_timeout', 'API_KEEPALIVE_TIMEOUT', float, 15.0),
+    ('api_access_log', 'API_ACCESS_LOG', _flag(False), False),
+    # Shards, a count of 0 means one per CPU
+    ('shard_count', 'SHARD_COUNT', int, 0),
+    ('shard_threads', 'SHARD_THREADS', int, 8),
+    ('shard_call_timeout', 'SHARD_CALL_TIMEOUT', float, 120.0),
+    ('shard_ring_replicas', 'SHARD_RING_REPLICAS', int, 160),
+    # GUI bulk sends, defaults to the SMTP pool size
+    ('bulk_send_workers', 'BULK_SEND_WORKERS', int, None),
+)
+
+
+def _from_values(values):
+    return Settings(**values)
+
+
+class Settings:
+    """Service configuration, parsed once from the environment
+
+    Instances are read-only, so one can be shared between services and
+    threads. replace() derives a copy with some values changed.
+    """
+
+    __slots__ = tuple(field[0] for field in FIELDS)
+
+    def __init__(self, **values):
+        for name, _, _, default in FIELDS:
+            object.__setattr__(self, name, values.pop(name, default))
+        if values:
+            raise TypeError(f"Unknown settings: {', '.join(sorted(values))}")
+
+    @classmethod
+    def from_env(cls, environ=None):
+        environ = os.environ if environ is None else environ
+        values = {}
+        for name, variable, parse, _ in FIELDS:
+            raw = environ.get(variable)
+            if raw is not None:
+                values[name] = parse(raw)
+        return cls(**values)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Settings are read-only, use replace() for a changed copy")
+
+    def replace(self, **changes):
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return Settings(**values)
+
+    def __reduce__(self):
+        # Pickled for spawned shard processes, which cannot go through __setattr__
+        return _from_values, (self.as_dict(),)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        values = self.as_dict()
+        for secret in ('sender_password', 'code_secret', 'api_token'):
+            if values[secret]:
+                values[secret] = '***'
+        return f"Settings({', '.join(f'{name}={value!r}' for name, value in values.items())})"
+
+
+_settings = None
+_env_loaded = False
+_lock = threading.Lock()
+
+
+def load_env():
+    """Read .env into the environment, once per process"""
+    global _env_loaded
+    if not _env_loaded:
+        with _lock:
+            if not _env_loaded:
+                # python-dotenv is only imported when a process first needs its settings
+                from dotenv import load_dotenv
+                load_dotenv()
+                _env_loaded = True
+
+
+def get_settings():
+    """The process-wide settings, loaded on first use"""
+    settings = _settings
+    if settings is None:
+        settings = reload_settings()
+    return settings
+
+
+def reload_settings():
+    """Parse the environment again, for when it changed after the first get_settings()"""
+    global _settings
+    load_env()
+    settings = Settings.from_env()
+    with _lock:
+        _settings = settings
+    return settings
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Sharded multi-process deployment of the email verification service
+A supervisor routes each recipient to one worker process by consistent hash
+"""
+
+import bisect
+import hashlib
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+from metrics import METRICS
+from send_throttle import SendThrottle
+from service_log import configure_logging, get_logger
+from settings import get_settings
+
+log = get_logger('shards')
+
+
+def shard_key(email):
+    """The routing key of an email, so case and whitespace variants share a shard"""
+    return email.strip().lower()
+
+
+def ring_hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes
+
+    Each node owns replicas points on the ring and a key belongs to the
+    first point at or after its hash. Adding or removing a node only moves
+    the keys of the ranges that node gains or loses, about 1/N of them.
+    """
+
+    def __init__(self, nodes=(), replicas=160):
+        self.replicas = replicas
+        self._points = []
+        self._owners = []
+        self.nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for replica in range(self.replicas):
+            point = ring_hash(f"{node}#{replica}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        keep = [index for index, owner in enumerate(self._owners) if owner != node]
+        self._points = [self._points[index] for index in keep]
+        self._owners = [self._owners[index] for index in keep]
+
+    def node_for(self, key):
+        if not self._points:
+            raise LookupError("The hash ring has no nodes")
+        index = bisect.bisect_left(self._points, ring_hash(key))
+        return self._owners[index % len(self._owners)]
+
+    def copy(self):
+        ring = HashRing(replicas=self.replicas)
+        ring._points = list(self._points)
+        ring._owners = list(self._owners)
+        ring.nodes = set(self.nodes)
+        return ring
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+def export_codes(service, ring, name):
+    """Remove and return the codes of emails the ring no longer routes to this shard"""
+    store = service.code_store
+    if store.shared:
+        return []
+    moved = []
+    if store.stateless:
+        for email, window in store.spent_windows():
+            if ring.node_for(shard_key(email)) != name:
+                store.forget(email)
+                moved.append((email, window, None, None))
+        return moved
+    for email, record in store.items():
+        if record is not None and ring.node_for(shard_key(email)) != name:
+            if store.delete(email):
+                moved.append((email, record.code, record.expires_at, record.attempts))
+    return moved
+
+
+def import_codes(service, entries):
+    """Adopt codes exported by another shard"""
+    store = service.code_store
+    for email, code, expires_at, attempts in entries:
+        if store.stateless:
+            store.mark_spent(email, code)
+            continue
+        store.set(email, code, expires_at)
+        for _ in range(attempts or 0):
+            store.add_failed_attempt(email)
+    return len(entries)
+
+
+def run_shard(name, connection, threads, quiet, settings):
+    """Worker process: serve requests from the supervisor on a thread pool
+
+    settings come from the supervisor, the shard does not read the
+    environment itself.
+    """
+    if quiet:
+        sys.stdout = open(os.devnull, 'w')
+    journal_dir = settings.code_journal_dir
+    if journal_dir:
+        settings = settings.replace(code_journal_dir=os.path.join(journal_dir, name))
+
+    from email_service import EmailVerificationService
+
+    # The supervisor applies the resend limits, a shard only sees part of the traffic
+    service = EmailVerificationService(settings.replace(resend_limit_per_recipient=0, resend_limit_per_source=0))
+    operations = {
+        'send': service.deliver_verification_email,
+        'batch': service.send_verification_batch,
+        'verify': service.verify_code,
+        'export': lambda ring: export_codes(service, ring, name),
+        'import': lambda entries: import_codes(service, entries),
+        'metrics': lambda: shard_metrics(service),
+    }
+    send_lock = threading.Lock()
+
+    def handle(request_id, operation, args):
+        try:
+            reply = (request_id, True, operations[operation](*args))
+        except Exception as e:
+            reply = (request_id, False, f"{type(e).__name__}: {e}")
+        with send_lock:
+            connection.send(reply)
+
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"{name}-worker")
+    try:
+        while True:
+            try:
+                request_id, operation, args = connection.recv()
+            except EOFError:
+                break
+            if operation == 'stop':
+                executor.shutdown(wait=True)
+                with send_lock:
+                    connection.send((request_id, True, None))
+                break
+            executor.submit(handle, request_id, operation, args)
+    finally:
+        executor.shutdown(wait=True)
+        service.close()
+        connection.close()
+
+
+def shard_metrics(service):
+    metrics = service.metrics()
+    if not service.code_store.shared:
+        metrics['codes_outstanding'] = len(service.code_store)
+    return metrics
+
+
+class Shard:
+    """Supervisor side of one worker process, calls are matched to replies by id"""
+
+    def __init__(self, name, context, threads, quiet, settings):
+        self.name = name
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=run_shard, args=(name, child_connection, threads, quiet, settings), name=name, daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        self._ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read, name=f"{name}-reader", daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        while True:
+            try:
+                request_id, ok, result = self.connection.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                future = self._pending.pop(request_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(f"{self.name}: {result}"))
+        # The process is gone, nothing pending will be answered
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(ConnectionError(f"{self.name} exited"))
+
+    def submit(self, operation, *args):
+        future = Future()
+        with self._lock:
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            try:
+                self.connection.send((request_id, operation, args))
+            except (OSError, ValueError) as e:
+                del self._pending[request_id]
+                future.set_exception(ConnectionError(f"{self.name} is not reachable: {e}"))
+        return future
+
+    def call(self, operation, *args, timeout=None):
+        return self.submit(operation, *args).result(timeout)
+
+    def stop(self, timeout=30):
+        try:
+            self.call('stop', timeout=timeout)
+        except Exception:
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.connection.close()
+
+
+class ShardSupervisor:
+    """Runs the service as worker processes, each owning the codes of part of the recipients
+
+    Sends and verifications for an email are routed to the same shard by a
+    consistent hash of the address. Adding or removing a shard pauses new
+    requests, waits for those in flight, and moves the codes whose owner
+    changed before routing resumes. Stores shared by every process (SQLite,
+    Redis) need no moving. Resend limits are applied here, per-domain send
+    rates apply per shard.
+
+    Offers the service methods the HTTP API uses, so it can stand in for
+    a single EmailVerificationService.
+    """
+
+    def __init__(self, shards=None, threads=None, replicas=None, quiet=False, settings=None):
+        settings = self.settings = settings or get_settings()
+        configure_logging(settings=settings)
+        METRICS.set_enabled(settings.metrics_enabled)
+        shards = shards or settings.shard_count or os.cpu_count() or 1
+        self.threads = threads or settings.shard_threads
+        self.quiet = quiet
+        self.call_timeout = settings.shard_call_timeout
+        # Spawned rather than forked, the supervisor runs threads and must work on Windows
+        self._context = multiprocessing.get_context('spawn')
+        self.send_throttle = SendThrottle(
+            recipient_limit=settings.resend_limit_per_recipient,
+            source_limit=settings.resend_limit_per_source,
+            window=settings.resend_window,
+            max_keys=settings.resend_max_tracked
+        )
+
+        self.ring = HashRing(replicas=replicas or settings.shard_ring_replicas)
+        self.shards = {}
+        self._names = itertools.count()
+        self._condition = threading.Condition()
+        self._active = 0
+        self._rebalancing = False
+
+        # Counters
+        self.rebalances = 0
+        self.moved_codes = 0
+
+        for _ in range(shards):
+            self._start_shard()
+        if settings.code_journal_dir:
+            # Codes journaled by an earlier run may belong elsewhere under this ring
+            self.rebalance()
+
+    def _start_shard(self):
+        name = f"shard-{next(self._names)}"
+        self.shards[name] = Shard(name, self._context, self.threads, self.quiet, self.settings)
+        self.ring.add(name)
+        return name
+
+    def _route(self, email):
+        """Pick the shard of email and count the request as in flight"""
+        with self._condition:
+            while self._rebalancing:
+                self._condition.wait()
+            self._active += 1
+            return self.shards[self.ring.node_for(shard_key(email))]
+
+    def _done(self):
+        with self._condition:
+            self._active -= 1
+            if not self._active:
+                self._condition.notify_all()
+
+    def _call(self, email, operation, *args):
+        shard = self._route(email)
+        try:
+            return shard.call(operation, *args, timeout=self.call_timeout)
+        finally:
+            self._done()
+
+    @contextmanager
+    def _paused(self):
+        """Hold new requests back and wait for those in flight"""
+        with self._condition:
+            while self._rebalancing:
+                self._condition.wait()
+            self._rebalancing = True
+            while self._active:
+                self._condition.wait()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._rebalancing = False
+                self._condition.notify_all()
+
+    def _move_codes(self):
+        # Caller holds requests paused
+        ring = self.ring.copy()
+        exports = [shard.submit('export', ring) for shard in self.shards.values()]
+        moved = {}
+        for future in exports:
+            for entry in future.result(self.call_timeout):
+                moved.setdefault(ring.node_for(shard_key(entry[0])), []).append(entry)
+        imports = [self.shards[name].submit('import', entries) for name, entries in moved.items()]
+        count = sum(future.result(self.call_timeout) for future in imports)
+        self.rebalances += 1
+        self.moved_codes += count
+        if count:
+            log.info(f"🔀 Moved {count} code(s) across {len(self.ring)} shard(s)", extra={'event': 'rebalanced', 'count': count})
+        return count
+
+    def rebalance(self):
+        """Move every code to the shard the ring routes its email to, returning how many moved"""
+        with self._paused():
+            return self._move_codes()
+
+    def add_shard(self):
+        """Start another worker and hand it its share of the outstanding codes"""
+        with self._paused():
+            name = self._start_shard()
+            self._move_codes()
+        log.info(f"➕ Added {name}, {len(self.shards)} shard(s) running", extra={'event': 'shard_added'})
+        return name
+
+    def remove_shard(self, name=None):
+        """Move the codes of a worker to the others and stop it, the newest worker by default"""
+        with self._paused():
+            if len(self.shards) < 2:
+                raise ValueError("Cannot remove the last shard")
+            name = name or max(self.shards, key=lambda shard: int(shard.rsplit('-', 1)[1]))
+            if name not in self.shards:
+                raise KeyError(name)
+            # Off the ring first, so moving the codes empties it
+            self.ring.remove(name)
+            self._move_codes()
+            shard = self.shards.pop(name)
+        shard.stop()
+        log.info(f"➖ Removed {name}, {len(self.shards)} shard(s) running", extra={'event': 'shard_removed'})
+        return name
+
+    def allow_send(self, recipient_email, source=None):
+        """Check the resend limits before any code is issued or SMTP work is done"""
+        if self.send_throttle.allow(recipient_email, source):
+            return True
+        METRICS.inc('throttled')
+        log.warning(f"🚫 Too many verification emails requested for {recipient_email}, try again later",
+                    extra={'event': 'throttled', 'email': recipient_email})
+        return False
+
+    def deliver_verification_email(self, recipient_email, custom_message="", locale=None):
+        return self._call(recipient_email, 'send', recipient_email, custom_message, locale)
+
+    def send_verification_email(self, recipient_email, custom_message="", locale=None, source=None):
+        if not self.allow_send(recipient_email, source):
+            return False, None
+        return self.deliver_verification_email(recipient_email, custom_message, locale)
+
+    def send_verification_batch(self, recipients, custom_message="", locale=None, source=None):
+        """Split a batch by shard and send the parts in parallel, results in input order"""
+        recipients = list(recipients)
+        results = [None] * len(recipients)
+        groups = {}
+        for index, entry in enumerate(recipients):
+            email = entry if isinstance(entry, str) else entry[0]
+            if not self.allow_send(email, source):
+                results[index] = {'email': email, 'success': False, 'code': None,
+                                  'error': "Too many verification emails requested", 'retrying': False}
+                continue
+            groups.setdefault(shard_key(email), []).append(index)
+        if not groups:
+            return results
+
+        with self._condition:
+            while self._rebalancing:
+                self._condition.wait()
+            self._active += 1
+            parts = {}
+            for key, indexes in groups.items():
+                parts.setdefault(self.ring.node_for(key), []).extend(indexes)
+        try:
+            futures = [(indexes, self.shards[name].submit('batch', [recipients[index] for index in indexes],
+                                                          custom_message, locale))
+                       for name, indexes in parts.items()]
+            # Each shard answers in the order it was given its part
+            for indexes, future in futures:
+                for index, result in zip(indexes, future.result(self.call_timeout)):
+                    results[index] = result
+        finally:
+            self._done()
+        return results
+
+    def verify_code(self, email, entered_code):
+        return self._call(email, 'verify', email, entered_code)
+
+    def metrics(self):
+        shards = {name: shard.submit('metrics') for name, shard in self.shards.items()}
+        return {
+            'shards': {name: future.result(self.call_timeout) for name, future in shards.items()},
+            'send_throttle': self.send_throttle.metrics(),
+            'rebalances': self.rebalances,
+            'moved_codes': self.moved_codes,
+            'instrumentation': METRICS.snapshot(),
+        }
+
+    def close(self):
+        """Stop every worker process"""
+        for shard in list(self.shards.values()):
+            shard.stop()
+        self.shards.clear()
@@ -1,7 +1,10 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
+from tkinter import ttk, messagebox, scrolledtext, filedialog
+import queue
 import threading
 from email_service import EmailVerificationService
+from bulk_sender import BulkSendJob
+from service_log import redact_code
 import os
 import json
 from datetime import datetime
@@ -10,7 +13,7 @@ class SimpleModernGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("📧 Email Verification Service - Modern")
-        self.root.geometry("1000x650")
+        self.root.geometry("1000x800")
         
         # Modern dark theme colors
         self.bg_color = '#2b2b3d'
@@ -21,11 +24,25 @@ class SimpleModernGUI:
         
         self.root.configure(bg=self.bg_color)
         
+        # Log lines and UI updates posted by worker threads, drained on the Tk main loop
+        self.ui_events = queue.SimpleQueue()
+        self.ui_poll_interval = 50
+        self.max_events_per_poll = 2000
+        self.max_log_lines = 2000
+        
         # Settings
         self.settings_file = "app_settings.json"
         self.email_service = EmailVerificationService()
         self.load_settings()
         
+        # Bulk sending
+        self.bulk_job = None
+        self.bulk_file = None
+        self.bulk_workers = self.email_service.settings.bulk_send_workers or self.email_service.smtp_pool_size
+        self.bulk_poll_interval = 500
+        # The log panel only shows codes when LOG_REDACT_CODES=false
+        self.redact_codes = self.email_service.settings.log_redact_codes
+        
         # Setup styles
         self.setup_styles()
         
@@ -37,6 +54,9 @@ class SimpleModernGUI:
         
         # Show startup messages
         self.show_startup_messages()
+        
+        # Start draining UI events
+        self.process_ui_events()
     
     def setup_styles(self):
         """Setup modern ttk styles"""
@@ -98,6 +118,7 @@ class SimpleModernGUI:
         # Create sections
         self.create_config_section(left_frame)
         self.create_send_section(left_frame)
+        self.create_bulk_section(left_frame)
         self.create_verify_section(right_frame)
         self.create_log_section(right_frame)
         self.create_status_bar()
@@ -189,6 +210,52 @@ class SimpleModernGUI:
         send_frame.columnconfigure(1, weight=1)
         send_frame.rowconfigure(1, weight=1)
     
+    def create_bulk_section(self, parent):
+        """Create bulk send section"""
+        # Header
+        tk.Label(parent, text="📦 Bulk Send", 
+                font=('Segoe UI', 12, 'bold'), bg=self.card_color, fg=self.accent_color).pack(pady=(0, 10))
+        
+        bulk_frame = tk.Frame(parent, bg=self.card_color)
+        bulk_frame.pack(fill=tk.X, padx=20, pady=(0, 20))
+        
+        # Recipient list
+        self.bulk_file_var = tk.StringVar(value="No list selected")
+        tk.Label(bulk_frame, textvariable=self.bulk_file_var,
+                font=('Segoe UI', 9), bg=self.card_color, fg=self.secondary_text,
+                anchor=tk.W).grid(row=0, column=0, columnspan=4, sticky=(tk.W, tk.E), pady=5)
+        
+        # Progress
+        self.bulk_progress = ttk.Progressbar(bulk_frame, mode='determinate')
+        self.bulk_progress.grid(row=1, column=0, columnspan=4, sticky=(tk.W, tk.E), pady=5)
+        
+        self.bulk_status_var = tk.StringVar(value="Import a CSV or TXT file of recipients")
+        tk.Label(bulk_frame, textvariable=self.bulk_status_var,
+                font=('Segoe UI', 9), bg=self.card_color, fg=self.text_color,
+                anchor=tk.W).grid(row=2, column=0, columnspan=4, sticky=(tk.W, tk.E), pady=5)
+        
+        # Buttons
+        ttk.Button(bulk_frame, text="📂 Import List", 
+                  style='Modern.TButton',
+                  command=self.choose_bulk_file).grid(row=3, column=0, sticky=tk.W, pady=(10, 0))
+        
+        self.bulk_start_button = ttk.Button(bulk_frame, text="🚀 Start", 
+                                           style='Modern.TButton',
+                                           command=self.start_bulk_send)
+        self.bulk_start_button.grid(row=3, column=1, sticky=tk.E, padx=(5, 0), pady=(10, 0))
+        
+        self.bulk_pause_button = ttk.Button(bulk_frame, text="⏸️ Pause", 
+                                           style='Modern.TButton', state='disabled',
+                                           command=self.toggle_bulk_pause)
+        self.bulk_pause_button.grid(row=3, column=2, sticky=tk.E, padx=(5, 0), pady=(10, 0))
+        
+        self.bulk_cancel_button = ttk.Button(bulk_frame, text="⏹️ Cancel", 
+                                            style='Modern.TButton', state='disabled',
+                                            command=self.cancel_bulk_send)
+        self.bulk_cancel_button.grid(row=3, column=3, sticky=tk.E, padx=(5, 0), pady=(10, 0))
+        
+        bulk_frame.columnconfigure(1, weight=1)
+    
     def create_verify_section(self, parent):
         """Create verification section"""
         # Header
@@ -275,13 +342,49 @@ class SimpleModernGUI:
         self.log_message("💼 Ready to send verification emails!")
     
     def log_message(self, message):
-        """Add message to log"""
+        """Add message to log, safe to call from any thread"""
         timestamp = datetime.now().strftime("%H:%M:%S")
+        self.ui_events.put((f"[{timestamp}] {message}\n", None, None))
+    
+    def run_on_ui(self, callback, *args):
+        """Run callback on the Tk main loop, safe to call from any thread"""
+        self.ui_events.put((None, callback, args))
+    
+    def process_ui_events(self):
+        """Drain queued log lines and UI updates, inserting log lines in batches"""
+        lines = []
+        try:
+            for _ in range(self.max_events_per_poll):
+                line, callback, args = self.ui_events.get_nowait()
+                if line is not None:
+                    lines.append(line)
+                    continue
+                # Keep the log in order with the update
+                self.append_log(lines)
+                lines = []
+                try:
+                    callback(*args)
+                except Exception as e:
+                    lines.append(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠️ UI update failed: {e}\n")
+        except queue.Empty:
+            pass
+        self.append_log(lines)
+        self.root.after(self.ui_poll_interval, self.process_ui_events)
+    
+    def append_log(self, lines):
+        """Insert log lines in one go and trim the log to max_log_lines"""
+        if not lines:
+            return
+        if len(lines) > self.max_log_lines:
+            lines = lines[-self.max_log_lines:]
         self.log_text.config(state=tk.NORMAL)
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
+        self.log_text.insert(tk.END, ''.join(lines))
+        # The text always ends with an empty line after the last newline
+        excess = int(self.log_text.index('end-1c').split('.')[0]) - 1 - self.max_log_lines
+        if excess > 0:
+            self.log_text.delete('1.0', f'{excess + 1}.0')
         self.log_text.config(state=tk.DISABLED)
         self.log_text.see(tk.END)
-        self.root.update_idletasks()
     
     def clear_log(self):
         """Clear log"""
@@ -376,46 +479,161 @@ APP_NAME=Email Verification Service"""
     
     def send_email_threaded(self):
         """Send email in thread"""
+        # Tk widgets are only touched here and in callbacks run on the main loop
+        recipient = self.recipient_email_var.get().strip()
+        custom_message = self.custom_message_text.get(1.0, tk.END).strip()
+        
+        if not recipient:
+            messagebox.showerror("Error", "Please enter recipient email")
+            return
+        
+        if not self.email_service.sender_email or not self.email_service.sender_password:
+            messagebox.showerror("Error", "Please configure email settings")
+            return
+        
+        self.send_button.config(state='disabled')
+        self.status_var.set("🚀 Sending email...")
+        self.log_message(f"📤 Sending verification email to {recipient}")
+        
         def send_email():
             try:
-                recipient = self.recipient_email_var.get().strip()
-                custom_message = self.custom_message_text.get(1.0, tk.END).strip()
-                
-                if not recipient:
-                    messagebox.showerror("Error", "Please enter recipient email")
-                    return
-                
-                if not self.email_service.sender_email or not self.email_service.sender_password:
-                    messagebox.showerror("Error", "Please configure email settings")
-                    return
-                
-                self.send_button.config(state='disabled')
-                self.status_var.set("🚀 Sending email...")
-                self.log_message(f"📤 Sending verification email to {recipient}")
-                
                 success, code = self.email_service.send_verification_email(recipient, custom_message)
                 
                 if success:
-                    self.add_recent_recipient(recipient)
-                    self.save_settings()
                     self.log_message(f"✅ Email sent to {recipient}")
-                    self.log_message(f"🔢 Code: {code}")
-                    self.verify_email_var.set(recipient)
-                    self.status_var.set("🟢 Email sent successfully")
-                    messagebox.showinfo("Success", f"Email sent to {recipient}\nCode: {code}")
+                    self.log_message(f"🔢 Code: {redact_code(code, self.redact_codes)}")
+                    self.run_on_ui(self.on_email_sent, recipient, code)
                 else:
                     self.log_message(f"❌ Failed to send email to {recipient}")
-                    self.status_var.set("🔴 Failed to send email")
-                    messagebox.showerror("Error", "Failed to send email")
+                    self.run_on_ui(self.on_email_failed, "Failed to send email")
             except Exception as e:
                 self.log_message(f"❌ Error: {e}")
-                self.status_var.set("🔴 Error occurred")
-                messagebox.showerror("Error", f"Error: {e}")
-            finally:
-                self.send_button.config(state='normal')
+                self.run_on_ui(self.on_email_failed, f"Error: {e}", "🔴 Error occurred")
         
         threading.Thread(target=send_email, daemon=True).start()
     
+    def on_email_sent(self, recipient, code):
+        """Update the UI after a sent email"""
+        self.send_button.config(state='normal')
+        self.add_recent_recipient(recipient)
+        self.save_settings()
+        self.verify_email_var.set(recipient)
+        self.status_var.set("🟢 Email sent successfully")
+        messagebox.showinfo("Success", f"Email sent to {recipient}\nCode: {code}")
+    
+    def on_email_failed(self, message, status="🔴 Failed to send email"):
+        """Update the UI after a failed send"""
+        self.send_button.config(state='normal')
+        self.status_var.set(status)
+        messagebox.showerror("Error", message)
+    
+    def choose_bulk_file(self):
+        """Pick the recipient list for a bulk send"""
+        path = filedialog.askopenfilename(
+            title="Select recipient list",
+            filetypes=[("Recipient lists", "*.csv *.txt"), ("All files", "*.*")]
+        )
+        if path:
+            self.bulk_file = path
+            self.bulk_file_var.set(f"📄 {os.path.basename(path)}")
+            self.log_message(f"📂 Recipient list selected: {path}")
+    
+    def start_bulk_send(self):
+        """Start sending to every recipient in the selected list"""
+        if not self.bulk_file:
+            messagebox.showerror("Error", "Please import a recipient list")
+            return
+        
+        if not self.email_service.sender_email or not self.email_service.sender_password:
+            messagebox.showerror("Error", "Please configure email settings")
+            return
+        
+        custom_message = self.custom_message_text.get(1.0, tk.END).strip()
+        
+        def on_result(email, status, error):
+            # Only problems are logged, a large list would flood the log otherwise
+            if status == 'failed':
+                self.log_message(f"❌ Bulk send to {email} failed: {error}")
+            elif status == 'retrying':
+                self.log_message(f"⏳ Bulk send to {email} is being retried: {error}")
+            elif status == 'throttled':
+                self.log_message(f"🚫 Bulk send to {email} skipped, too many recent requests")
+        
+        try:
+            self.bulk_job = BulkSendJob(self.email_service, self.bulk_file,
+                                        workers=self.bulk_workers,
+                                        custom_message=custom_message,
+                                        on_result=on_result)
+            self.bulk_job.start()
+        except Exception as e:
+            self.bulk_job = None
+            self.log_message(f"❌ Could not start bulk send: {e}")
+            messagebox.showerror("Error", f"Could not start bulk send: {e}")
+            return
+        
+        self.bulk_start_button.config(state='disabled')
+        self.bulk_pause_button.config(state='normal', text="⏸️ Pause")
+        self.bulk_cancel_button.config(state='normal')
+        self.status_var.set("📦 Bulk send running...")
+        self.log_message(f"📦 Bulk send started with {self.bulk_job.worker_count} senders")
+        self.log_message(f"📝 Writing report to {self.bulk_job.report_path}")
+        self.update_bulk_progress()
+    
+    def toggle_bulk_pause(self):
+        """Pause or resume the running bulk send"""
+        if self.bulk_job is None:
+            return
+        if self.bulk_job.paused:
+            self.bulk_job.resume()
+            self.bulk_pause_button.config(text="⏸️ Pause")
+            self.status_var.set("📦 Bulk send running...")
+            self.log_message("▶️ Bulk send resumed")
+        else:
+            self.bulk_job.pause()
+            self.bulk_pause_button.config(text="▶️ Resume")
+            self.status_var.set("⏸️ Bulk send paused")
+            self.log_message("⏸️ Bulk send paused, emails already sending will finish")
+    
+    def cancel_bulk_send(self):
+        """Cancel the running bulk send"""
+        if self.bulk_job is None:
+            return
+        self.bulk_job.cancel()
+        self.bulk_pause_button.config(state='disabled')
+        self.bulk_cancel_button.config(state='disabled')
+        self.status_var.set("⏹️ Cancelling bulk send...")
+        self.log_message("⏹️ Cancelling bulk send, emails already sending will finish")
+    
+    def update_bulk_progress(self):
+        """Refresh the bulk progress display until the job ends"""
+        job = self.bulk_job
+        if job is None:
+            return
+        progress = job.progress()
+        total, done = progress['total'], progress['done']
+        if total:
+            self.bulk_progress.config(maximum=total, value=done)
+        eta = progress['eta']
+        eta_text = f"{int(eta // 60)}m {int(eta % 60):02d}s" if eta is not None else "--"
+        self.bulk_status_var.set(
+            f"{done}/{total if total is not None else '?'} · ✅ {progress['sent']} · ⏳ {progress['retrying']}"
+            f" · 🚫 {progress['throttled']} · ❌ {progress['failed']} · {progress['rate']:.1f}/s · ETA {eta_text}"
+        )
+        
+        if progress['state'] in ('finished', 'cancelled'):
+            self.bulk_job = None
+            self.bulk_start_button.config(state='normal')
+            self.bulk_pause_button.config(state='disabled', text="⏸️ Pause")
+            self.bulk_cancel_button.config(state='disabled')
+            verb = "finished" if progress['state'] == 'finished' else "cancelled"
+            self.status_var.set(f"🟢 Bulk send {verb}")
+            self.log_message(f"📦 Bulk send {verb}: {progress['sent']} sent, {progress['retrying']} retrying, "
+                             f"{progress['throttled']} throttled, {progress['failed']} failed "
+                             f"in {progress['elapsed']:.1f}s")
+            self.log_message(f"📝 Report saved to {job.report_path}")
+            return
+        self.root.after(self.bulk_poll_interval, self.update_bulk_progress)
+    
     def verify_code(self):
         """Verify code"""
         try:
@@ -445,6 +663,8 @@ APP_NAME=Email Verification Service"""
     
     def on_closing(self):
         """Handle window closing"""
+        if self.bulk_job is not None:
+            self.bulk_job.cancel()
         self.save_settings()
         self.log_message("👋 Goodbye!")
         self.root.destroy()
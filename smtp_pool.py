@@ -0,0 +1,166 @@
+import smtplib
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from metrics import METRICS
+
+
+class SMTPConnectionPool:
+    """Pool of authenticated SMTP sessions that are reused between sends"""
+
+    def __init__(self, host, port, username=None, password=None, max_size=4,
+                 idle_timeout=60, timeout=30, use_tls=True):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_size = max(1, int(max_size))
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.use_tls = use_tls
+
+        # Idle sessions as (connection, last_used) pairs, most recent on the right
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._closed = False
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.discarded = 0
+
+    def _connect(self):
+        """Open, secure and authenticate a new SMTP session"""
+        with METRICS.timer('smtp_connect'):
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                with METRICS.timer('smtp_tls'):
+                    server.starttls()
+            if self.username and self.password:
+                with METRICS.timer('smtp_auth'):
+                    server.login(self.username, self.password)
+        except Exception:
+            self._close_quietly(server)
+            raise
+        with self._lock:
+            self.created += 1
+        return server
+
+    @staticmethod
+    def _close_quietly(server):
+        """Close a session without raising on an already broken connection"""
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _is_alive(server):
+        """Health check an idle session with NOOP"""
+        try:
+            return server.noop()[0] == 250
+        except Exception:
+            return False
+
+    def acquire(self):
+        """Get a healthy session from the pool, connecting if none is available"""
+        if self._closed:
+            raise RuntimeError("SMTP connection pool is closed")
+
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    server, last_used = self._idle.pop()
+
+                if time.monotonic() - last_used > self.idle_timeout or not self._is_alive(server):
+                    self._close_quietly(server)
+                    with self._lock:
+                        self.discarded += 1
+                    continue
+
+                with self._lock:
+                    self.hits += 1
+                return server
+
+            with self._lock:
+                self.misses += 1
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, server, discard=False):
+        """Return a session to the pool, or drop it after a server error"""
+        try:
+            if discard or self._closed:
+                self._close_quietly(server)
+                with self._lock:
+                    self.discarded += 1
+            else:
+                with self._lock:
+                    self._idle.append((server, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def _reset_or_discard(self, server):
+        """Reset the transaction so the session can be reused"""
+        try:
+            server.rset()
+        except Exception:
+            self.release(server, discard=True)
+        else:
+            self.release(server)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a session for the duration of a with block"""
+        server = self.acquire()
+        try:
+            yield server
+        except smtplib.SMTPServerDisconnected:
+            self.release(server, discard=True)
+            raise
+        except OSError as e:
+            # SMTPException derives from OSError, only socket errors break the session
+            if not isinstance(e, smtplib.SMTPException):
+                self.release(server, discard=True)
+                raise
+            self._reset_or_discard(server)
+            raise
+        except Exception:
+            self._reset_or_discard(server)
+            raise
+        else:
+            self.release(server)
+
+    def close(self):
+        """Close every idle session and refuse further checkouts"""
+        self._closed = True
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for server, _ in idle:
+            self._close_quietly(server)
+
+    def stats(self):
+        """Return pool counters"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'created': self.created,
+                'discarded': self.discarded,
+                'idle': len(self._idle),
+                'max_size': self.max_size,
+            }
@@ -9,6 +9,14 @@ import os
 
 def main():
     print("🚀 Starting Email Verification Service...")
+    
+    if '--headless' in sys.argv[1:]:
+        # The HTTP API needs neither tkinter nor the GUI modules, so they are never imported
+        sys.argv.remove('--headless')
+        from api_server import main as api_main
+        api_main()
+        return
+    
     print("📧 Modern UI Loading...")
     
     try:
@@ -0,0 +1,155 @@
+import hashlib
+import hmac
+import math
+import threading
+import time
+
+from code_store import EXPIRED, INVALID, MISSING, VERIFIED, CodeStore, ExpiryIndex, PendingCode, codes_match
+
+
+class StatelessCodeStore(CodeStore):
+    """Codes derived from an HMAC of the email and issue time, nothing is stored per code
+
+    Time is cut into step-second windows and the code of a window is an
+    HMAC-SHA256 of the email and window number under a server secret, so
+    any process holding the secret can check a code. A code stays valid
+    for lifetime seconds, give or take one step. The only state is a cache
+    of emails whose codes were consumed or revoked, which lets an email's
+    codes be used once and is pruned as they expire. That cache and the
+    verification lockout are per process.
+
+    Every window within the lifetime has a live code, so a guess is about
+    lifetime / step times likelier to hit than with stored codes. Wrong
+    guesses are not counted per code, the verification lockout bounds them.
+    """
+
+    stateless = True
+
+    def __init__(self, secret, digits=6, lifetime=600, step=60):
+        if not secret:
+            raise ValueError("A secret is required for stateless verification codes")
+        secret = secret.encode() if isinstance(secret, str) else secret
+        # Keyed once, copying the keyed state skips rehashing the secret per code
+        self._mac = hmac.new(secret, digestmod=hashlib.sha256)
+        self.digits = digits
+        self.step = step
+        self.windows = max(1, math.ceil(lifetime / step))
+        self._modulus = 10 ** digits
+        # email -> last consumed window, codes of that window or earlier are spent
+        self.consumed = {}
+        self.expiry_index = ExpiryIndex()
+        self._lock = threading.Lock()
+
+    def code_for(self, email, window):
+        """The code of email for one time window"""
+        mac = self._mac.copy()
+        mac.update(f"{email}\0{window}".encode())
+        digest = mac.digest()
+        # 64 bits leave a negligible modulo bias for up to 12 digits
+        return str(int.from_bytes(digest[:8], 'big') % self._modulus).zfill(self.digits)
+
+    def _issue_window(self, email, now):
+        window = int(now // self.step)
+        spent = self.consumed.get(email)
+        if spent is not None and spent >= window:
+            # The code of this window was already used, hand out the next one
+            window = spent + 1
+        return window
+
+    def _expires_at(self, window):
+        return (window + self.windows) * self.step
+
+    def issue(self, email, now=None):
+        """Derive the code to send to email, returning (code, expires_at)"""
+        now = time.time() if now is None else now
+        window = self._issue_window(email, now)
+        return self.code_for(email, window), self._expires_at(window)
+
+    def set(self, email, code, expires_at):
+        raise TypeError("Stateless codes are derived with issue(), not stored")
+
+    def get(self, email):
+        now = time.time()
+        window = self._issue_window(email, now)
+        return PendingCode(self.code_for(email, window), self._expires_at(window))
+
+    def is_outstanding(self, email, code, now=None):
+        now = time.time() if now is None else now
+        return self._match(email, code, int(now // self.step)) is not None
+
+    def _match(self, email, entered_code, current):
+        spent = self.consumed.get(email, current - self.windows)
+        # Windows ahead of the current one are only handed out after the current code was spent
+        newest = max(current, spent + 1)
+        for window in range(newest, max(spent, current - self.windows), -1):
+            if codes_match(self.code_for(email, window), entered_code):
+                return window
+        return None
+
+    def _consume(self, email, window):
+        # Caller holds the lock
+        spent = self.consumed.get(email)
+        if spent is None or window > spent:
+            self.consumed[email] = window
+            self.expiry_index.push(self._expires_at(window + 1), email)
+
+    def delete(self, email):
+        """Revoke every code issued to email so far"""
+        with self._lock:
+            self._consume(email, self._issue_window(email, time.time()))
+        return True
+
+    def add_failed_attempt(self, email):
+        return 0
+
+    def spent_windows(self):
+        """(email, last consumed window) pairs, for handing emails to another process"""
+        with self._lock:
+            return list(self.consumed.items())
+
+    def mark_spent(self, email, window):
+        """Adopt a consumed window from another process"""
+        with self._lock:
+            self._consume(email, window)
+
+    def forget(self, email):
+        """Drop the consumed window of an email handed to another process"""
+        with self._lock:
+            self.consumed.pop(email, None)
+
+    def verify(self, email, entered_code, now, max_attempts):
+        current = int(now // self.step)
+        with self._lock:
+            window = self._match(email, entered_code, current)
+            if window is not None:
+                self._consume(email, window)
+                return VERIFIED
+        spent = self.consumed.get(email)
+        if spent is not None and spent >= current - self.windows + 1:
+            # Every code still in its lifetime might have been spent
+            for window in range(spent, current - self.windows, -1):
+                if codes_match(self.code_for(email, window), entered_code):
+                    return MISSING
+        # One window further back tells an expired code apart from a wrong one
+        if codes_match(self.code_for(email, current - self.windows), entered_code):
+            return EXPIRED
+        return INVALID
+
+    def _is_due(self, email, now):
+        spent = self.consumed.get(email)
+        return spent is not None and now >= self._expires_at(spent + 1)
+
+    def pop_expired(self, now=None):
+        """Forget consumed emails whose codes have all expired, no codes are kept to expire"""
+        now = time.time() if now is None else now
+        with self._lock:
+            for email in self.expiry_index.pop_due(now, self._is_due):
+                self.consumed.pop(email, None)
+        return []
+
+    def items(self):
+        return []
+
+    def __len__(self):
+        # Outstanding codes are not tracked
+        return 0
@@ -0,0 +1,63 @@
+import asyncio
+import io
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_smtp_server import FakeSMTPServer
+from service_log import configure_logging, shutdown_logging
+from settings import get_settings
+
+
+def drop_clients(server):
+    """Abort every client connection of a FakeSMTPServer running in its thread"""
+    async def abort():
+        for writer in list(server._handlers.values()):
+            writer.transport.abort()
+
+    asyncio.run_coroutine_threadsafe(abort(), server._loop).result()
+
+
+@pytest.fixture(scope='session', autouse=True)
+def quiet_logging():
+    """Keep service logs in memory, pytest closes the streams it captures"""
+    configure_logging(stream=io.StringIO(), force=True)
+    yield
+    shutdown_logging()
+
+
+@pytest.fixture
+def smtp_server():
+    server = FakeSMTPServer().start_in_thread()
+    yield server
+    server.stop_thread()
+
+
+@pytest.fixture
+def settings(smtp_server, tmp_path):
+    """Settings pointing at the fake SMTP server, without background sweeps or files"""
+    return get_settings().replace(
+        sender_email='sender@example.com',
+        sender_password='secret',
+        smtp_server='127.0.0.1',
+        smtp_port=smtp_server.port,
+        smtp_use_tls=False,
+        cleanup_interval=0,
+        code_store='memory',
+        code_journal_dir=None,
+        code_store_path=str(tmp_path / 'codes.db'),
+        dead_letter_file=None,
+        log_file='',
+    )
+
+
+@pytest.fixture
+def service(settings):
+    from email_service import EmailVerificationService
+    service = EmailVerificationService(settings)
+    yield service
+    service.close()
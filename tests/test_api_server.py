@@ -0,0 +1,172 @@
+import http.client
+import json
+import socket
+
+import pytest
+
+from api_server import ApiServer
+from email_service import EmailVerificationService
+
+TOKEN = 'test-token'
+
+
+@pytest.fixture
+def api(settings):
+    service = EmailVerificationService(settings.replace(resend_limit_per_recipient=2))
+    server = ApiServer(service, port=0, workers=2, token=TOKEN, expose_codes=True, max_body=4096, max_batch=3)
+    server.start_in_thread()
+    yield server
+    server.stop()
+    service.close()
+
+
+def request(api, method, path, body=None, token=TOKEN, raw=None):
+    connection = http.client.HTTPConnection(api.host, api.port, timeout=10)
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    data = raw if raw is not None else (json.dumps(body) if body is not None else None)
+    if data is not None:
+        headers['Content-Type'] = 'application/json'
+    connection.request(method, path, data, headers)
+    response = connection.getresponse()
+    payload = response.read()
+    connection.close()
+    if response.getheader('Content-Type') == 'application/json':
+        payload = json.loads(payload)
+    return response.status, payload
+
+
+def test_health_needs_no_token(api):
+    assert request(api, 'GET', '/health', token=None) == (200, {'status': 'ok'})
+
+
+@pytest.mark.parametrize('token', [None, 'wrong-token'])
+def test_other_routes_need_the_token(api, token):
+    status, payload = request(api, 'POST', '/send', {'email': 'a@example.com'}, token=token)
+
+    assert status == 401
+    assert payload == {'error': "A valid bearer token is required"}
+
+
+def test_unknown_route_and_wrong_method(api):
+    assert request(api, 'GET', '/nowhere')[0] == 404
+    status, payload = request(api, 'GET', '/send')
+    assert status == 405
+    assert payload == {'error': "Use POST for /send"}
+
+
+def test_send_and_verify(api, smtp_server):
+    status, payload = request(api, 'POST', '/send', {'email': ' a@example.com '})
+    assert status == 200
+    assert payload['success'] and payload['email'] == 'a@example.com'
+    assert smtp_server.message_count == 1
+    code = payload['code']
+
+    assert request(api, 'POST', '/verify', {'email': 'a@example.com', 'code': 'wrong'}) == (
+        200, {'valid': False, 'message': "Invalid verification code"})
+    assert request(api, 'POST', '/verify', {'email': 'a@example.com', 'code': code}) == (
+        200, {'valid': True, 'message': "Verification successful"})
+
+
+def test_verify_needs_a_code(api):
+    status, payload = request(api, 'POST', '/verify', {'email': 'a@example.com'})
+
+    assert (status, payload) == (400, {'error': "'code' must be a string"})
+
+
+@pytest.mark.parametrize('body, message', [
+    ({}, "'email' must be an email address"),
+    ({'email': 'not an address'}, "'email' must be an email address"),
+    ({'email': 'a@example.com\r\nBcc: b@example.com'}, "'email' must be an email address"),
+    ({'email': 'a@example.com', 'message': 5}, "'message' must be a string of at most 2000 characters"),
+])
+def test_invalid_send_bodies_are_rejected(api, smtp_server, body, message):
+    assert request(api, 'POST', '/send', body) == (400, {'error': message})
+    assert smtp_server.message_count == 0
+
+
+def test_malformed_json_is_rejected(api):
+    assert request(api, 'POST', '/send', raw='{"email":') == (400, {'error': "Request body must be JSON"})
+    assert request(api, 'POST', '/send', raw='[1, 2]') == (400, {'error': "Request body must be a JSON object"})
+
+
+def test_oversized_body_is_rejected(api):
+    status, payload = request(api, 'POST', '/send', {'email': 'a@example.com', 'message': 'x' * 5000})
+
+    assert (status, payload) == (413, {'error': "Request body too large"})
+
+
+def test_missing_content_length_is_rejected(api):
+    with socket.create_connection((api.host, api.port), timeout=10) as sock:
+        sock.sendall(f"POST /send HTTP/1.1\r\nHost: x\r\nAuthorization: Bearer {TOKEN}\r\n\r\n".encode())
+        reply = sock.recv(4096)
+
+    assert reply.startswith(b'HTTP/1.1 411 ')
+
+
+def test_resend_limit_answers_429(api):
+    for _ in range(2):
+        assert request(api, 'POST', '/send', {'email': 'a@example.com'})[0] == 200
+    status, _ = request(api, 'POST', '/send', {'email': 'a@example.com'})
+
+    assert status == 429
+
+
+def test_batch_results_follow_the_recipients(api, smtp_server):
+    body = {
+        'recipients': ['a@one.com', {'email': 'b@two.com', 'message': 'Own message'}, {'email': 'c@three.com'}],
+        'message': 'Batch message',
+    }
+    status, payload = request(api, 'POST', '/send/batch', body)
+
+    assert status == 200
+    assert [result['email'] for result in payload['results']] == ['a@one.com', 'b@two.com', 'c@three.com']
+    assert all(result['success'] and result['code'] for result in payload['results'])
+    bodies = {recipients[0]: message for _, recipients, message in smtp_server.messages}
+    assert b'Batch message' in bodies['a@one.com']
+    assert b'Own message' in bodies['b@two.com'] and b'Batch message' not in bodies['b@two.com']
+    # A recipient object without a message falls back to the batch's
+    assert b'Batch message' in bodies['c@three.com']
+
+
+@pytest.mark.parametrize('body, status, message', [
+    ({'recipients': []}, 400, "'recipients' must be a non-empty list"),
+    ({'recipients': 'a@one.com'}, 400, "'recipients' must be a non-empty list"),
+    ({'recipients': ['a@one.com', 'bad']}, 400, "'recipients' must be an email address"),
+    ({'recipients': [{'email': 'bad'}]}, 400, "'email' must be an email address"),
+    ({'recipients': ['a@one.com'] * 4}, 413, "At most 3 recipients per batch"),
+])
+def test_invalid_batches_are_rejected(api, smtp_server, body, status, message):
+    assert request(api, 'POST', '/send/batch', body) == (status, {'error': message})
+    assert smtp_server.message_count == 0
+
+
+def test_codes_are_hidden_unless_exposed(settings, smtp_server):
+    service = EmailVerificationService(settings)
+    server = ApiServer(service, port=0, workers=1).start_in_thread()
+    try:
+        status, payload = request(server, 'POST', '/send/batch', {'recipients': ['a@one.com']}, token=None)
+    finally:
+        server.stop()
+        service.close()
+
+    assert status == 200
+    assert 'code' not in payload['results'][0]
+
+
+def test_metrics_count_requests(api):
+    request(api, 'GET', '/health')
+    request(api, 'GET', '/nowhere')
+    status, payload = request(api, 'GET', '/metrics')
+
+    assert status == 200
+    assert payload['server']['requests'] == {'/health': 1, 'other': 1}
+    assert payload['server']['statuses'] == {'200': 1, '404': 1}
+    assert 'instrumentation' in payload['service']
+
+
+def test_prometheus_metrics_are_text(api):
+    request(api, 'POST', '/send', {'email': 'a@example.com'})
+    status, payload = request(api, 'GET', '/metrics?format=prometheus')
+
+    assert status == 200
+    assert b'# TYPE email_verification_sent_total counter' in payload
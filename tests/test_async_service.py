@@ -0,0 +1,151 @@
+import asyncio
+import smtplib
+import threading
+
+import pytest
+
+from async_email_service import AsyncEmailVerificationService, AsyncSMTPClient
+from conftest import drop_clients
+from fake_smtp_server import FakeSMTPServer
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+@pytest.fixture
+def async_service(settings):
+    service = AsyncEmailVerificationService(max_concurrency=2, settings=settings)
+    yield service
+    service.close()
+
+
+def test_send_and_verify(async_service, smtp_server):
+    async def scenario():
+        sent, code = await async_service.send_verification_email_async('user@example.com')
+        verified = await async_service.verify_code_async('user@example.com', code)
+        await async_service.aclose()
+        return sent, verified
+
+    sent, verified = run(scenario())
+    assert sent
+    assert verified[0]
+    assert smtp_server.message_count == 1
+    assert smtp_server.messages[0][:2] == ('sender@example.com', ['user@example.com'])
+
+
+def test_sequential_sends_reuse_the_session(async_service, smtp_server):
+    async def scenario():
+        for i in range(3):
+            assert (await async_service.send_verification_email_async(f'user{i}@example.com'))[0]
+        await async_service.aclose()
+
+    run(scenario())
+    assert smtp_server.connection_count == 1
+    assert smtp_server.message_count == 3
+
+
+def test_batch_is_bounded_by_max_concurrency(async_service, smtp_server):
+    emails = [f'user{i}@d{i % 3}.com' for i in range(10)]
+
+    async def scenario():
+        results = await async_service.send_verification_batch_async(emails)
+        await async_service.aclose()
+        return results
+
+    results = run(scenario())
+    assert [result['email'] for result in results] == emails
+    assert all(result['success'] for result in results)
+    assert smtp_server.connection_count <= async_service.max_concurrency
+    assert smtp_server.message_count == len(emails)
+
+
+def test_rejected_message_keeps_the_session(settings):
+    server = FakeSMTPServer(error_rate=1.0, error_code=550).start_in_thread()
+    service = AsyncEmailVerificationService(settings=settings.replace(smtp_port=server.port))
+
+    async def scenario():
+        results = [await service.send_verification_email_async(f'user{i}@example.com') for i in range(2)]
+        await service.aclose()
+        return results
+
+    try:
+        results = run(scenario())
+    finally:
+        server.stop_thread()
+
+    assert results == [(False, None), (False, None)]
+    assert server.connection_count == 1
+    assert server.rejected_count == 2
+
+
+def test_client_dot_stuffs_message_lines(smtp_server):
+    async def scenario():
+        client = AsyncSMTPClient('127.0.0.1', smtp_server.port)
+        await client.connect(use_tls=False)
+        await client.sendmail('a@example.com', ['b@example.com'], b'Subject: hi\r\n\r\n.hidden\r\nend\r\n')
+        await client.quit()
+
+    run(scenario())
+    assert smtp_server.messages[0][2] == b'Subject: hi\r\n\r\n.hidden\r\nend\r\n'
+
+
+def test_client_refuses_line_breaks_in_commands(smtp_server):
+    async def scenario():
+        client = AsyncSMTPClient('127.0.0.1', smtp_server.port)
+        await client.connect(use_tls=False)
+        try:
+            with pytest.raises(ValueError):
+                await client.command('MAIL FROM:<a@example.com>\r\nRCPT TO:<b@example.com>')
+            code, _ = await client.noop()
+        finally:
+            await client.quit()
+        return code
+
+    assert run(scenario()) == 250
+
+
+def test_client_raises_when_the_server_disconnects(smtp_server):
+    async def scenario():
+        client = AsyncSMTPClient('127.0.0.1', smtp_server.port)
+        await client.connect(use_tls=False)
+        drop_clients(smtp_server)
+        try:
+            await client.noop()
+        finally:
+            client.close()
+
+    with pytest.raises((smtplib.SMTPServerDisconnected, ConnectionError)):
+        run(scenario())
+
+
+def test_dropped_idle_session_is_replaced(async_service, smtp_server):
+    async def scenario():
+        assert (await async_service.send_verification_email_async('first@example.com'))[0]
+        drop_clients(smtp_server)
+        assert (await async_service.send_verification_email_async('second@example.com'))[0]
+        await async_service.aclose()
+
+    run(scenario())
+    assert smtp_server.connection_count == 2
+    assert smtp_server.message_count == 2
+
+
+def test_store_calls_run_off_the_event_loop(async_service, smtp_server):
+    threads = []
+    store_set = async_service.code_store.set
+
+    def recording_set(*args):
+        threads.append(threading.current_thread())
+        return store_set(*args)
+
+    async_service.code_store.set = recording_set
+
+    async def scenario():
+        await async_service.send_verification_email_async('a@example.com')
+        await async_service.send_verification_batch_async(['b@example.com', 'c@example.com'])
+        await async_service.aclose()
+
+    run(scenario())
+    assert len(threads) == 3
+    assert threading.main_thread() not in threads
@@ -0,0 +1,83 @@
+import socket
+
+import pytest
+
+from email_service import EmailVerificationService
+from fake_smtp_server import FakeSMTPServer
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def down_service(settings):
+    service = EmailVerificationService(settings.replace(smtp_port=unused_port(), send_retry_attempts=1))
+    yield service
+    service.close()
+
+
+def test_batch_sends_over_one_session_in_input_order(service, smtp_server):
+    emails = ['a1@one.com', 'b1@two.com', 'a2@one.com', 'c1@three.com', 'a3@one.com']
+    results = service.send_verification_batch(emails)
+
+    assert [result['email'] for result in results] == emails
+    assert all(result['success'] and result['error'] is None for result in results)
+    assert smtp_server.connection_count == 1
+    assert smtp_server.message_count == len(emails)
+    for result in results:
+        assert service.verify_code(result['email'], result['code'])[0]
+
+
+def test_batch_takes_custom_messages_per_recipient(service, smtp_server):
+    results = service.send_verification_batch([('a@one.com', 'Welcome aboard'), 'b@two.com'])
+
+    assert [result['success'] for result in results] == [True, True]
+    bodies = {recipients[0]: body for _, recipients, body in smtp_server.messages}
+    assert b'Welcome aboard' in bodies['a@one.com']
+    assert b'Welcome aboard' not in bodies['b@two.com']
+
+
+def test_batch_continues_past_rejected_recipients(settings):
+    server = FakeSMTPServer(error_rate=1.0, error_code=550).start_in_thread()
+    service = EmailVerificationService(settings.replace(smtp_port=server.port))
+    try:
+        emails = ['a@one.com', 'b@two.com', 'c@three.com']
+        results = service.send_verification_batch(emails)
+    finally:
+        service.close()
+        server.stop_thread()
+
+    assert [result['email'] for result in results] == emails
+    assert not any(result['success'] or result['retrying'] for result in results)
+    assert all('550' in result['error'] for result in results)
+    assert server.connection_count == 1
+    assert server.rejected_count == len(emails)
+
+
+def test_batch_fails_fast_when_smtp_is_down(down_service):
+    emails = ['a@one.com', 'b@two.com', 'c@one.com', 'd@three.com']
+    results = down_service.send_verification_batch(emails)
+
+    assert [result['email'] for result in results] == emails
+    assert not any(result['success'] or result['retrying'] for result in results)
+    assert all(result['code'] is None and result['error'] for result in results)
+    # One dial for the whole batch, not one per recipient
+    stats = down_service.get_smtp_pool().stats()
+    assert stats['misses'] == 1
+    assert stats['created'] == 0
+    assert len(down_service.code_store) == 0
+
+
+def test_batch_rejects_recipients_over_the_resend_limit(settings, smtp_server):
+    service = EmailVerificationService(settings.replace(resend_limit_per_recipient=1))
+    try:
+        results = service.send_verification_batch(['a@one.com', 'a@one.com', 'b@two.com'])
+    finally:
+        service.close()
+
+    assert [result['success'] for result in results] == [True, False, True]
+    assert results[1]['error'] == "Too many verification emails requested"
+    assert smtp_server.message_count == 2
@@ -0,0 +1,91 @@
+import csv
+
+from bulk_sender import BulkSendJob, iter_recipients
+
+
+def read_report(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return [(row['email'], row['status'], row['error']) for row in csv.DictReader(f)]
+
+
+def test_recipients_from_txt(tmp_path):
+    path = tmp_path / 'list.txt'
+    path.write_text('# signups\na@one.com\n\n  b@two.com  \n', encoding='utf-8')
+
+    assert list(iter_recipients(str(path), 'Hi')) == [('a@one.com', 'Hi'), ('b@two.com', 'Hi')]
+
+
+def test_recipients_from_csv_with_header(tmp_path):
+    path = tmp_path / 'list.csv'
+    path.write_text('Name,Email,Message\nAnn,a@one.com,Welcome\nBob,b@two.com,\nNobody,,\n', encoding='utf-8-sig')
+
+    assert list(iter_recipients(str(path), 'Hi')) == [('a@one.com', 'Welcome'), ('b@two.com', 'Hi')]
+
+
+def test_recipients_from_csv_without_header(tmp_path):
+    path = tmp_path / 'list.csv'
+    path.write_text('Ann,a@one.com\nBob,b@two.com\n', encoding='utf-8')
+
+    assert list(iter_recipients(str(path))) == [('a@one.com', ''), ('b@two.com', '')]
+
+
+def test_job_sends_the_list_and_writes_a_report(service, smtp_server, tmp_path):
+    path = tmp_path / 'list.txt'
+    emails = [f'user{i}@example.com' for i in range(25)]
+    path.write_text('\n'.join(emails), encoding='utf-8')
+    seen = []
+
+    job = BulkSendJob(service, str(path), str(tmp_path / 'report.csv'), workers=3,
+                      on_result=lambda email, status, error: seen.append(email))
+    job.start()
+    assert job.wait(30)
+
+    progress = job.progress()
+    assert (progress['state'], progress['total'], progress['read'], progress['sent']) == ('finished', 25, 25, 25)
+    assert smtp_server.message_count == 25
+    assert sorted(seen) == sorted(emails)
+    assert sorted(read_report(job.report_path)) == sorted((email, 'sent', '') for email in emails)
+
+
+class RetryingService:
+    """Service whose retries end before deliver_verification_result returns"""
+
+    def __init__(self, outcome):
+        self.outcome = outcome
+        self.listeners = []
+
+    def add_retry_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_retry_listener(self, callback):
+        self.listeners.remove(callback)
+
+    def allow_send(self, email):
+        return True
+
+    def deliver_verification_result(self, email, custom_message=""):
+        code = '123456'
+        # Another job's retry of the same address must not touch this report
+        for callback in list(self.listeners):
+            callback(email, '999999', 'sent', None)
+            callback(email, code, self.outcome, None if self.outcome == 'sent' else "Gave up")
+        return {'email': email, 'success': True, 'code': code, 'error': "Temporary failure", 'retrying': True}
+
+
+def test_retry_ending_before_the_send_returns_is_recorded(tmp_path):
+    path = tmp_path / 'list.txt'
+    path.write_text('a@one.com\nb@two.com\n', encoding='utf-8')
+    service = RetryingService('failed')
+
+    job = BulkSendJob(service, str(path), str(tmp_path / 'report.csv'), workers=2)
+    job.start()
+    assert job.wait(10)
+
+    progress = job.progress()
+    assert (progress['retrying'], progress['failed'], progress['sent']) == (0, 2, 0)
+    assert sorted(read_report(job.report_path)) == [
+        ('a@one.com', 'failed', 'Gave up'), ('a@one.com', 'retrying', 'Temporary failure'),
+        ('b@two.com', 'failed', 'Gave up'), ('b@two.com', 'retrying', 'Temporary failure'),
+    ]
+    assert service.listeners == []
+    assert job._early == {} and not job._delivering
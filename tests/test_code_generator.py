@@ -0,0 +1,87 @@
+import string
+from collections import Counter
+
+import pytest
+
+import code_generator
+from code_generator import CodeGenerator
+from email_service import EmailVerificationService
+
+
+def every_byte(size):
+    """Stand-in for os.urandom returning each byte value equally often"""
+    return bytes(range(256)) * (size // 256 + 1)
+
+
+def test_codes_have_the_length_and_alphabet():
+    generator = CodeGenerator(8, string.ascii_uppercase + string.digits)
+    codes = [generator.generate() for _ in range(200)] + generator.generate_batch(200)
+
+    assert all(len(code) == 8 for code in codes)
+    assert set(''.join(codes)) <= set(string.ascii_uppercase + string.digits)
+
+
+def test_duplicate_alphabet_characters_are_dropped():
+    generator = CodeGenerator(4, '0011')
+
+    assert generator.alphabet == '01'
+    assert set(''.join(generator.generate_batch(100))) == {'0', '1'}
+
+
+@pytest.mark.parametrize('alphabet', ['0', 'ab€', ''.join(chr(value) for value in range(300))])
+def test_unusable_alphabets_are_rejected(alphabet):
+    with pytest.raises(ValueError):
+        CodeGenerator(6, alphabet)
+
+
+def test_zero_length_is_rejected():
+    with pytest.raises(ValueError):
+        CodeGenerator(0)
+
+
+def test_numeric_follows_the_alphabet():
+    assert CodeGenerator(6).numeric
+    assert not CodeGenerator(6, 'ABCDEF').numeric
+
+
+@pytest.mark.parametrize('size', [10, 36, 62, 100])
+def test_rejection_sampling_maps_bytes_without_bias(monkeypatch, size):
+    generator = CodeGenerator(1, ''.join(chr(value) for value in range(size)), buffer_size=256)
+    monkeypatch.setattr(code_generator.os, 'urandom', every_byte)
+
+    counts = Counter(generator.generate_batch(256 - 256 % size))
+
+    # Bytes past the largest multiple of the alphabet size are dropped, the rest hit every character equally
+    assert set(counts) == set(generator.alphabet)
+    assert set(counts.values()) == {256 // size}
+
+
+def test_digits_are_close_to_uniform():
+    generator = CodeGenerator(6)
+    codes = generator.generate_batch(20000)
+
+    for position in range(6):
+        counts = Counter(code[position] for code in codes)
+        expected = len(codes) / 10
+        chi_square = sum((counts[digit] - expected) ** 2 / expected for digit in string.digits)
+        # 9 degrees of freedom, a uniform source exceeds this about once in a billion runs
+        assert chi_square < 60
+
+
+def test_batch_may_outnumber_the_code_space():
+    codes = CodeGenerator(1).generate_batch(1000)
+
+    assert len(codes) == 1000
+    assert set(codes) == set(string.digits)
+
+
+def test_small_code_space_does_not_fail_a_batch(settings, smtp_server):
+    service = EmailVerificationService(settings.replace(code_length=2))
+    emails = [f'user{i}@example.com' for i in range(101)]
+    try:
+        results = service.send_verification_batch(emails)
+        assert all(result['success'] for result in results)
+        assert all(service.verify_code(result['email'], result['code'])[0] for result in results)
+    finally:
+        service.close()
+    assert smtp_server.message_count == 101
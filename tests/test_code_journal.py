@@ -0,0 +1,155 @@
+import os
+import time
+
+import pytest
+
+from code_journal import CodeJournal, JournaledCodeStore, decode_event, encode_event
+from code_store import EXHAUSTED, INVALID, MISSING, VERIFIED, MemoryCodeStore
+
+
+def open_store(directory, fsync='batch'):
+    return JournaledCodeStore(MemoryCodeStore(), CodeJournal(str(directory), fsync=fsync))
+
+
+def replay(directory):
+    journal = CodeJournal(str(directory), fsync='never')
+    store = MemoryCodeStore()
+    journal.replay(store)
+    journal.close()
+    return store, journal
+
+
+@pytest.mark.parametrize('fsync', ['always', 'batch', 'never'])
+def test_restart_restores_outstanding_codes(tmp_path, fsync):
+    expires_at = time.time() + 600
+    store = open_store(tmp_path, fsync)
+    store.set('kept@example.com', '111111', expires_at)
+    store.set('used@example.com', '222222', expires_at)
+    store.set('guessed@example.com', '333333', expires_at)
+    assert store.verify('used@example.com', '222222', time.time(), 5) == VERIFIED
+    assert store.verify('guessed@example.com', '000000', time.time(), 3) == INVALID
+    store.close()
+
+    store = open_store(tmp_path, fsync)
+    assert len(store) == 2
+    assert store.get('kept@example.com').code == '111111'
+    assert store.get('used@example.com') is None
+    # The failed guess survived the restart
+    assert store.verify('guessed@example.com', '000001', time.time(), 3) == INVALID
+    assert store.verify('guessed@example.com', '000002', time.time(), 3) == EXHAUSTED
+    store.close()
+
+
+def test_expired_codes_are_not_restored(tmp_path):
+    journal = CodeJournal(str(tmp_path), fsync='always')
+    journal.record_issue('old@example.com', '111111', time.time() - 1)
+    journal.record_issue('new@example.com', '222222', time.time() + 600)
+    journal.close()
+
+    store, _ = replay(tmp_path)
+    assert store.get('old@example.com') is None
+    assert store.get('new@example.com').code == '222222'
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    journal = CodeJournal(str(tmp_path), fsync='always')
+    journal.record_issue('a@example.com', '111111', time.time() + 600)
+    journal.close()
+    with open(os.path.join(str(tmp_path), 'codes.log'), 'a', encoding='utf-8') as f:
+        # A crash in the middle of appending a consume event
+        f.write(encode_event('C', 'a@example.com')[:7])
+
+    store, journal = replay(tmp_path)
+    assert store.get('a@example.com').code == '111111'
+    assert journal.malformed == 0
+
+
+def test_malformed_lines_are_skipped_and_counted(tmp_path):
+    expires_at = time.time() + 600
+    with open(os.path.join(str(tmp_path), 'codes.log'), 'w', encoding='utf-8') as f:
+        f.write(encode_event('I', 'a@example.com', '111111', expires_at))
+        f.write('I\tb@example.com\t222222\t9999999999\n')
+        f.write('["I","c@example.com","333333","9999999999"]\n')
+        f.write('["I","d@example.com","444444",true]\n')
+        f.write('["X","a@example.com"]\n')
+        f.write('{"I":"e@example.com"}\n')
+
+    store, journal = replay(tmp_path)
+    assert [email for email, _ in store.items()] == ['a@example.com']
+    assert journal.malformed == 5
+
+
+def test_line_breaks_in_an_email_cannot_inject_events(tmp_path):
+    forged = 'a@example.com\n' + encode_event('I', 'evil@example.com', '000000', time.time() + 600).strip()
+    store = open_store(tmp_path, 'always')
+    store.set(forged, '111111', time.time() + 600)
+    store.close()
+
+    store, journal = replay(tmp_path)
+    assert store.get('evil@example.com') is None
+    assert store.get(forged).code == '111111'
+    assert journal.malformed == 0
+
+
+@pytest.mark.parametrize('fsync', ['always', 'batch', 'never'])
+def test_snapshot_compacts_the_log(tmp_path, fsync):
+    store = open_store(tmp_path, fsync)
+    for i in range(10):
+        store.set(f'user{i}@example.com', '111111', time.time() + 600)
+    for i in range(5):
+        store.delete(f'user{i}@example.com')
+    store.snapshot()
+    store.close()
+
+    assert os.path.getsize(os.path.join(str(tmp_path), 'codes.log')) == 0
+    with open(os.path.join(str(tmp_path), 'codes.snapshot'), encoding='utf-8') as f:
+        assert len(f.readlines()) == 5
+    restored, _ = replay(tmp_path)
+    assert len(restored) == 5
+
+
+@pytest.mark.parametrize('fsync', ['always', 'batch', 'never'])
+def test_snapshots_are_taken_in_the_background(tmp_path, fsync):
+    store = JournaledCodeStore(MemoryCodeStore(), CodeJournal(str(tmp_path), fsync=fsync, snapshot_every=100))
+    for i in range(1000):
+        store.set(f'user{i % 10}@example.com', '111111', time.time() + 600)
+    deadline = time.monotonic() + 5
+    # Events appended after the last snapshot stay below the trigger
+    while store.journal._events_since_snapshot >= 100 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    store.close()
+
+    with open(os.path.join(str(tmp_path), 'codes.log'), encoding='utf-8') as f:
+        assert len(f.readlines()) < 100
+    restored, _ = replay(tmp_path)
+    assert len(restored) == 10
+
+
+def test_interrupted_snapshot_replays_the_previous_log(tmp_path):
+    store = open_store(tmp_path, 'always')
+    store.set('a@example.com', '111111', time.time() + 600)
+    store.close()
+    # A crash after the log was rotated but before the snapshot was written
+    os.replace(os.path.join(str(tmp_path), 'codes.log'), os.path.join(str(tmp_path), 'codes.log.old'))
+    os.remove(os.path.join(str(tmp_path), 'codes.snapshot'))
+
+    store = open_store(tmp_path, 'always')
+    store.set('b@example.com', '222222', time.time() + 600)
+    assert store.verify('a@example.com', '111111', time.time(), 5) == VERIFIED
+    store.close()
+
+    restored, _ = replay(tmp_path)
+    assert restored.get('a@example.com') is None
+    assert restored.get('b@example.com').code == '222222'
+    assert restored.verify('a@example.com', '111111', time.time(), 5) == MISSING
+
+
+def test_decode_event_round_trips():
+    line = encode_event('I', 'a@example.com', '123456', 1700000000.5)
+    assert decode_event(line) == ['I', 'a@example.com', '123456', 1700000000.5]
+    assert decode_event('not json') is None
+
+
+def test_unknown_fsync_policy_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        CodeJournal(str(tmp_path), fsync='sometimes')
@@ -0,0 +1,276 @@
+import time
+
+import pytest
+
+from code_journal import CodeJournal, JournaledCodeStore
+from code_store import (EXHAUSTED, EXPIRED, INVALID, MISSING, VERIFIED, ColumnarCodeStore, ExpiryIndex,
+                        LRUCachedCodeStore, MemoryCodeStore, PendingCode, RedisCodeStore, SQLiteCodeStore,
+                        create_code_store)
+from email_service import EmailVerificationService
+from fake_redis_server import FakeRedisServer
+
+BACKENDS = ('memory', 'columnar', 'sqlite', 'redis', 'redis-cached', 'journaled')
+
+
+@pytest.fixture
+def redis_server():
+    server = FakeRedisServer().start_in_thread()
+    yield server
+    server.stop_thread()
+
+
+@pytest.fixture(params=BACKENDS)
+def store(request, tmp_path):
+    kind = request.param
+    if kind == 'memory':
+        store = MemoryCodeStore()
+    elif kind == 'columnar':
+        store = ColumnarCodeStore(code_length=6)
+    elif kind == 'sqlite':
+        store = SQLiteCodeStore(str(tmp_path / 'codes.db'))
+    elif kind == 'journaled':
+        store = JournaledCodeStore(MemoryCodeStore(), CodeJournal(str(tmp_path / 'journal')))
+    else:
+        server = request.getfixturevalue('redis_server')
+        store = RedisCodeStore.from_url(server.url)
+        if kind == 'redis-cached':
+            store = LRUCachedCodeStore(store, max_entries=100, ttl=60)
+    yield store
+    store.close()
+
+
+def test_correct_code_verifies_once(store):
+    store.set('a@example.com', '123456', time.time() + 60)
+
+    assert store.get('a@example.com').code == '123456'
+    assert store.verify('a@example.com', '123456', time.time(), 5) == VERIFIED
+    assert store.verify('a@example.com', '123456', time.time(), 5) == MISSING
+    assert 'a@example.com' not in store
+
+
+def test_unknown_email_is_missing(store):
+    assert store.get('nobody@example.com') is None
+    assert store.verify('nobody@example.com', '123456', time.time(), 5) == MISSING
+    assert not store.delete('nobody@example.com')
+
+
+def test_wrong_code_keeps_the_code(store):
+    store.set('a@example.com', '123456', time.time() + 60)
+
+    assert store.verify('a@example.com', '654321', time.time(), 5) == INVALID
+    assert store.verify('a@example.com', '123456', time.time(), 5) == VERIFIED
+
+
+def test_expired_code_is_removed(store):
+    expires_at = time.time() + 60
+    store.set('a@example.com', '123456', expires_at)
+
+    assert store.verify('a@example.com', '123456', expires_at + 1, 5) == EXPIRED
+    assert store.verify('a@example.com', '123456', time.time(), 5) == MISSING
+
+
+def test_max_attempts_consume_the_code(store):
+    store.set('a@example.com', '123456', time.time() + 60)
+
+    assert store.verify('a@example.com', '000000', time.time(), 3) == INVALID
+    assert store.verify('a@example.com', '000001', time.time(), 3) == INVALID
+    assert store.verify('a@example.com', '000002', time.time(), 3) == EXHAUSTED
+    assert store.verify('a@example.com', '123456', time.time(), 3) == MISSING
+
+
+def test_new_code_resets_attempts(store):
+    store.set('a@example.com', '123456', time.time() + 60)
+    assert store.verify('a@example.com', '000000', time.time(), 2) == INVALID
+
+    store.set('a@example.com', '222222', time.time() + 60)
+    assert store.verify('a@example.com', '000000', time.time(), 2) == INVALID
+    assert store.verify('a@example.com', '222222', time.time(), 2) == VERIFIED
+
+
+def test_delete_removes_a_record_once(store):
+    store.set('a@example.com', '123456', time.time() + 60)
+
+    assert store.delete('a@example.com')
+    assert not store.delete('a@example.com')
+    assert len(store) == 0
+
+
+def test_pop_expired_removes_only_due_codes(store):
+    now = time.time()
+    store.set('old@example.com', '111111', now + 1)
+    store.set('new@example.com', '222222', now + 600)
+
+    expired = store.pop_expired(now + 5)
+    if isinstance(getattr(store, 'backend', store), RedisCodeStore):
+        # Redis expires keys on its own
+        assert expired == []
+    else:
+        assert expired == ['old@example.com']
+        assert 'old@example.com' not in store
+    assert store.get('new@example.com').code == '222222'
+
+
+def test_expiry_index_pops_only_elapsed_buckets():
+    index = ExpiryIndex(resolution=10)
+    for key, expires_at in (('a', 101), ('b', 109), ('c', 115), ('d', 250)):
+        index.push(expires_at, key)
+
+    # 112 is still inside c's bucket, which is not swept yet
+    assert sorted(index.pop_due(112, lambda key, now: True)) == ['a', 'b']
+    assert index.pop_due(112, lambda key, now: True) == []
+    assert len(index) == 2
+    assert index.pop_due(120, lambda key, now: True) == ['c']
+
+
+def test_expiry_index_skips_stale_keys():
+    index = ExpiryIndex(resolution=1)
+    live = {'a': 200, 'b': 5}
+    index.push(5, 'a')
+    index.push(5, 'b')
+    # 'a' was reissued with a later deadline
+    index.push(200, 'a')
+
+    assert index.pop_due(10, lambda key, now: now > live[key]) == ['b']
+    assert index.pop_due(300, lambda key, now: now > live[key]) == ['a']
+    assert len(index) == 0
+
+
+def test_expiry_index_jumps_long_gaps():
+    index = ExpiryIndex(resolution=0.001, typecode='Q')
+    index.push(1.0, 1)
+    index.push(2.0, 2)
+
+    # Billions of empty buckets lie between, only the existing two are visited
+    assert sorted(index.pop_due(time.time(), lambda key, now: True)) == [1, 2]
+    assert index._next_bucket is None
+
+
+@pytest.mark.parametrize('kind', ['memory', 'columnar'])
+def test_sweep_ignores_the_deadline_of_a_replaced_code(kind):
+    store = MemoryCodeStore() if kind == 'memory' else ColumnarCodeStore()
+    store.set('a@example.com', '111111', 100)
+    store.set('a@example.com', '222222', 1000)
+    store.set('b@example.com', '333333', 100)
+    store.delete('b@example.com')
+
+    assert store.pop_expired(500) == []
+    assert store.get('a@example.com').code == '222222'
+    assert store.pop_expired(1500) == ['a@example.com']
+    assert len(store) == 0
+
+
+def test_service_sweeps_expired_codes_in_the_background(settings, smtp_server):
+    service = EmailVerificationService(settings.replace(code_lifetime=0.05, cleanup_interval=0.05))
+    try:
+        service.issue_code('a@example.com')
+        deadline = time.monotonic() + 5
+        while 'a@example.com' in service.code_store and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert 'a@example.com' not in service.code_store
+    finally:
+        service.close()
+
+
+def test_pending_codes_are_slotted():
+    record = PendingCode('123456', 100.0)
+
+    assert not hasattr(record, '__dict__')
+    with pytest.raises(AttributeError):
+        record.email = 'a@example.com'
+
+
+def test_columnar_codes_keep_leading_zeros():
+    store = ColumnarCodeStore(code_length=6)
+    store.set('a@example.com', '000042', time.time() + 600)
+
+    assert store.get('a@example.com').code == '000042'
+    assert [(email, record.code) for email, record in store.items()] == [('a@example.com', '000042')]
+    assert store.verify('a@example.com', '42', time.time(), 5) == INVALID
+    assert store.verify('a@example.com', '000042', time.time(), 5) == VERIFIED
+
+
+def test_columnar_store_reuses_freed_slots():
+    store = ColumnarCodeStore()
+    store.set('a@example.com', '111111', 100)
+    store.set('b@example.com', '222222', 100)
+    store.delete('a@example.com')
+    store.set('c@example.com', '333333', 1000)
+
+    assert len(store.code_column) == 2
+    assert store.slots['c@example.com'] == 0
+    # The old deadline of the reused slot does not expire the new code
+    assert store.pop_expired(500) == ['b@example.com']
+    assert store.get('c@example.com').code == '333333'
+    assert store._free_slots.tolist() == [1]
+
+
+def test_columnar_attempts_saturate():
+    store = ColumnarCodeStore()
+    store.set('a@example.com', '111111', time.time() + 600)
+    for _ in range(300):
+        attempts = store.add_failed_attempt('a@example.com')
+
+    assert attempts == 255
+    assert store.verify('a@example.com', '000000', time.time(), 1000) == INVALID
+
+
+def test_columnar_store_refuses_non_numeric_codes(settings):
+    with pytest.raises(ValueError):
+        ColumnarCodeStore().set('a@example.com', 'ABC123', time.time() + 600)
+    with pytest.raises(ValueError):
+        create_code_store('columnar', numeric=False, settings=settings)
+    with pytest.raises(ValueError):
+        create_code_store('columnar', code_length=19, settings=settings)
+
+
+def test_redis_keys_expire_natively(redis_server):
+    store = RedisCodeStore.from_url(redis_server.url)
+    store.set('a@example.com', '123456', time.time() + 0.05)
+    time.sleep(0.1)
+
+    assert store.get('a@example.com') is None
+    assert store.verify('a@example.com', '123456', time.time(), 5) == MISSING
+    store.close()
+
+
+def test_cache_does_not_serve_a_code_consumed_elsewhere(redis_server):
+    shared = RedisCodeStore.from_url(redis_server.url)
+    worker = LRUCachedCodeStore(RedisCodeStore.from_url(redis_server.url), ttl=60)
+    worker.set('a@example.com', '123456', time.time() + 60)
+
+    assert shared.verify('a@example.com', '123456', time.time(), 5) == VERIFIED
+    # The cached copy may still be read, but consuming it goes through Redis
+    assert worker.verify('a@example.com', '123456', time.time(), 5) == MISSING
+    shared.close()
+    worker.close()
+
+
+@pytest.mark.parametrize('kind', ['sqlite', 'redis'])
+def test_cached_stores_sharing_a_backend_verify_the_live_code(kind, request, tmp_path):
+    if kind == 'sqlite':
+        backends = [SQLiteCodeStore(str(tmp_path / 'codes.db')) for _ in range(2)]
+    else:
+        url = request.getfixturevalue('redis_server').url
+        backends = [RedisCodeStore.from_url(url) for _ in range(2)]
+    first, second = (LRUCachedCodeStore(backend, ttl=60) for backend in backends)
+
+    first.set('a@example.com', '111111', time.time() + 60)
+    assert first.get('a@example.com').code == '111111'
+    # Another worker re-issues while the first one still caches the old code
+    second.set('a@example.com', '222222', time.time() + 60)
+
+    assert first.verify('a@example.com', '111111', time.time(), 5) == INVALID
+    assert second.verify('a@example.com', '222222', time.time(), 5) == VERIFIED
+    assert first.get('a@example.com') is None
+    first.close()
+    second.close()
+
+
+def test_create_code_store_selects_the_backend(settings, redis_server):
+    assert isinstance(create_code_store('memory', settings=settings), MemoryCodeStore)
+    assert isinstance(create_code_store('columnar', settings=settings), ColumnarCodeStore)
+    store = create_code_store('redis', url=redis_server.url, cache_size=10, settings=settings)
+    assert isinstance(store, LRUCachedCodeStore)
+    store.close()
+    with pytest.raises(ValueError):
+        create_code_store('nosuchstore', settings=settings)
@@ -0,0 +1,131 @@
+import os
+
+import pytest
+
+from email_service import EmailVerificationService
+from email_templates import (DEFAULT_HTML_TEMPLATE, DEFAULT_SUBJECT_TEMPLATE, DEFAULT_TEXT_TEMPLATE, EmailTemplate,
+                             TemplateRegistry, TemplateSet)
+
+
+def write_locale(directory, locale, subject=None, html_body=None, text_body=None):
+    base = directory / locale
+    base.mkdir(exist_ok=True)
+    for name, source in (('subject.txt', subject), ('verification.html', html_body), ('verification.txt', text_body)):
+        if source is not None:
+            (base / name).write_text(source, encoding='utf-8')
+
+
+def touch_later(path):
+    # Editors may save twice within one mtime tick, move it on explicitly
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_template_splices_values_into_chunks():
+    template = EmailTemplate("Code {{code}} for {{ app_name }}, {{code}} again")
+
+    assert template.fields == ('code', 'app_name', 'code')
+    assert template.render({'code': '123456', 'app_name': 'App'}) == "Code 123456 for App, 123456 again"
+
+
+def test_bind_folds_values_into_the_static_text():
+    bound = EmailTemplate("{{app_name}}: {{code}}").bind(app_name='App')
+
+    assert bound.fields == ('code',)
+    assert bound.render({'code': '123456'}) == "App: 123456"
+
+
+def test_default_templates_match_a_plain_replace():
+    values = {'app_name': 'App', 'code': '123456', 'timestamp': '2024-01-01 00:00:00', 'custom_message': ''}
+    templates = TemplateSet(DEFAULT_SUBJECT_TEMPLATE, DEFAULT_HTML_TEMPLATE, DEFAULT_TEXT_TEMPLATE).bind(app_name='App')
+
+    subject, html_content, text_content = templates.render('123456', '2024-01-01 00:00:00')
+
+    def replace(source):
+        for field, value in values.items():
+            source = source.replace('{{' + field + '}}', value)
+        return source
+
+    assert (subject, html_content, text_content) == (
+        replace(DEFAULT_SUBJECT_TEMPLATE), replace(DEFAULT_HTML_TEMPLATE), replace(DEFAULT_TEXT_TEMPLATE))
+
+
+def test_custom_message_is_escaped_in_html_only():
+    templates = TemplateSet("{{custom_message}}Subject", "<body>{{custom_message}}</body>", "{{custom_message}}Text")
+
+    subject, html_content, text_content = templates.render('123456', 'now', '<b>Hi</b> & welcome')
+
+    assert subject == "Subject"
+    assert html_content == "<body><p>&lt;b&gt;Hi&lt;/b&gt; &amp; welcome</p></body>"
+    assert text_content == "<b>Hi</b> & welcome\n\nText"
+
+
+def test_registry_without_a_directory_uses_the_built_in_templates():
+    templates = TemplateRegistry().get('fr')
+
+    assert templates.locale == 'en'
+    assert templates.html.source == DEFAULT_HTML_TEMPLATE
+
+
+def test_locale_files_override_the_built_in_templates(tmp_path):
+    write_locale(tmp_path, 'en', subject="Code for {{app_name}}\n")
+    write_locale(tmp_path, 'pt-BR', "Código - {{app_name}}", "<p>Seu código: {{code}}</p>", "Seu código: {{code}}")
+    registry = TemplateRegistry(str(tmp_path))
+
+    subject, html_content, text_content = registry.get_bound('pt-BR', 'App').render('123456', 'now')
+    assert (subject, html_content, text_content) == ("Código - App", "<p>Seu código: 123456</p>", "Seu código: 123456")
+
+    # Missing files of a locale fall back to the built-in template
+    english = registry.get('en')
+    assert english.subject.source == "Code for {{app_name}}"
+    assert english.html.source == DEFAULT_HTML_TEMPLATE
+
+
+@pytest.mark.parametrize('locale', ['de', '../en', 'en/../../etc', '', None])
+def test_unknown_or_unsafe_locales_fall_back_to_the_default(tmp_path, locale):
+    write_locale(tmp_path, 'en', subject="English")
+    registry = TemplateRegistry(str(tmp_path))
+
+    assert registry.get(locale).locale == 'en'
+
+
+def test_edited_files_are_reloaded(tmp_path):
+    write_locale(tmp_path, 'en', subject="Old {{app_name}}")
+    registry = TemplateRegistry(str(tmp_path), reload_interval=0)
+    assert registry.get_bound('en', 'App').render('1', 'now')[0] == "Old App"
+
+    path = tmp_path / 'en' / 'subject.txt'
+    path.write_text("New {{app_name}}", encoding='utf-8')
+    touch_later(path)
+
+    assert registry.get_bound('en', 'App').render('1', 'now')[0] == "New App"
+
+
+def test_edits_wait_for_the_reload_interval(tmp_path):
+    write_locale(tmp_path, 'en', subject="Old")
+    registry = TemplateRegistry(str(tmp_path), reload_interval=3600)
+    registry.get('en')
+
+    path = tmp_path / 'en' / 'subject.txt'
+    path.write_text("New", encoding='utf-8')
+    touch_later(path)
+
+    assert registry.get('en').subject.source == "Old"
+
+
+def test_service_sends_in_the_requested_locale(settings, smtp_server, tmp_path):
+    templates = tmp_path / 'templates'
+    templates.mkdir()
+    write_locale(templates, 'fr', "Code de vérification", "<p>Votre code : {{code}}</p>", "Votre code : {{code}}")
+    service = EmailVerificationService(settings.replace(template_dir=str(templates)))
+    try:
+        sent, code = service.send_verification_email('a@example.com', locale='fr')
+        assert sent
+        sent, _ = service.send_verification_email('b@example.com')
+        assert sent
+    finally:
+        service.close()
+
+    bodies = {recipients[0]: body for _, recipients, body in smtp_server.messages}
+    assert b'Votre code' in bodies['a@example.com'] and code.encode() in bodies['a@example.com']
+    assert b'Votre code' not in bodies['b@example.com']
@@ -0,0 +1,117 @@
+import json
+import threading
+
+import pytest
+
+from metrics import METRICS, NULL_TIMING, STAGES, Histogram, MetricsRegistry, prometheus_text
+
+
+def observe_in_threads(target, threads=4):
+    workers = [threading.Thread(target=target) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram(bounds=(0.001, 0.01, 0.1))
+    for seconds in (0.0005, 0.001, 0.005, 0.05, 0.05, 5.0):
+        histogram.observe(seconds)
+
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 6
+    assert snapshot['sum'] == pytest.approx(5.1065)
+    # Cumulative counts, bounds are inclusive
+    assert snapshot['buckets'] == [[0.001, 2], [0.01, 3], [0.1, 5]]
+    assert snapshot['p50'] == 0.01
+    # Past the last bound nothing more precise is known
+    assert snapshot['p99'] is None
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_rows_of_exited_threads_are_folded():
+    histogram = Histogram(bounds=(1.0,))
+    observe_in_threads(lambda: [histogram.observe(0.5) for _ in range(1000)])
+    histogram.observe(2.0)
+
+    assert histogram.snapshot()['count'] == 4001
+    # Only this thread's row is still live, the others were folded
+    assert len(histogram._rows) == 1
+    assert histogram._retired[0] == 4000
+
+
+def test_counters_sum_over_threads():
+    registry = MetricsRegistry()
+    observe_in_threads(lambda: [registry.inc('sent') for _ in range(1000)])
+    registry.inc('sent', 5)
+    registry.inc('failed')
+
+    assert registry.counters == {'sent': 4005, 'failed': 1}
+    registry.reset()
+    assert registry.counters == {}
+
+
+def test_timer_observes_its_block():
+    registry = MetricsRegistry()
+    with registry.timer('verify'):
+        pass
+    with registry.timer('custom_stage'):
+        pass
+
+    snapshot = registry.snapshot()
+    assert set(STAGES) <= set(snapshot['histograms'])
+    assert snapshot['histograms']['verify']['count'] == 1
+    assert snapshot['histograms']['custom_stage']['count'] == 1
+    assert json.loads(registry.to_json())['counters'] == {}
+
+
+def test_disabled_registry_records_nothing():
+    registry = MetricsRegistry(enabled=False)
+    assert registry.timer('verify') is NULL_TIMING
+    with registry.timer('verify'):
+        registry.inc('sent')
+
+    assert registry.counters == {}
+    assert registry.snapshot()['histograms']['verify']['count'] == 0
+
+    registry.set_enabled(True)
+    registry.inc('sent')
+    assert registry.counters == {'sent': 1}
+
+
+def test_prometheus_text_labels_each_snapshot():
+    first, second = MetricsRegistry(), MetricsRegistry()
+    first.inc('sent', 2)
+    second.inc('failed')
+    first.histogram('verify').observe(0.003)
+    pool = {'hits': 3, 'misses': 1, 'created': 1, 'discarded': 0, 'idle': 1, 'max_size': 5}
+
+    text = prometheus_text([({'shard': 'a'}, first.snapshot()), ({'shard': 'b'}, second.snapshot())],
+                           pools=[({'shard': 'a'}, pool)])
+    lines = text.splitlines()
+
+    assert '# TYPE email_verification_sent_total counter' in lines
+    assert 'email_verification_sent_total{shard="a"} 2' in lines
+    assert 'email_verification_sent_total{shard="b"} 0' in lines
+    assert 'email_verification_failed_total{shard="b"} 1' in lines
+    assert '# TYPE email_verification_stage_seconds histogram' in lines
+    assert 'email_verification_stage_seconds_bucket{shard="a",stage="verify",le="0.0025"} 0' in lines
+    assert 'email_verification_stage_seconds_bucket{shard="a",stage="verify",le="0.005"} 1' in lines
+    assert 'email_verification_stage_seconds_bucket{shard="a",stage="verify",le="+Inf"} 1' in lines
+    assert 'email_verification_stage_seconds_count{shard="a",stage="verify"} 1' in lines
+    assert 'email_verification_smtp_pool_hits_total{shard="a"} 3' in lines
+    assert 'email_verification_smtp_pool_idle{shard="a"} 1' in lines
+    assert text.endswith('\n')
+
+
+def test_service_times_the_send_path(service, smtp_server):
+    before = METRICS.snapshot()
+
+    sent, code = service.send_verification_email('a@example.com')
+    service.verify_code('a@example.com', code)
+
+    after = METRICS.snapshot()
+    for stage in ('code_generation', 'template_render', 'mime_build', 'smtp_data', 'verify'):
+        assert after['histograms'][stage]['count'] > before['histograms'][stage]['count']
+    assert after['counters'].get('sent', 0) == before['counters'].get('sent', 0) + 1
@@ -0,0 +1,70 @@
+import email
+import email.policy
+
+import pytest
+
+from email_templates import DEFAULT_HTML_TEMPLATE, DEFAULT_TEXT_TEMPLATE, TemplateSet
+from mime_cache import MessageCache, MessageSkeleton, encode_quoted_printable
+
+TIMESTAMP = '2024-01-01 00:00:00'
+
+
+def parse(message_bytes):
+    message = email.message_from_bytes(message_bytes, policy=email.policy.default)
+    text_part, html_part = message.iter_parts()
+    # Bodies go out with CRLF line endings
+    return (message['Subject'], message['From'], message['To'],
+            text_part.get_content().replace('\r\n', '\n'), html_part.get_content().replace('\r\n', '\n'))
+
+
+@pytest.mark.parametrize('subject, app_name, custom_message', [
+    ("Email Verification Code - {{app_name}}", 'App', ''),
+    ("Code {{code}} pour {{app_name}}", 'Àpp « test »', 'Bienvenue, voilà votre code'),
+    ("Verify", 'App', 'Trailing spaces  \nan = sign and <b>markup</b> & ' + 'x' * 200),
+])
+def test_skeleton_matches_the_rendered_templates(subject, app_name, custom_message):
+    templates = TemplateSet(subject, DEFAULT_HTML_TEMPLATE, DEFAULT_TEXT_TEMPLATE).bind(app_name=app_name)
+    skeleton = MessageSkeleton(templates, 'sender@example.com')
+
+    message_bytes = skeleton.render('a@example.com', '123456', TIMESTAMP, custom_message)
+
+    rendered = templates.render('123456', TIMESTAMP, custom_message)
+    assert parse(message_bytes) == (rendered[0], 'sender@example.com', 'a@example.com', rendered[2], rendered[1])
+
+
+def test_encoded_body_lines_stay_within_the_limit():
+    templates = TemplateSet("Verify", "<p>{{code}}</p>" + "é" * 300, "{{code}} " + "y" * 300)
+    message_bytes = MessageSkeleton(templates, 'sender@example.com').render('a@example.com', '1' * 100, TIMESTAMP)
+
+    body = message_bytes.split(b'\r\n\r\n', 1)[1]
+    assert all(len(line) <= 76 for line in body.split(b'\r\n'))
+    assert encode_quoted_printable("é=") == b'=C3=A9=3D'
+
+
+@pytest.mark.parametrize('recipient', ['a@example.com\r\nBcc: b@example.com', 'a@example.com\nX: y'])
+def test_line_breaks_in_the_recipient_are_refused(recipient):
+    skeleton = MessageSkeleton(TemplateSet("Verify", "{{code}}", "{{code}}"), 'sender@example.com')
+
+    with pytest.raises(ValueError):
+        skeleton.render(recipient, '123456', TIMESTAMP)
+
+
+def test_cache_reuses_skeletons_per_template_set_and_sender():
+    cache = MessageCache()
+    templates = TemplateSet("Verify", "{{code}}", "{{code}}")
+
+    skeleton = cache.get(templates, 'sender@example.com')
+    assert cache.get(templates, 'sender@example.com') is skeleton
+    assert cache.get(templates, 'other@example.com') is not skeleton
+    # A reloaded template set gets a fresh skeleton
+    assert cache.get(TemplateSet("Verify", "{{code}}", "{{code}}"), 'sender@example.com').templates is not templates
+
+
+def test_service_bytes_match_the_mime_message(service):
+    custom_message = 'Welcome, ünïcode & <friends>'
+    service._timestamp = lambda: TIMESTAMP
+
+    cached = parse(service.build_message_bytes('a@example.com', '123456', custom_message))
+    built = parse(service.build_message('a@example.com', '123456', custom_message).as_bytes())
+
+    assert cached == built
@@ -0,0 +1,151 @@
+import queue
+import threading
+
+import pytest
+
+from rate_limit import (SLOT_POLL_INTERVAL, DeliveryRateLimiter, DomainScheduler, KeyedRateLimiter, TokenBucket,
+                        parse_rate_overrides, recipient_domain)
+
+
+def test_recipient_domain_is_lower_cased():
+    assert recipient_domain('Someone@Example.COM') == 'example.com'
+    assert recipient_domain('"a@b"@example.com') == 'example.com'
+
+
+def test_parse_rate_overrides():
+    assert parse_rate_overrides(' gmail.com=20/40, Yahoo.com=5 ,slow.org=0.5,') == {
+        'gmail.com': (20.0, 40.0), 'yahoo.com': (5.0, 5.0), 'slow.org': (0.5, 1),
+    }
+    assert parse_rate_overrides(None) == {}
+    with pytest.raises(ValueError):
+        parse_rate_overrides('gmail.com=fast')
+
+
+def test_token_bucket_spends_the_burst_then_refills():
+    bucket = TokenBucket(rate=2, burst=3, now=0)
+    for _ in range(3):
+        assert bucket.wait_time(0) == 0
+        bucket.take()
+
+    assert bucket.wait_time(0) == pytest.approx(0.5)
+    assert bucket.wait_time(0.25) == pytest.approx(0.25)
+    assert bucket.wait_time(0.5) == 0
+    # Refills stop at the burst
+    assert bucket.wait_time(100) == 0 and bucket.tokens == 3
+
+
+def test_keyed_limiter_leaves_zero_rates_unlimited():
+    limiter = KeyedRateLimiter(0, 1, overrides={'slow.org': (1, 1)})
+
+    assert limiter.bucket('example.com', 0) is None
+    assert limiter.bucket('slow.org', 0).rate == 1
+
+
+def test_keyed_limiter_evicts_and_folds_counts():
+    limiter = KeyedRateLimiter(1, 1, max_keys=2, max_counted=2)
+    for key in ('a', 'b', 'c'):
+        limiter.bucket(key, 0)
+        limiter.count(key, True)
+    limiter.count('c', False)
+
+    assert list(limiter._buckets) == ['b', 'c']
+    assert limiter.counts() == {'b': (1, 0), 'c': (1, 1)}
+    assert limiter.other == [1, 0]
+
+
+def test_tokens_are_taken_only_when_domain_and_sender_both_have_one():
+    limiter = DeliveryRateLimiter(domain_rate=1, domain_burst=1, sender_rate=1, sender_burst=2)
+
+    assert limiter.reserve('one.com', 'sender', now=0) == 0
+    assert limiter.reserve('one.com', 'sender', now=0) == pytest.approx(1)
+    # The sender's second token was not spent on the throttled domain
+    assert limiter.reserve('two.com', 'sender', now=0) == 0
+    assert limiter.reserve('three.com', 'sender', now=0) == pytest.approx(1)
+
+    metrics = limiter.metrics()
+    assert metrics['domains']['one.com'] == {'sent': 1, 'throttled': 1, 'in_flight': 0}
+    assert metrics['senders']['sender'] == {'sent': 2, 'throttled': 1}
+
+
+def test_in_flight_slots_are_capped_per_domain():
+    limiter = DeliveryRateLimiter(max_in_flight=2)
+
+    assert limiter.try_begin('one.com') == 0
+    assert limiter.try_begin('one.com') == 0
+    assert limiter.try_begin('one.com') == SLOT_POLL_INTERVAL
+    assert limiter.try_begin('two.com') == 0
+    assert limiter.metrics()['domains']['one.com']['in_flight'] == 2
+
+    limiter.end('one.com')
+    assert limiter.try_begin('one.com') == 0
+
+
+def test_slot_releases_on_error():
+    limiter = DeliveryRateLimiter(max_in_flight=1)
+    with pytest.raises(RuntimeError):
+        with limiter.slot('one.com'):
+            raise RuntimeError("send failed")
+
+    assert limiter.try_begin('one.com') == 0
+
+
+def test_scheduler_round_robins_across_domains():
+    scheduler = DomainScheduler(lambda domain: 0)
+    for item in ('a1', 'a2', 'a3'):
+        scheduler.put('a.com', item)
+    scheduler.put('b.com', 'b1')
+    scheduler.put('c.com', 'c1')
+    scheduler.put_control('stop')
+
+    order = [scheduler.get()[1] for _ in range(6)]
+
+    assert order == ['a1', 'b1', 'c1', 'a2', 'a3', 'stop']
+
+
+def test_throttled_domain_does_not_hold_up_the_rest():
+    asked = []
+
+    def ready(domain):
+        asked.append(domain)
+        return 60 if domain == 'slow.com' else 0
+
+    scheduler = DomainScheduler(ready)
+    scheduler.put('slow.com', 's1')
+    scheduler.put('fast.com', 'f1')
+    scheduler.put('fast.com', 'f2')
+
+    assert [scheduler.get()[1] for _ in range(2)] == ['f1', 'f2']
+    # The slow domain is not asked again before its wait is over
+    assert asked.count('slow.com') == 1
+    assert scheduler.backlog() == {'slow.com': 1}
+
+
+def test_scheduler_is_bounded_and_joinable():
+    scheduler = DomainScheduler(lambda domain: 0, maxsize=2)
+    scheduler.put('a.com', 1)
+    scheduler.put('b.com', 2)
+    with pytest.raises(queue.Full):
+        scheduler.put('c.com', 3, timeout=0.01)
+
+    def consume():
+        for _ in range(2):
+            scheduler.get()
+            scheduler.task_done()
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    scheduler.join()
+    consumer.join()
+    assert scheduler.qsize() == 0
+
+
+def test_drain_empties_the_scheduler():
+    scheduler = DomainScheduler(lambda domain: 60)
+    scheduler.put('a.com', 1)
+    scheduler.put('b.com', 2)
+    scheduler.put('a.com', 3)
+
+    assert sorted(scheduler.drain()) == [1, 2, 3]
+    assert scheduler.qsize() == 0
+    # Nothing is left unfinished, so join returns at once
+    scheduler.join()
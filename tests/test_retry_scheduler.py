@@ -0,0 +1,146 @@
+import asyncio
+import json
+import smtplib
+import socket
+import threading
+
+import pytest
+
+from email_service import EmailVerificationService
+from fake_smtp_server import FakeSMTPServer
+from retry_scheduler import CANCELLED, PERMANENT, TRANSIENT, DeadLetterStore, RetryScheduler, classify_smtp_error
+
+
+@pytest.mark.parametrize('error, classification', [
+    (smtplib.SMTPResponseException(451, b"4.3.0 Try again later"), TRANSIENT),
+    (smtplib.SMTPDataError(452, b"4.3.1 Insufficient storage"), TRANSIENT),
+    (smtplib.SMTPResponseException(550, b"5.1.1 Mailbox unavailable"), PERMANENT),
+    (smtplib.SMTPAuthenticationError(454, b"4.7.0 Temporary authentication failure"), PERMANENT),
+    (smtplib.SMTPRecipientsRefused({'a@example.com': (450, b"Busy"), 'b@example.com': (550, b"No")}), TRANSIENT),
+    (smtplib.SMTPRecipientsRefused({'a@example.com': (550, b"No such user")}), PERMANENT),
+    (smtplib.SMTPServerDisconnected("Connection unexpectedly closed"), TRANSIENT),
+    (smtplib.SMTPConnectError(421, b"Too many connections"), TRANSIENT),
+    (smtplib.SMTPNotSupportedError("STARTTLS not supported"), PERMANENT),
+    (ConnectionRefusedError(111, "Connection refused"), TRANSIENT),
+    (socket.timeout("timed out"), TRANSIENT),
+    (TimeoutError(), TRANSIENT),
+    (asyncio.TimeoutError(), TRANSIENT),
+    (ValueError("bad address"), PERMANENT),
+])
+def test_classify_smtp_error(error, classification):
+    assert classify_smtp_error(error) == classification
+
+
+def test_backoff_is_full_jitter_within_the_cap():
+    scheduler = RetryScheduler(lambda job: None, base_delay=2.0, max_delay=30.0)
+
+    for attempt, cap in ((1, 2.0), (2, 4.0), (3, 8.0), (4, 16.0), (5, 30.0), (20, 30.0)):
+        delays = [scheduler.backoff(attempt) for _ in range(500)]
+        assert all(0 <= delay <= cap for delay in delays)
+        # Spread over the whole range rather than clustered at the cap
+        assert min(delays) < cap * 0.1 and max(delays) > cap * 0.9
+
+
+class Recorder:
+    """send callable failing with the queued errors, then succeeding"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+        self.dead = []
+        self.done = threading.Event()
+
+    def send(self, job):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        self.done.set()
+
+    def on_dead(self, job, entry):
+        self.dead.append((job, entry))
+        self.done.set()
+
+
+def test_transient_failures_are_retried_until_sent():
+    recorder = Recorder(smtplib.SMTPServerDisconnected("closed"), ConnectionResetError())
+    scheduler = RetryScheduler(recorder.send, max_attempts=5, base_delay=0.001, on_dead=recorder.on_dead)
+
+    assert scheduler.schedule('job', 'a@example.com')
+    assert recorder.done.wait(5)
+    scheduler.stop()
+
+    assert recorder.calls == 3
+    assert recorder.dead == []
+    assert scheduler.metrics() == {'pending': 0, 'scheduled': 3, 'recovered': 1, 'dead': 0}
+
+
+def test_permanent_failure_is_dead_lettered_at_once():
+    recorder = Recorder(smtplib.SMTPResponseException(550, b"5.1.1 Mailbox unavailable"))
+    scheduler = RetryScheduler(recorder.send, max_attempts=5, base_delay=0.001, on_dead=recorder.on_dead)
+
+    scheduler.schedule('job', 'a@example.com')
+    assert recorder.done.wait(5)
+    scheduler.stop()
+
+    (job, entry), = recorder.dead
+    assert job == 'job'
+    assert entry['email'] == 'a@example.com'
+    assert entry['classification'] == PERMANENT
+    assert entry['attempts'] == 2
+    assert '550' in entry['error']
+
+
+def test_attempts_are_capped():
+    recorder = Recorder(*[ConnectionResetError()] * 10)
+    scheduler = RetryScheduler(recorder.send, max_attempts=3, base_delay=0.001, on_dead=recorder.on_dead)
+
+    scheduler.schedule('job', 'a@example.com')
+    assert recorder.done.wait(5)
+    scheduler.stop()
+
+    assert recorder.calls == 2
+    assert recorder.dead[0][1]['attempts'] == 3
+    assert recorder.dead[0][1]['classification'] == TRANSIENT
+
+
+def test_stop_dead_letters_pending_jobs():
+    recorder = Recorder()
+    scheduler = RetryScheduler(recorder.send, base_delay=100, on_dead=recorder.on_dead)
+    scheduler.schedule('first', 'a@example.com')
+    scheduler.schedule('second', 'b@example.com', attempts=2)
+
+    scheduler.stop()
+
+    assert recorder.calls == 0
+    assert sorted(job for job, _ in recorder.dead) == ['first', 'second']
+    assert all(entry['classification'] == CANCELLED for _, entry in recorder.dead)
+    assert scheduler.metrics()['pending'] == 0
+    assert not scheduler.schedule('third', 'c@example.com')
+
+
+def test_dead_letters_are_bounded_and_appended_to_a_file(tmp_path):
+    path = tmp_path / 'dead.jsonl'
+    store = DeadLetterStore(max_entries=2, path=str(path))
+    for i in range(3):
+        store.add(f'user{i}@example.com', ValueError('nope'), 1, PERMANENT)
+
+    assert [entry['email'] for entry in store.entries] == ['user1@example.com', 'user2@example.com']
+    lines = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert [line['email'] for line in lines] == ['user0@example.com', 'user1@example.com', 'user2@example.com']
+
+
+def test_closing_the_service_revokes_codes_waiting_for_a_retry(settings):
+    server = FakeSMTPServer(error_rate=1.0, error_code=451).start_in_thread()
+    service = EmailVerificationService(settings.replace(
+        smtp_port=server.port, send_retry_attempts=3, send_retry_base_delay=100))
+    try:
+        sent, code = service.send_verification_email('a@example.com')
+        assert sent and code
+        assert 'a@example.com' in service.code_store
+        service.close()
+    finally:
+        server.stop_thread()
+
+    assert 'a@example.com' not in service.code_store
+    entry = service.dead_letters.entries[-1]
+    assert (entry['email'], entry['classification']) == ('a@example.com', CANCELLED)
@@ -0,0 +1,93 @@
+import queue
+import threading
+
+import pytest
+
+from email_service import EmailVerificationService
+from fake_smtp_server import FakeSMTPServer
+from send_queue import SendQueue
+
+
+def test_queued_emails_are_sent_in_the_background(service, smtp_server):
+    emails = [f'user{i}@domain{i % 3}.com' for i in range(9)]
+    results = [service.enqueue_verification_email(email) for email in emails]
+    service.get_send_queue().join()
+
+    assert all(sent and code for sent, code in results)
+    assert smtp_server.message_count == len(emails)
+    for email, (_, code) in zip(emails, results):
+        assert service.verify_code(email, code)[0]
+    metrics = service.get_send_queue().metrics()
+    assert (metrics['enqueued'], metrics['sent'], metrics['failed'], metrics['depth']) == (9, 9, 0, 0)
+
+
+def test_full_queue_pushes_back(service):
+    send_queue = SendQueue(service, workers=1, max_size=1)
+    send_queue.enqueue('a@example.com', '111111')
+
+    with pytest.raises(queue.Full):
+        send_queue.enqueue('b@example.com', '222222', timeout=0)
+    assert send_queue.metrics()['rejected'] == 1
+    send_queue.stop(drain=False)
+
+
+def test_stop_without_drain_revokes_queued_codes(service, smtp_server):
+    # No workers started, so everything stays queued
+    send_queue = SendQueue(service, workers=2)
+    codes = {}
+    for email in ('a@one.com', 'b@two.com', 'c@one.com'):
+        codes[email], _ = service.issue_code(email)
+        send_queue.enqueue(email, codes[email])
+    # A newer code issued after the email was queued is left alone
+    replaced, _ = service.issue_code('c@one.com')
+
+    send_queue.stop(drain=False)
+
+    assert smtp_server.message_count == 0
+    assert not service.verify_code('a@one.com', codes['a@one.com'])[0]
+    assert not service.verify_code('b@two.com', codes['b@two.com'])[0]
+    assert service.verify_code('c@one.com', replaced)[0]
+    metrics = send_queue.metrics()
+    assert (metrics['failed'], metrics['depth']) == (3, 0)
+
+
+def test_stop_with_drain_sends_what_is_queued(service, smtp_server):
+    send_queue = SendQueue(service, workers=2)
+    for email in ('a@one.com', 'b@two.com'):
+        code, _ = service.issue_code(email)
+        send_queue.enqueue(email, code)
+
+    send_queue.start()
+    send_queue.stop()
+
+    assert smtp_server.message_count == 2
+    assert send_queue.metrics()['sent'] == 2
+
+
+def test_callback_reports_failures(settings):
+    server = FakeSMTPServer(error_rate=1.0, error_code=550).start_in_thread()
+    service = EmailVerificationService(settings.replace(smtp_port=server.port))
+    reported = []
+    done = threading.Event()
+
+    def callback(email, success, code, error):
+        reported.append((email, success, code, error))
+        done.set()
+
+    send_queue = SendQueue(service, workers=1, callback=callback)
+    try:
+        code, _ = service.issue_code('a@example.com')
+        send_queue.enqueue('a@example.com', code)
+        send_queue.start()
+        assert done.wait(10)
+        send_queue.stop()
+    finally:
+        service.close()
+        server.stop_thread()
+
+    (email, success, reported_code, error), = reported
+    assert (email, success, reported_code) == ('a@example.com', False, code)
+    assert '550' in str(error)
+    assert send_queue.metrics()['failed'] == 1
+    # A permanent failure does not leave the code usable
+    assert 'a@example.com' not in service.code_store
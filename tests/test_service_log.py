@@ -0,0 +1,107 @@
+import io
+import json
+import logging
+import queue
+
+import pytest
+
+from service_log import REDACTED, BufferedQueueHandler, configure_logging, get_logger, log_sampled, redact_code
+
+log = get_logger('test')
+
+
+@pytest.fixture
+def capture():
+    """Reconfigure logging into a buffer, returning a function that flushes and reads it"""
+    stream = io.StringIO()
+
+    def configure(**options):
+        log_settings = configure_logging(stream=stream, path='', force=True, **options)
+
+        def read():
+            log_settings.stop()
+            return stream.getvalue().splitlines()
+        return log_settings, read
+
+    yield configure
+    configure_logging(stream=io.StringIO(), force=True)
+
+
+def test_codes_are_redacted_before_they_are_queued(capture):
+    _, read = capture(fmt='text', redact=True, level='INFO')
+    log.info("Code issued", extra={'event': 'code_issued', 'email': 'a@example.com', 'code': '123456'})
+
+    line, = read()
+    assert line.endswith(f"Code issued (code {REDACTED})")
+    assert '123456' not in line
+
+
+def test_codes_are_kept_when_redaction_is_off(capture):
+    _, read = capture(fmt='json', redact=False, level='INFO')
+    log.info("Code issued", extra={'event': 'code_issued', 'email': 'a@example.com', 'code': '123456'})
+
+    entry = json.loads(read()[0])
+    assert entry['code'] == '123456'
+    assert redact_code('123456', redact=False) == '123456'
+    assert redact_code(None) is None
+
+
+def test_json_lines_carry_the_structured_fields(capture):
+    _, read = capture(fmt='json', level='INFO')
+    log.warning("Sent ✅", extra={'event': 'sent', 'email': 'a@example.com', 'attempts': 2})
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        log.exception("Failed", extra={'event': 'failed'})
+
+    first, second = (json.loads(line) for line in read())
+    assert {key: first[key] for key in ('level', 'logger', 'message', 'event', 'email', 'attempts')} == {
+        'level': 'warning', 'logger': 'email_verification.test', 'message': "Sent ✅",
+        'event': 'sent', 'email': 'a@example.com', 'attempts': 2,
+    }
+    assert 'code' not in first
+    assert 'ValueError: boom' in second['exception']
+
+
+def test_levels_below_the_configured_one_are_dropped(capture):
+    _, read = capture(level='WARNING')
+    log.info("Quiet")
+    log_sampled(log, "Quiet too")
+    log.warning("Loud")
+
+    assert [line.split(' ', 3)[3] for line in read()] == ["Loud"]
+
+
+@pytest.mark.parametrize('sample, kept', [(1, 100), (0.25, 25), (0, 0)])
+def test_success_events_are_sampled(capture, sample, kept):
+    log_settings, read = capture(level='INFO', sample=sample)
+    for i in range(100):
+        log_sampled(log, "Sent to %s", f'user{i}@example.com', event='sent')
+    log.error("Errors are never sampled")
+
+    lines = read()
+    assert len(lines) == kept + 1
+    assert log_settings.metrics()['skipped'] == 100 - kept
+
+
+def test_full_queue_drops_records_instead_of_blocking():
+    handler = BufferedQueueHandler(queue.Queue(1))
+    records = [logging.LogRecord('x', logging.INFO, __file__, 1, "msg", (), None) for _ in range(3)]
+    records[0].code = '123456'
+    for record in records:
+        handler.emit(record)
+
+    assert handler.dropped == 2
+    assert handler.queue.get_nowait().code == REDACTED
+
+
+def test_service_logs_never_contain_codes(capture, service, smtp_server):
+    _, read = capture(fmt='json', level='DEBUG', redact=True)
+    sent, code = service.send_verification_email('a@example.com')
+    assert sent
+    service.verify_code('a@example.com', '000000' if code != '000000' else '111111')
+    service.verify_code('a@example.com', code)
+
+    lines = read()
+    assert lines
+    assert not any(code in line for line in lines)
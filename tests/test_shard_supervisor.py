@@ -0,0 +1,114 @@
+from collections import Counter
+
+import pytest
+
+from email_service import EmailVerificationService
+from shard_supervisor import HashRing, ShardSupervisor, export_codes, import_codes, shard_key
+
+KEYS = [f'user{i}@example.com' for i in range(10000)]
+
+
+def owners(ring):
+    return {key: ring.node_for(key) for key in KEYS}
+
+
+def test_shard_key_ignores_case_and_whitespace():
+    assert shard_key('  User@Example.COM ') == 'user@example.com'
+
+
+def test_keys_spread_evenly_over_the_nodes():
+    counts = Counter(owners(HashRing(['a', 'b', 'c', 'd'])).values())
+
+    assert set(counts) == {'a', 'b', 'c', 'd'}
+    assert all(1500 < count < 3500 for count in counts.values())
+
+
+def test_adding_a_node_only_moves_keys_to_it():
+    ring = HashRing(['a', 'b', 'c'])
+    before = owners(ring)
+    ring.add('d')
+    after = owners(ring)
+
+    moved = [key for key in KEYS if before[key] != after[key]]
+    assert all(after[key] == 'd' for key in moved)
+    assert 0.15 < len(moved) / len(KEYS) < 0.35
+
+
+def test_removing_a_node_only_moves_its_keys():
+    ring = HashRing(['a', 'b', 'c', 'd'])
+    before = owners(ring)
+    copy = ring.copy()
+    ring.remove('d')
+    after = owners(ring)
+
+    assert all(after[key] == before[key] for key in KEYS if before[key] != 'd')
+    assert 'd' not in after.values()
+    # The copy keeps routing as before
+    assert owners(copy) == before
+
+
+def test_empty_ring_has_no_owner():
+    with pytest.raises(LookupError):
+        HashRing().node_for('a@example.com')
+
+
+def test_codes_follow_the_ring(settings):
+    ring = HashRing(['shard-0', 'shard-1'])
+    first = EmailVerificationService(settings)
+    second = EmailVerificationService(settings)
+    try:
+        emails = [f'user{i}@example.com' for i in range(50)]
+        codes = {email: first.issue_code(email)[0] for email in emails}
+        first.code_store.add_failed_attempt(emails[0])
+
+        moved = export_codes(first, ring, 'shard-0')
+        assert import_codes(second, moved) == len(moved)
+
+        for email in emails:
+            owner = first if ring.node_for(shard_key(email)) == 'shard-0' else second
+            other = second if owner is first else first
+            assert owner.code_store.get(email).code == codes[email]
+            assert other.code_store.get(email) is None
+        holder = first if ring.node_for(shard_key(emails[0])) == 'shard-0' else second
+        assert holder.code_store.get(emails[0]).attempts == 1
+    finally:
+        first.close()
+        second.close()
+
+
+def test_shared_stores_are_not_moved(settings):
+    service = EmailVerificationService(settings.replace(code_store='sqlite'))
+    try:
+        service.issue_code('a@example.com')
+        assert export_codes(service, HashRing(['elsewhere']), 'shard-0') == []
+        assert 'a@example.com' in service.code_store
+    finally:
+        service.close()
+
+
+def test_supervisor_routes_and_rebalances(settings, smtp_server):
+    supervisor = ShardSupervisor(shards=2, threads=2, quiet=True, settings=settings)
+    try:
+        emails = [f'user{i}@example.com' for i in range(20)]
+        results = supervisor.send_verification_batch(emails)
+        assert [result['email'] for result in results] == emails
+        assert all(result['success'] for result in results)
+
+        # Verifying after a new shard took its share of the codes
+        supervisor.add_shard()
+        assert supervisor.moved_codes > 0
+        for result in results[:10]:
+            assert supervisor.verify_code(result['email'], result['code'])[0]
+
+        supervisor.remove_shard()
+        for result in results[10:]:
+            assert supervisor.verify_code(result['email'], result['code'])[0]
+
+        metrics = supervisor.metrics()
+        assert set(metrics['shards']) == {'shard-0', 'shard-1'}
+        assert sum(shard['codes_outstanding'] for shard in metrics['shards'].values()) == 0
+        with pytest.raises(KeyError):
+            supervisor.remove_shard('shard-9')
+    finally:
+        supervisor.close()
+    assert smtp_server.message_count == 20
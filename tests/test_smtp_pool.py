@@ -0,0 +1,67 @@
+import smtplib
+
+import pytest
+
+from conftest import drop_clients
+from smtp_pool import SMTPConnectionPool
+
+
+def test_sends_reuse_one_session(service, smtp_server):
+    for i in range(3):
+        sent, code = service.send_verification_email(f'user{i}@example.com')
+        assert sent and code
+
+    stats = service.get_smtp_pool().stats()
+    assert stats['created'] == 1
+    assert stats['hits'] == 2
+    assert stats['idle'] == 1
+    assert smtp_server.connection_count == 1
+    assert smtp_server.message_count == 3
+
+
+def test_disconnected_idle_session_is_replaced(service, smtp_server):
+    assert service.send_verification_email('first@example.com')[0]
+    drop_clients(smtp_server)
+
+    assert service.send_verification_email('second@example.com')[0]
+    stats = service.get_smtp_pool().stats()
+    assert stats['created'] == 2
+    assert stats['discarded'] == 1
+    assert smtp_server.message_count == 2
+
+
+def test_session_is_discarded_when_the_server_disconnects(smtp_server):
+    pool = SMTPConnectionPool('127.0.0.1', smtp_server.port, use_tls=False)
+    with pytest.raises(smtplib.SMTPServerDisconnected):
+        with pool.connection():
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+
+    stats = pool.stats()
+    assert stats['discarded'] == 1
+    assert stats['idle'] == 0
+    pool.close()
+
+
+def test_session_survives_a_rejected_message(smtp_server):
+    pool = SMTPConnectionPool('127.0.0.1', smtp_server.port, use_tls=False)
+    with pytest.raises(smtplib.SMTPResponseException):
+        with pool.connection():
+            raise smtplib.SMTPResponseException(550, b"5.1.1 Mailbox unavailable")
+
+    with pool.connection() as server:
+        assert server.noop()[0] == 250
+    stats = pool.stats()
+    assert stats['created'] == 1
+    assert stats['hits'] == 1
+    pool.close()
+
+
+def test_closed_pool_refuses_checkouts(smtp_server):
+    pool = SMTPConnectionPool('127.0.0.1', smtp_server.port, use_tls=False)
+    with pool.connection():
+        pass
+    pool.close()
+
+    assert pool.stats()['idle'] == 0
+    with pytest.raises(RuntimeError):
+        pool.acquire()
@@ -0,0 +1,123 @@
+import hmac
+
+import pytest
+
+import code_store
+from code_store import EXPIRED, INVALID, MISSING, VERIFIED
+from email_service import EmailVerificationService
+from stateless_codes import StatelessCodeStore
+
+SECRET = 'test-secret'
+NOW = 1_700_000_000.0
+
+
+@pytest.fixture
+def store():
+    return StatelessCodeStore(SECRET, digits=6, lifetime=600, step=60)
+
+
+def test_any_process_with_the_secret_verifies_a_code(store):
+    code, expires_at = store.issue('a@example.com', NOW)
+
+    assert len(code) == 6 and code.isdigit()
+    assert expires_at - NOW <= 600 + 60
+    assert StatelessCodeStore(SECRET).verify('a@example.com', code, NOW + 30, 5) == VERIFIED
+
+
+def test_codes_cannot_be_forged_without_the_secret(store):
+    forged, _ = StatelessCodeStore('another-secret').issue('a@example.com', NOW)
+
+    assert store.verify('a@example.com', forged, NOW, 5) == INVALID
+
+
+def test_a_code_belongs_to_its_email(store):
+    code, _ = store.issue('a@example.com', NOW)
+
+    assert store.verify('b@example.com', code, NOW, 5) == INVALID
+
+
+def test_future_windows_are_not_accepted(store):
+    current = int(NOW // store.step)
+
+    assert store.verify('a@example.com', store.code_for('a@example.com', current + 1), NOW, 5) == INVALID
+
+
+def test_codes_expire_after_their_lifetime(store):
+    code, expires_at = store.issue('a@example.com', NOW)
+
+    assert store.is_outstanding('a@example.com', code, expires_at - 1)
+    assert not store.is_outstanding('a@example.com', code, expires_at)
+    assert store.verify('a@example.com', code, expires_at, 5) == EXPIRED
+    assert store.verify('a@example.com', code, expires_at + 600, 5) == INVALID
+
+
+def test_a_code_is_used_once_and_the_next_one_differs(store):
+    code, _ = store.issue('a@example.com', NOW)
+    assert store.verify('a@example.com', code, NOW + 1, 5) == VERIFIED
+    assert store.verify('a@example.com', code, NOW + 2, 5) == MISSING
+
+    # Issued in the same window, the new code comes from the next one
+    second, _ = store.issue('a@example.com', NOW + 3)
+    assert second == store.code_for('a@example.com', int(NOW // store.step) + 1)
+    assert store.verify('a@example.com', second, NOW + 4, 5) == VERIFIED
+
+
+def test_a_spent_window_revokes_every_earlier_code(store):
+    first, _ = store.issue('a@example.com', NOW - 120)
+    second, _ = store.issue('a@example.com', NOW)
+    # As adopted from another process, or revoked by delete()
+    store.mark_spent('a@example.com', int(NOW // store.step))
+
+    assert store.verify('a@example.com', first, NOW, 5) == MISSING
+    assert store.verify('a@example.com', second, NOW, 5) == MISSING
+
+
+def test_comparisons_are_constant_time(store, monkeypatch):
+    compared = []
+    original = hmac.compare_digest
+
+    def compare_digest(a, b):
+        compared.append((a, b))
+        return original(a, b)
+
+    monkeypatch.setattr(code_store.hmac, 'compare_digest', compare_digest)
+    code, _ = store.issue('a@example.com', NOW)
+    store.verify('a@example.com', '000000', NOW, 5)
+    store.verify('a@example.com', code, NOW, 5)
+
+    assert compared and all(b in ('000000', code) for _, b in compared)
+    # Guesses that cannot be encoded never match rather than raising
+    assert code_store.codes_match(code, '１２３４５６') is False
+
+
+def test_consumed_windows_are_forgotten_once_expired(store):
+    code, _ = store.issue('a@example.com', NOW)
+    store.verify('a@example.com', code, NOW, 5)
+    assert store.spent_windows() == [('a@example.com', int(NOW // store.step))]
+
+    assert store.pop_expired(NOW + 60) == []
+    assert store.consumed
+    store.pop_expired(NOW + 2000)
+    assert store.consumed == {}
+
+
+def test_nothing_is_stored_per_code(store):
+    store.issue('a@example.com', NOW)
+
+    assert len(store) == 0 and store.items() == []
+    with pytest.raises(TypeError):
+        store.set('a@example.com', '123456', NOW + 600)
+    with pytest.raises(ValueError):
+        StatelessCodeStore('')
+
+
+def test_service_verifies_stateless_codes(settings, smtp_server):
+    service = EmailVerificationService(settings.replace(code_store='stateless', code_secret=SECRET))
+    try:
+        sent, code = service.send_verification_email('a@example.com')
+        assert sent
+        assert service.verify_code('a@example.com', code)[0]
+        assert not service.verify_code('a@example.com', code)[0]
+    finally:
+        service.close()
+    assert code.encode() in smtp_server.messages[0][2]
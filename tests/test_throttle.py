@@ -0,0 +1,158 @@
+import pytest
+
+from email_service import EmailVerificationService
+from send_throttle import SendThrottle
+from verify_lockout import VerifyLockout
+
+
+def test_recipient_limit_within_the_window():
+    throttle = SendThrottle(recipient_limit=3, source_limit=0, window=100)
+
+    assert all(throttle.allow('a@example.com', now=10 + i) for i in range(3))
+    assert not throttle.allow('a@example.com', now=20)
+    # Addresses are counted case-insensitively
+    assert not throttle.allow(' A@Example.com', now=20)
+    assert throttle.allow('b@example.com', now=20)
+    assert throttle.metrics()['rejected_recipient'] == 2
+
+
+def test_previous_window_is_weighted_by_its_overlap():
+    throttle = SendThrottle(recipient_limit=3, source_limit=0, window=100)
+    for i in range(3):
+        throttle.allow('a@example.com', now=10 + i)
+
+    # Half of the previous window still overlaps: 1.5 + 1 fits, 2.5 + 1 does not
+    assert throttle.allow('a@example.com', now=150)
+    assert not throttle.allow('a@example.com', now=150)
+    # Two windows later nothing is left of the burst
+    assert all(throttle.allow('a@example.com', now=300 + i) for i in range(3))
+
+
+def test_source_limit_spans_recipients():
+    throttle = SendThrottle(recipient_limit=5, source_limit=2, window=100)
+
+    assert throttle.allow('a@example.com', '10.0.0.1', now=0)
+    assert throttle.allow('b@example.com', '10.0.0.1', now=0)
+    assert not throttle.allow('c@example.com', '10.0.0.1', now=0)
+    assert throttle.allow('c@example.com', '10.0.0.2', now=0)
+    assert throttle.metrics()['rejected_source'] == 1
+
+
+def test_rejected_requests_are_not_counted():
+    throttle = SendThrottle(recipient_limit=2, source_limit=1, window=100)
+
+    assert throttle.allow('a@example.com', '10.0.0.1', now=0)
+    # Refused by the source limit, so the recipient keeps its second send
+    assert not throttle.allow('a@example.com', '10.0.0.1', now=0)
+    assert throttle.allow('a@example.com', '10.0.0.2', now=0)
+
+
+def test_zero_limits_disable_the_throttle():
+    throttle = SendThrottle(recipient_limit=0, source_limit=0, window=100)
+
+    assert all(throttle.allow('a@example.com', '10.0.0.1', now=0) for _ in range(100))
+
+
+def test_tracked_keys_are_bounded():
+    throttle = SendThrottle(recipient_limit=1, source_limit=0, window=100, max_keys=10)
+    for i in range(50):
+        throttle.allow(f'user{i}@example.com', now=0)
+
+    assert throttle.metrics()['tracked_recipients'] == 10
+
+
+def test_lockout_after_threshold_failures():
+    lockout = VerifyLockout(threshold=3, half_life=100)
+
+    assert not lockout.record_failure('a@example.com', now=0)
+    assert not lockout.record_failure('a@example.com', now=0)
+    assert not lockout.is_locked('a@example.com', now=0)
+    assert lockout.record_failure('a@example.com', now=0)
+    assert lockout.is_locked('a@example.com', now=0)
+    assert not lockout.is_locked('b@example.com', now=0)
+    assert lockout.metrics()['lockouts'] == 1
+
+
+def test_lockout_decays_with_the_half_life():
+    lockout = VerifyLockout(threshold=4, half_life=100)
+    for _ in range(8):
+        lockout.record_failure('a@example.com', now=0)
+
+    # Halved to 4 after one half-life, below it soon after
+    assert lockout.is_locked('a@example.com', now=100)
+    assert not lockout.is_locked('a@example.com', now=150)
+    # Repeat offenders are locked again sooner
+    assert not lockout.record_failure('a@example.com', now=150)
+    assert lockout.record_failure('a@example.com', now=150)
+
+
+def test_guesses_a_moment_apart_count_in_full():
+    lockout = VerifyLockout(threshold=3, half_life=900)
+
+    assert not lockout.record_failure('a@example.com', now=1000.000)
+    assert not lockout.record_failure('a@example.com', now=1000.001)
+    assert lockout.record_failure('a@example.com', now=1000.002)
+
+
+def test_frequent_checks_do_not_stall_the_decay():
+    lockout = VerifyLockout(threshold=1, half_life=10)
+    lockout.record_failure('a@example.com', now=0)
+
+    locked = [lockout.is_locked('a@example.com', now=step / 1000) for step in range(1, 10001)]
+
+    assert locked[0] and not locked[-1]
+    # Exactly one half-life later the failure counts half
+    assert lockout._scores['a@example.com'].score == 500
+
+
+def test_clear_forgets_failures():
+    lockout = VerifyLockout(threshold=2, half_life=100)
+    lockout.record_failure('a@example.com', now=0)
+    lockout.clear('a@example.com')
+
+    assert not lockout.record_failure('a@example.com', now=0)
+
+
+def test_zero_threshold_disables_the_lockout():
+    lockout = VerifyLockout(threshold=0)
+
+    assert not any(lockout.record_failure('a@example.com', now=0) for _ in range(100))
+    assert not lockout.is_locked('a@example.com', now=0)
+
+
+@pytest.fixture
+def strict_service(settings):
+    service = EmailVerificationService(settings.replace(
+        resend_limit_per_recipient=2,
+        resend_limit_per_source=3,
+        verify_max_attempts=10,
+        verify_lockout_threshold=2,
+    ))
+    yield service
+    service.close()
+
+
+def test_service_rejects_resends_before_any_smtp_work(strict_service, smtp_server):
+    assert strict_service.send_verification_email('a@example.com')[0]
+    assert strict_service.send_verification_email('a@example.com')[0]
+    assert strict_service.send_verification_email('a@example.com') == (False, None)
+    assert smtp_server.message_count == 2
+
+
+def test_service_limits_each_source(strict_service, smtp_server):
+    results = [strict_service.send_verification_email(f'user{i}@example.com', source='10.0.0.1')[0]
+               for i in range(4)]
+
+    assert results == [True, True, True, False]
+    assert smtp_server.message_count == 3
+
+
+def test_service_locks_out_repeated_wrong_guesses(strict_service):
+    sent, code = strict_service.send_verification_email('a@example.com')
+    assert sent
+
+    assert strict_service.verify_code('a@example.com', 'wrong1') == (False, "Invalid verification code")
+    assert strict_service.verify_code('a@example.com', 'wrong2') == (False, "Invalid verification code")
+    # Even the right code is refused while the email is locked out
+    assert strict_service.verify_code('a@example.com', code) == (
+        False, "Too many failed attempts, please try again later")
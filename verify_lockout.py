@@ -0,0 +1,89 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+# Scores are whole thousandths of a failure, compared exactly against the threshold
+SCORE_SCALE = 1000
+
+
+class FailureScore:
+    """Decaying count of failed verifications for one email, in SCORE_SCALE units"""
+
+    __slots__ = ('score', 'updated')
+
+    def __init__(self, now):
+        self.score = 0
+        self.updated = now
+
+
+class VerifyLockout:
+    """Locks an email out of verification after repeated wrong guesses
+
+    Every wrong guess adds one to a score that halves every half_life
+    seconds, so the lockout lifts on its own and comes back sooner for
+    emails that keep failing. Scores are integers in SCORE_SCALE units,
+    so guesses a moment apart count in full against the threshold. Scores beyond max_keys are evicted least
+    recently used first. A threshold of 0 disables the lockout.
+    """
+
+    def __init__(self, threshold=10, half_life=900, max_keys=100000):
+        self.threshold = threshold
+        self.half_life = half_life
+        self.max_keys = max_keys
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+        self.lockouts = 0
+
+    def _decayed(self, entry, now):
+        if now > entry.updated and entry.score:
+            score = round(entry.score * 0.5 ** ((now - entry.updated) / self.half_life))
+            if not score:
+                entry.updated = now
+            elif score != entry.score:
+                # Moved to where the exact curve passes the rounded score, so frequent checks add no drift
+                entry.updated += self.half_life * math.log2(entry.score / score)
+            entry.score = score
+        return entry.score
+
+    def is_locked(self, email, now=None):
+        """Whether verification for email is refused right now"""
+        entry = self._scores.get(email)
+        if entry is None or not self.threshold:
+            return False
+        with self._lock:
+            return self._decayed(entry, time.time() if now is None else now) >= self.threshold * SCORE_SCALE
+
+    def record_failure(self, email, now=None):
+        """Count a wrong guess, returning True when it locks the email out"""
+        if not self.threshold:
+            return False
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._scores.get(email)
+            if entry is None:
+                entry = self._scores[email] = FailureScore(now)
+                if len(self._scores) > self.max_keys:
+                    self._scores.popitem(last=False)
+            else:
+                self._scores.move_to_end(email)
+            score = entry.score = self._decayed(entry, now) + SCORE_SCALE
+            entry.updated = now
+            limit = self.threshold * SCORE_SCALE
+            if score >= limit > score - SCORE_SCALE:
+                self.lockouts += 1
+                return True
+            return False
+
+    def clear(self, email):
+        """Forget the failures of an email after it verified"""
+        if self._scores:
+            with self._lock:
+                self._scores.pop(email, None)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'tracked': len(self._scores),
+                'lockouts': self.lockouts,
+            }